@@ -1,7 +1,10 @@
+import bisect
 import sys
 import sqlite3
-import csv
 import json
+import threading
+import time
+from array import array
 from pathlib import Path
 from datetime import datetime
 
@@ -10,58 +13,29 @@ from PySide6.QtWidgets import (
     QPushButton, QTableWidget, QTableWidgetItem, QLabel, QDialog,
     QLineEdit, QRadioButton, QButtonGroup, QFormLayout, QMessageBox,
     QHeaderView, QDateEdit, QSpacerItem, QSizePolicy, QStackedWidget,
-    QFileDialog
+    QFileDialog, QTableView, QListWidget, QListWidgetItem, QComboBox
 )
-from PySide6.QtCore import Qt, QDate, QSize, QPoint
-from PySide6.QtGui import QFont, QKeySequence, QShortcut
-
-# PDF generation imports
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT, TA_CENTER
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
-# Application data paths
-APP_DIR = Path.home() / ".daftar_accounts"
-DB_PATH = APP_DIR / "accounts.db"
-CONFIG_PATH = APP_DIR / "config.json"
-APP_DIR.mkdir(exist_ok=True)
-
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            customer_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            description TEXT NOT NULL,
-            amount REAL NOT NULL,
-            kind TEXT NOT NULL,
-            FOREIGN KEY(customer_id) REFERENCES customers(id)
-        )
-    """)
-    conn.commit()
-    return conn
-
+from PySide6.QtCore import (
+    Qt, QDate, QSize, QPoint, QPointF, QObject, QRunnable, QThreadPool, QTimer, Signal, QEvent,
+    QAbstractTableModel, QModelIndex, QBuffer, QByteArray, QIODevice
+)
+from PySide6.QtGui import QKeySequence, QShortcut, QIcon, QPixmap
 
-def format_amount(amount):
-    # format with thousands separator and two decimals, keep parentheses for negative
-    if amount >= 0:
-        return f"{amount:,.2f}"
-    else:
-        return f"({abs(amount):,.2f})"
+from ledger import (
+    CONFIG_PATH, DB_PATH, KIND_PURCHASE, KIND_PAYMENT, ValidationError,
+    CUSTOMERS_BATCH_QUERY, CUSTOMERS_SEARCH_BATCH_QUERY, CUSTOMER_ROW_QUERY, CUSTOMER_NAME_QUERY,
+    HAS_TRANSACTIONS_QUERY,
+    init_db, database_path, format_amount, validate_transaction, write_statement_csv
+)
+from undo_journal import UndoJournal
+from changes import ChangeBus, Change, LEDGER_CHANGED
+from page_cache import PageCache, LOW_MEMORY_MAX_BYTES, fetch_customer_page
+import bulk_posting
+import maintenance
+import statement_pdf
+import theme
+import workspaces
+from theme import ARABIC_FONT, UI_FONT
 
 
 from PySide6.QtWidgets import QMessageBox
@@ -75,31 +49,7 @@ def styled_message_box(parent, title, text, icon=QMessageBox.Information,buttons
     if default_button != QMessageBox.NoButton:
         mb.setDefaultButton(default_button)
 
-    mb.setStyleSheet("""
-        QMessageBox {
-            background-color: #ffffff;
-            color: #1e272e;
-            font-family: 'Noto Naskh Arabic', 'Amiri', 'Sans';
-            font-size: 14pt;
-        }
-        QMessageBox QLabel {
-            color: #1e272e;
-            font-size: 14pt;
-            font-weight: bold;
-        }
-        QMessageBox QPushButton {
-            min-width: 110px;
-            min-height: 36px;
-            padding: 8px 14px;
-            border-radius: 8px;
-            font-size: 13pt;
-            font-weight: bold;
-        }
-        QPushButton#yesBtn    { background-color: #27ae60; color: white; }
-        QPushButton#noBtn     { background-color: #e74c3c; color: white; }
-        QPushButton#okBtn     { background-color: #3498db; color: white; }
-        QPushButton#cancelBtn { background-color: #95a5a6; color: white; }
-    """)
+    # Styled by the application stylesheet (theme.py)
 
     btn_map = {}
     if buttons & QMessageBox.Yes:
@@ -132,26 +82,26 @@ class TextInputDialog(QDialog):
         self.setWindowTitle(title)
         self.setModal(True)
         self.resize(420, 180)
+        self.setObjectName("textInputDialog")
 
         layout = QVBoxLayout(self)
         header = QLabel(title)
+        header.setObjectName("dialogHeader")
         header.setAlignment(Qt.AlignCenter)
-        header.setStyleSheet("background-color:#3498db; color:white; padding:8px;")
-        header.setFont(QFont("Sans", 14, QFont.Bold))
+        header.setFont(theme.font(UI_FONT, 14))
         layout.addWidget(header)
 
         form = QVBoxLayout()
         lbl = QLabel(label_text)
         lbl.setAlignment(Qt.AlignRight)
-        lbl.setFont(QFont("Sans", 12))
+        lbl.setFont(theme.font(UI_FONT, 12, bold=False))
         form.addWidget(lbl)
 
         self.edit = QLineEdit()
         self.edit.setLayoutDirection(Qt.RightToLeft)
         self.edit.setAlignment(Qt.AlignRight)
         self.edit.setText(initial_text)
-        self.edit.setFont(QFont("Sans", 13, QFont.Bold))
-        self.edit.setStyleSheet("padding:6px;")
+        self.edit.setFont(theme.font(UI_FONT, 13))
         form.addWidget(self.edit)
         layout.addLayout(form)
 
@@ -183,21 +133,15 @@ class TransactionDialog(QDialog):
         self.setWindowTitle("إضافة عملية جديدة")
         self.setModal(True)
         self.resize(650, 550)
+        self.setObjectName("transactionDialog")
 
         main_layout = QVBoxLayout(self)
         main_layout.setSpacing(20)
         main_layout.setContentsMargins(30, 30, 30, 30)
 
         header = QLabel("إضافة عملية جديدة")
+        header.setObjectName("dialogHeader")
         header.setAlignment(Qt.AlignCenter)
-        header.setStyleSheet("""
-            background-color:#3498db; 
-            color:white; 
-            padding:20px; 
-            border-radius:12px;
-            font-size:28pt;
-            font-weight:bold;
-        """)
         main_layout.addWidget(header)
 
         form_widget = QWidget()
@@ -207,16 +151,13 @@ class TransactionDialog(QDialog):
         form_layout.setContentsMargins(20, 20, 20, 20)
 
         kind_label = QLabel("نوع العملية:")
-        kind_label.setStyleSheet("font-size:22pt; font-weight:bold; color:#2c3e50;")
+        kind_label.setObjectName("kindLabel")
 
         self.kind_group = QButtonGroup(self)
         buy_radio = QRadioButton("شراء (يزيد على الحساب)")
         pay_radio = QRadioButton("دفع (ينقص من الحساب)")
         buy_radio.setChecked(True)
 
-        for r in (buy_radio, pay_radio):
-            r.setStyleSheet("font-size:22pt; font-weight:bold; color:#2c3e50;")
-
         self.kind_group.addButton(buy_radio, 1)
         self.kind_group.addButton(pay_radio, 2)
 
@@ -226,25 +167,16 @@ class TransactionDialog(QDialog):
         form_layout.addRow(kind_label, kind_box)
 
         self.desc_edit = QLineEdit()
-        self.desc_edit.setStyleSheet(
-            "padding:18px; font-size:22pt; font-weight:bold; border:3px solid #bdc3c7; border-radius:12px;"
-        )
         form_layout.addRow(QLabel("البيان:"), self.desc_edit)
 
         self.amount_edit = QLineEdit()
         self.amount_edit.setPlaceholderText("0.00")
-        self.amount_edit.setStyleSheet(
-            "padding:18px; font-size:22pt; font-weight:bold; border:3px solid #bdc3c7; border-radius:12px;"
-        )
         form_layout.addRow(QLabel("المبلغ:"), self.amount_edit)
 
         self.date_edit = QDateEdit()
         self.date_edit.setDisplayFormat("yyyy-MM-dd")
         self.date_edit.setDate(QDate.currentDate())
         self.date_edit.setCalendarPopup(True)
-        self.date_edit.setStyleSheet(
-            "padding:18px; font-size:22pt; font-weight:bold; border:3px solid #bdc3c7; border-radius:12px;"
-        )
         form_layout.addRow(QLabel("التاريخ:"), self.date_edit)
 
         main_layout.addWidget(form_widget)
@@ -254,12 +186,10 @@ class TransactionDialog(QDialog):
 
         save_btn = QPushButton("حفظ العملية")
         save_btn.setObjectName("saveBtn")
-        save_btn.setStyleSheet("font-size:24pt; padding:20px 60px; min-width:220px;")
         save_btn.clicked.connect(self.accept)
 
         cancel_btn = QPushButton("إلغاء")
         cancel_btn.setObjectName("cancelBtn")
-        cancel_btn.setStyleSheet("font-size:24pt; padding:20px 60px; min-width:220px;")
         cancel_btn.clicked.connect(self.reject)
 
         btn_layout.addWidget(cancel_btn)
@@ -269,7 +199,6 @@ class TransactionDialog(QDialog):
         # Enter To save Transaction
         self.desc_edit.returnPressed.connect(self.accept)
         self.amount_edit.returnPressed.connect(self.accept)
-        self.date_edit.returnPressed.connect(self.accept)
 
         # Escape to cancel
         QShortcut(QKeySequence("Escape"), self, activated=self.reject)
@@ -278,26 +207,19 @@ class TransactionDialog(QDialog):
         if self.exec() != QDialog.Accepted:
             return None
 
-        desc = self.desc_edit.text().strip()
-        amount_str = self.amount_edit.text().strip()
+        desc = self.desc_edit.text()
+        amount_str = self.amount_edit.text()
         date_str = self.date_edit.date().toString("yyyy-MM-dd")
-
-        if not desc or not amount_str:
-            styled_message_box(self, "تنبيه", "الرجاء ملء البيان والمبلغ",icon=QMessageBox.Warning, buttons=QMessageBox.Ok)
-            return None
+        kind = KIND_PURCHASE if self.kind_group.checkedId() == 1 else KIND_PAYMENT
 
         try:
-            amount = float(amount_str.replace(",", "."))
-            if amount <= 0:
-                raise ValueError
-        except ValueError:
-            styled_message_box(self, "خطأ", "المبلغ يجب أن يكون رقماً أكبر من صفر",icon=QMessageBox.Critical, buttons=QMessageBox.Ok)
+            return validate_transaction(desc, amount_str, date_str, kind)
+        except ValidationError as e:
+            if e.critical:
+                styled_message_box(self, "خطأ", str(e), icon=QMessageBox.Critical, buttons=QMessageBox.Ok)
+            else:
+                styled_message_box(self, "تنبيه", str(e), icon=QMessageBox.Warning, buttons=QMessageBox.Ok)
             return None
-
-        kind_id = self.kind_group.checkedId()
-        kind = "شراء" if kind_id == 1 else "دفع"
-        signed_amount = amount if kind == "شراء" else -amount
-        return date_str, desc, signed_amount, kind
     
     def keyPressEvent(self, event):
         if event.key() in (Qt.Key_Return, Qt.Key_Enter):
@@ -312,13 +234,827 @@ class TransactionDialog(QDialog):
 
 
 
+class LedgerReportDialog(QDialog):
+    # Whole-ledger debt report computed by the NumPy analytics engine
+    def __init__(self, conn, engine, top=100):
+        super().__init__()
+        import analytics
+
+        self.setWindowTitle("تقرير الديون")
+        self.setModal(True)
+        self.resize(900, 650)
+        self.setObjectName("reportDialog")
+
+        ids, balances = engine.balances()
+        aging_ids, aging = engine.aging()
+        names = dict(conn.execute("SELECT id, name FROM customers"))
+
+        owing = balances > 0
+        receivables = analytics.to_money(int(balances[owing].sum()))
+
+        layout = QVBoxLayout(self)
+        header = QLabel(f"إجمالي المستحق: {format_amount(receivables)} جنيه — عدد المدينين: {int(owing.sum())}")
+        header.setObjectName("dialogHeader")
+        header.setAlignment(Qt.AlignCenter)
+        header.setFont(theme.font(UI_FONT, 14))
+        layout.addWidget(header)
+
+        table = QTableWidget()
+        table.setColumnCount(6)
+        table.setHorizontalHeaderLabels(["الاسم", "الرصيد", "حتى 30 يوم", "31-60", "61-90", "أكثر من 90"])
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setAlternatingRowColors(True)
+        table.verticalHeader().setVisible(False)
+        theme.set_column_delegates(table, {col: (table.font(), Qt.AlignCenter) for col in range(1, 6)})
+
+        top_rows = analytics.np.argsort(-balances)[:top]
+        top_rows = top_rows[balances[top_rows] > 0]
+        table.setRowCount(len(top_rows))
+        for row_idx, i in enumerate(top_rows):
+            cid = int(ids[i])
+            values = [analytics.to_money(int(balances[i]))]
+            values += [analytics.to_money(int(v)) for v in aging[i]]
+            table.setItem(row_idx, 0, QTableWidgetItem(names.get(cid, str(cid))))
+            for col, v in enumerate(values, start=1):
+                table.setItem(row_idx, col, QTableWidgetItem(format_amount(v)))
+        layout.addWidget(table)
+
+        close_btn = QPushButton("إغلاق")
+        close_btn.setObjectName("cancelBtn")
+        close_btn.clicked.connect(self.accept)
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+
+class ConsolidatedReportDialog(QDialog):
+    # Receivables of every ledger in the workspace (one per branch)
+    def __init__(self, report):
+        super().__init__()
+        self.setWindowTitle("تقرير الفروع")
+        self.setModal(True)
+        self.resize(900, 650)
+        self.setObjectName("reportDialog")
+
+        layout = QVBoxLayout(self)
+        header = QLabel(f"إجمالي المستحق في كل الفروع: {format_amount(report.receivables)} جنيه — "
+                        f"عدد المدينين: {report.debtors}")
+        header.setObjectName("dialogHeader")
+        header.setAlignment(Qt.AlignCenter)
+        header.setFont(theme.font(UI_FONT, 14))
+        layout.addWidget(header)
+        if report.missing:
+            missing = QLabel("دفاتر غير موجودة: " + "، ".join(report.missing))
+            missing.setFont(theme.font(UI_FONT, 12))
+            layout.addWidget(missing)
+
+        layout.addWidget(self._table(["الفرع", "عدد المدينين", "المستحق"], [
+            (name, str(debtors), format_amount(receivables)) for name, debtors, receivables in report.ledgers
+        ]), 1)
+        top_label = QLabel("أكبر المدينين")
+        top_label.setObjectName("listTitle")
+        top_label.setFont(theme.font(UI_FONT, 14))
+        layout.addWidget(top_label)
+        layout.addWidget(self._table(["الاسم", "الفرع", "الرصيد"], [
+            (name, ledger, format_amount(total)) for ledger, name, total in report.top
+        ]), 2)
+
+        close_btn = QPushButton("إغلاق")
+        close_btn.setObjectName("cancelBtn")
+        close_btn.clicked.connect(self.accept)
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+    def _table(self, headers, rows):
+        table = QTableWidget()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setAlternatingRowColors(True)
+        table.verticalHeader().setVisible(False)
+        theme.set_column_delegates(table, {col: (table.font(), Qt.AlignCenter) for col in range(1, len(headers))})
+        table.setRowCount(len(rows))
+        for row_idx, values in enumerate(rows):
+            for col, value in enumerate(values):
+                table.setItem(row_idx, col, QTableWidgetItem(value))
+        return table
+
+
+class BulkPostDialog(QDialog):
+    # Posts one transaction to every customer of a set, previewed before it is applied
+    def __init__(self, conn, journal, search=""):
+        super().__init__()
+        self.conn = conn
+        self.journal = journal
+        self.posted = 0
+        self.setWindowTitle("ترحيل جماعي")
+        self.setModal(True)
+        self.resize(900, 750)
+
+        layout = QVBoxLayout(self)
+        header = QLabel("ترحيل عملية لمجموعة زبائن")
+        header.setObjectName("dialogHeader")
+        header.setAlignment(Qt.AlignCenter)
+        header.setFont(theme.font(UI_FONT, 14))
+        layout.addWidget(header)
+
+        form = QFormLayout()
+        form.setLabelAlignment(Qt.AlignRight)
+
+        self.target_group = QButtonGroup(self)
+        all_radio = QRadioButton("كل الزبائن")
+        search_radio = QRadioButton(f"نتيجة البحث: {search}" if search else "نتيجة البحث")
+        search_radio.setEnabled(bool(search))
+        (search_radio if search else all_radio).setChecked(True)
+        self.target_group.addButton(all_radio, 1)
+        self.target_group.addButton(search_radio, 2)
+        self.search = search
+        target_box = QHBoxLayout()
+        target_box.addWidget(all_radio)
+        target_box.addWidget(search_radio)
+        form.addRow(QLabel("الزبائن:"), target_box)
+
+        self.min_edit = QLineEdit()
+        self.min_edit.setPlaceholderText("بدون حد")
+        self.max_edit = QLineEdit()
+        self.max_edit.setPlaceholderText("بدون حد")
+        balance_box = QHBoxLayout()
+        balance_box.addWidget(self.min_edit)
+        balance_box.addWidget(QLabel("إلى"))
+        balance_box.addWidget(self.max_edit)
+        form.addRow(QLabel("الرصيد من:"), balance_box)
+
+        self.kind_group = QButtonGroup(self)
+        buy_radio = QRadioButton("شراء")
+        pay_radio = QRadioButton("دفع")
+        buy_radio.setChecked(True)
+        self.kind_group.addButton(buy_radio, 1)
+        self.kind_group.addButton(pay_radio, 2)
+        kind_box = QHBoxLayout()
+        kind_box.addWidget(buy_radio)
+        kind_box.addWidget(pay_radio)
+        form.addRow(QLabel("نوع العملية:"), kind_box)
+
+        self.rule_group = QButtonGroup(self)
+        fixed_radio = QRadioButton("مبلغ ثابت")
+        percent_radio = QRadioButton("نسبة % من الرصيد")
+        fixed_radio.setChecked(True)
+        self.rule_group.addButton(fixed_radio, 1)
+        self.rule_group.addButton(percent_radio, 2)
+        rule_box = QHBoxLayout()
+        rule_box.addWidget(fixed_radio)
+        rule_box.addWidget(percent_radio)
+        form.addRow(QLabel("القاعدة:"), rule_box)
+
+        self.value_edit = QLineEdit()
+        self.value_edit.setPlaceholderText("0.00")
+        form.addRow(QLabel("القيمة:"), self.value_edit)
+
+        self.desc_edit = QLineEdit()
+        form.addRow(QLabel("البيان:"), self.desc_edit)
+
+        self.date_edit = QDateEdit()
+        self.date_edit.setDisplayFormat("yyyy-MM-dd")
+        self.date_edit.setDate(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        form.addRow(QLabel("التاريخ:"), self.date_edit)
+        layout.addLayout(form)
+
+        self.summary_label = QLabel("اضغط معاينة لعرض الزبائن المتأثرين")
+        self.summary_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.summary_label)
+
+        self.preview_table = QTableWidget()
+        self.preview_table.setColumnCount(2)
+        self.preview_table.setHorizontalHeaderLabels(["الاسم", "المبلغ (جنيه)"])
+        self.preview_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.preview_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.preview_table.verticalHeader().setVisible(False)
+        theme.set_column_delegates(self.preview_table, {1: (self.preview_table.font(), Qt.AlignCenter)})
+        layout.addWidget(self.preview_table)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        preview_btn = QPushButton("معاينة")
+        preview_btn.setObjectName("renameBtn")
+        preview_btn.clicked.connect(self.show_preview)
+        post_btn = QPushButton("ترحيل")
+        post_btn.setObjectName("saveBtn")
+        post_btn.clicked.connect(self.apply_posting)
+        cancel_btn = QPushButton("إلغاء")
+        cancel_btn.setObjectName("cancelBtn")
+        cancel_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(cancel_btn)
+        btn_layout.addWidget(preview_btn)
+        btn_layout.addWidget(post_btn)
+        layout.addLayout(btn_layout)
+
+    def read_form(self):
+        # Returns (selection, rule, value, date, description, kind) or None after telling the user why
+        rule = bulk_posting.RULE_FIXED if self.rule_group.checkedId() == 1 else bulk_posting.RULE_PERCENT
+        kind = KIND_PURCHASE if self.kind_group.checkedId() == 1 else KIND_PAYMENT
+        try:
+            date_str, desc, value, kind = bulk_posting.validate_bulk(
+                self.desc_edit.text(), self.value_edit.text(),
+                self.date_edit.date().toString("yyyy-MM-dd"), kind, rule)
+            selection = bulk_posting.customer_selection(
+                self.search if self.target_group.checkedId() == 2 else None,
+                bulk_posting.parse_balance(self.min_edit.text()),
+                bulk_posting.parse_balance(self.max_edit.text()))
+        except ValidationError as e:
+            styled_message_box(self, "خطأ" if e.critical else "تنبيه", str(e),
+                               QMessageBox.Critical if e.critical else QMessageBox.Warning)
+            return None
+        return selection, rule, value, date_str, desc, kind
+
+    def show_preview(self):
+        form = self.read_form()
+        if form is None:
+            return None
+        selection, rule, value = form[:3]
+        count, total, sample = bulk_posting.preview(self.conn, selection, rule, value)
+        self.summary_label.setText(f"عدد العمليات: {count} — الإجمالي: {format_amount(total)} جنيه")
+        self.preview_table.setRowCount(len(sample))
+        for row_idx, (name, amount) in enumerate(sample):
+            self.preview_table.setItem(row_idx, 0, QTableWidgetItem(name))
+            self.preview_table.setItem(row_idx, 1, QTableWidgetItem(format_amount(amount)))
+        return form, count, total
+
+    def apply_posting(self):
+        result = self.show_preview()
+        if result is None:
+            return
+        form, count, total = result
+        if count == 0:
+            styled_message_box(self, "تنبيه", "لا يوجد زبائن مطابقون", QMessageBox.Warning)
+            return
+        res, _ = styled_message_box(
+            self, "تأكيد", f"ترحيل {count} عملية بإجمالي {format_amount(total)} جنيه؟",
+            icon=QMessageBox.Question,
+            buttons=QMessageBox.Yes | QMessageBox.No,
+            default_button=QMessageBox.No
+        )
+        if res != QMessageBox.Yes:
+            return
+        try:
+            self.posted = bulk_posting.post(self.conn, self.journal, *form)
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل الترحيل:\n{str(e)}", QMessageBox.Critical)
+            return
+        self.accept()
+
+
+class DiagnosticsDialog(QDialog):
+    # Database health and the history of the background maintenance. Everything
+    # shown is read cheaply; running the maintenance (which measures the
+    # fragmentation) happens on a MaintenanceRunner in `pool`.
+    def __init__(self, conn, pool):
+        super().__init__()
+        self.conn = conn
+        self.pool = pool
+        # Raised when the dialog closes, so a run started here stops with it
+        self.stop = threading.Event()
+        self.setWindowTitle("صحة قاعدة البيانات")
+        self.setModal(True)
+        self.resize(900, 650)
+
+        layout = QVBoxLayout(self)
+        header = QLabel("صحة قاعدة البيانات")
+        header.setObjectName("dialogHeader")
+        header.setAlignment(Qt.AlignCenter)
+        header.setFont(theme.font(UI_FONT, 14))
+        layout.addWidget(header)
+
+        self.health_label = QLabel()
+        self.health_label.setAlignment(Qt.AlignRight)
+        layout.addWidget(self.health_label)
+
+        self.log_table = QTableWidget()
+        self.log_table.setColumnCount(5)
+        self.log_table.setHorizontalHeaderLabels(["المهمة", "الوقت", "المدة (ms)", "الحالة", "التفاصيل"])
+        self.log_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Stretch)
+        self.log_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.log_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.log_table)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        self.run_btn = QPushButton("تشغيل الصيانة الآن")
+        self.run_btn.setObjectName("renameBtn")
+        self.run_btn.clicked.connect(self.run_now)
+        close_btn = QPushButton("إغلاق")
+        close_btn.setObjectName("cancelBtn")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(close_btn)
+        btn_layout.addWidget(self.run_btn)
+        layout.addLayout(btn_layout)
+        self.refresh()
+
+    def refresh(self):
+        info = maintenance.health(self.conn)
+        if info["fragmentation_measured"] is None:
+            fragmentation = "لم تُقَس بعد"
+        elif info["fragmentation"] is None:
+            fragmentation = "غير متاح"
+        else:
+            measured = time.strftime("%Y-%m-%d %H:%M", time.localtime(info["fragmentation_measured"]))
+            fragmentation = f"{info['fragmentation']:.1%} (قيست {measured})"
+        due = maintenance.due_tasks(self.conn)
+        self.health_label.setText(
+            f"حجم الملف: {info['file_bytes'] / 1024 / 1024:,.1f} MB — WAL: {info['wal_bytes'] / 1024 / 1024:,.1f} MB\n"
+            f"صفحات فارغة: {info['free_pages']:,} من {info['page_count']:,} ({info['free_ratio']:.1%})"
+            f" — التجزئة: {fragmentation}\n"
+            f"مهام مستحقة: {', '.join(due) if due else 'لا يوجد'}"
+        )
+        rows = maintenance.recent_log(self.conn)
+        self.log_table.setRowCount(len(rows))
+        for row_idx, (task, started, ms, status, detail) in enumerate(rows):
+            values = (task, time.strftime("%Y-%m-%d %H:%M", time.localtime(started)),
+                      f"{ms:,.1f}", status, detail or "")
+            for col, v in enumerate(values):
+                self.log_table.setItem(row_idx, col, QTableWidgetItem(v))
+
+    def run_now(self):
+        db_path = database_path(self.conn)
+        if not db_path:
+            return
+        self.run_btn.setEnabled(False)
+        self.run_btn.setText("جارٍ التشغيل...")
+        # An infinite "now" skips the intervals but keeps each task's own condition
+        task = MaintenanceRunner(db_path, self.stop, now=float("inf"))
+        task.signals.done.connect(self.on_run_done)
+        self.pool.start(task)
+
+    def on_run_done(self, results):
+        self.run_btn.setEnabled(True)
+        self.run_btn.setText("تشغيل الصيانة الآن")
+        self.refresh()
+
+    def done(self, result):
+        self.stop.set()
+        super().done(result)
+
+
+class IdleWatcher(QObject):
+    # Application-wide event filter: tracks the last user input and raises `pause` on it
+    INPUT_EVENTS = frozenset((QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove,
+                              QEvent.Wheel, QEvent.TouchBegin))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.last_input = time.monotonic()
+        self.pause = threading.Event()
+
+    def eventFilter(self, obj, event):
+        if event.type() in self.INPUT_EVENTS:
+            self.last_input = time.monotonic()
+            self.pause.set()
+        return False
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_input
+
+
+class MaintenanceSignals(QObject):
+    done = Signal(object)
+
+
+class MaintenanceRunner(QRunnable):
+    # Runs the due maintenance tasks on its own connection until `pause` is raised
+    def __init__(self, db_path, pause, now=None):
+        super().__init__()
+        self.db_path = db_path
+        self.pause = pause
+        self.now = now
+        self.signals = MaintenanceSignals()
+
+    def run(self):
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=1)
+            try:
+                results = maintenance.run_due(conn, self.pause.is_set, self.now)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            results = []
+        self.signals.done.emit(results)
+
+
+# Customers read from the database per batch of the customer list, and rows
+# measured when sizing the fitted columns of the customer and account tables
+CUSTOMER_BATCH_ROWS = 500
+RESIZE_PRECISION = 100
+
+
+class CustomerListModel(QAbstractTableModel):
+    # The customer list as compact columns instead of two item objects per customer:
+    # ids and totals in typed arrays, names as one UTF-8 buffer with offsets.
+    # Cells are decoded and formatted only when they are painted, and rows are
+    # fetched one batch at a time as the view scrolls towards the end.
+    HEADERS = ("الاسم", "الإجمالي (جنيه)")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.conn = None
+        self.search = ""
+        self.exhausted = True
+        self.ids = array("q")
+        self.totals = array("d")
+        self.name_bytes = bytearray()
+        self.name_offsets = array("q", [0])
+
+    def reset(self, conn, search=""):
+        self.beginResetModel()
+        self.conn, self.search, self.exhausted = conn, search, False
+        self.ids, self.totals, self.name_bytes, self.name_offsets = array("q"), array("d"), bytearray(), array("q", [0])
+        self._append(self._next_batch())
+        self.endResetModel()
+
+    def _next_batch(self):
+        before = self.ids[-1] if self.ids else sys.maxsize
+        if self.search:
+            rows = self.conn.execute(CUSTOMERS_SEARCH_BATCH_QUERY,
+                                     (f"%{self.search}%", before, CUSTOMER_BATCH_ROWS)).fetchall()
+        else:
+            rows = self.conn.execute(CUSTOMERS_BATCH_QUERY, (before, CUSTOMER_BATCH_ROWS)).fetchall()
+        if len(rows) < CUSTOMER_BATCH_ROWS:
+            self.exhausted = True
+        return rows
+
+    def _append(self, rows):
+        for cid, name, total in rows:
+            self.ids.append(cid)
+            self.totals.append(total)
+            self.name_bytes += name.encode("utf-8")
+            self.name_offsets.append(len(self.name_bytes))
+
+    def refresh_customers(self, cids):
+        # Re-reads only these customers: rows are updated, removed or inserted in place
+        for cid in cids:
+            fresh = self.conn.execute(CUSTOMER_ROW_QUERY, (cid, f"%{self.search}%")).fetchone()
+            # ids are in descending order
+            row = bisect.bisect_left(self.ids, -cid, key=lambda i: -i)
+            loaded = row < len(self.ids) and self.ids[row] == cid
+            if loaded and fresh is None:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.ids[row]
+                del self.totals[row]
+                self._replace_name(row, None)
+                self.endRemoveRows()
+            elif loaded:
+                self.totals[row] = fresh[2]
+                self._replace_name(row, fresh[1])
+                self.dataChanged.emit(self.index(row, 0), self.index(row, 1))
+            elif fresh is not None and (row < len(self.ids) or self.exhausted):
+                # Rows past the loaded batches are read when the list scrolls there
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.ids.insert(row, cid)
+                self.totals.insert(row, fresh[2])
+                self.name_offsets.insert(row + 1, self.name_offsets[row])
+                self._replace_name(row, fresh[1])
+                self.endInsertRows()
+
+    def _replace_name(self, row, name):
+        # None removes the row's name and its offset
+        start, end = self.name_offsets[row], self.name_offsets[row + 1]
+        data = name.encode("utf-8") if name is not None else b""
+        self.name_bytes[start:end] = data
+        delta = len(data) - (end - start)
+        if name is None:
+            del self.name_offsets[row + 1]
+        if delta:
+            self.name_offsets[row + 1:] = array("q", (o + delta for o in self.name_offsets[row + 1:]))
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        rows = self._next_batch()
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.ids), len(self.ids) + len(rows) - 1)
+            self._append(rows)
+            self.endInsertRows()
+
+    def name(self, row):
+        return self.name_bytes[self.name_offsets[row]:self.name_offsets[row + 1]].decode("utf-8")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            row = index.row()
+            return self.name(row) if index.column() == 0 else format_amount(self.totals[row])
+        if role == Qt.UserRole:
+            return self.ids[index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+
+class TransactionsModel(QAbstractTableModel):
+    # Shows a cached CustomerPage as it is: cells are read from its columns when
+    # they are painted, so opening an account creates no per-row objects
+    HEADERS = ("التاريخ", "البيان", "المبلغ (جنيه)", "النوع")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.page = None
+
+    def set_page(self, page):
+        self.beginResetModel()
+        self.page = page
+        self.endResetModel()
+
+    def transaction_id(self, row):
+        return self.page.ids[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.page is None else len(self.page)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            row, column = index.row(), index.column()
+            if column == 0:
+                return self.page.date(row)
+            if column == 1:
+                return self.page.description(row)
+            if column == 2:
+                return self.page.amount_text(row)
+            return self.page.kind(row)
+        if role == Qt.UserRole:
+            return self.page.ids[index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+
+class PrefetchSignals(QObject):
+    done = Signal(object, int)
+
+
+class PagePrefetcher(QRunnable):
+    # Loads a customer page on a worker thread with its own connection
+    def __init__(self, db_path, cid, epoch):
+        super().__init__()
+        self.db_path = db_path
+        self.cid = cid
+        self.epoch = epoch
+        self.signals = PrefetchSignals()
+
+    def run(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                page = fetch_customer_page(conn, self.cid)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return
+        if page is not None:
+            self.signals.done.emit(page, self.epoch)
+
+
+class StatementSignals(QObject):
+    built = Signal(object, object, object, int)
+    page = Signal(object, int, object)
+    failed = Signal(object, str)
+    finished = Signal(object)
+
+
+class StatementRenderer(QRunnable):
+    # Builds a statement PDF on its own connection, then renders its page thumbnails
+    # one by one so the preview fills in while the rest is still being drawn
+    def __init__(self, db_path, statement, cancel):
+        super().__init__()
+        self.db_path = db_path
+        self.statement = statement
+        self.cid = statement.key[0]
+        # Whatever is already cached is not rendered again
+        self.pdf = statement.pdf
+        self.first_page = len(statement.thumbnails)
+        self.cancel = cancel
+        self.signals = StatementSignals()
+
+    def run(self):
+        try:
+            key, pdf = self.statement.key, self.pdf
+            if pdf is None:
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    key, pdf = statement_pdf.build_statement(conn, self.cid)
+                finally:
+                    conn.close()
+            from PySide6.QtPdf import QPdfDocument
+            buffer = QBuffer()
+            buffer.setData(QByteArray(pdf))
+            buffer.open(QIODevice.ReadOnly)
+            document = QPdfDocument()
+            document.load(buffer)
+            if self.pdf is None:
+                self.signals.built.emit(self.statement, key, pdf, document.pageCount())
+            for page in range(self.first_page, document.pageCount()):
+                if self.cancel.is_set():
+                    break
+                size = document.pagePointSize(page)
+                thumb = QSize(STATEMENT_THUMB_WIDTH, round(STATEMENT_THUMB_WIDTH * size.height() / size.width()))
+                self.signals.page.emit(self.statement, page, document.render(page, thumb))
+            document.close()
+        except Exception as e:
+            self.signals.failed.emit(self.statement, str(e))
+        finally:
+            self.signals.finished.emit(self.statement)
+
+
+class StatementPreviewDialog(QDialog):
+    # Shows a cached or still-rendering statement; saving writes the cached PDF bytes
+    def __init__(self, statement, parent=None):
+        super().__init__(parent)
+        from PySide6.QtPdf import QPdfDocument
+        from PySide6.QtPdfWidgets import QPdfView
+
+        self.statement = statement
+        self.customer_name = statement.key[1]
+        self.setWindowTitle("معاينة كشف الحساب")
+        self.setObjectName("reportDialog")
+        self.setLayoutDirection(Qt.RightToLeft)
+        self.resize(1000, 760)
+        layout = QVBoxLayout(self)
+
+        header = QLabel(f"كشف حساب {self.customer_name}")
+        header.setObjectName("dialogHeader")
+        header.setAlignment(Qt.AlignCenter)
+        header.setFont(theme.font(ARABIC_FONT, 16))
+        layout.addWidget(header)
+
+        self.status_label = QLabel("جاري تجهيز كشف الحساب...")
+        self.status_label.setFont(theme.font(UI_FONT, 12))
+        layout.addWidget(self.status_label)
+
+        body = QHBoxLayout()
+        self.thumbnails = QListWidget()
+        # One column of pages, each labelled under its thumbnail
+        self.thumbnails.setViewMode(QListWidget.IconMode)
+        self.thumbnails.setFlow(QListWidget.TopToBottom)
+        self.thumbnails.setWrapping(False)
+        self.thumbnails.setMovement(QListWidget.Static)
+        self.thumbnails.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        thumb_height = round(STATEMENT_THUMB_WIDTH * 1.42)
+        self.thumbnails.setIconSize(QSize(STATEMENT_THUMB_WIDTH, thumb_height))
+        # A fixed grid keeps the layout stable while thumbnails arrive
+        self.thumbnails.setGridSize(QSize(STATEMENT_THUMB_WIDTH + 20, thumb_height + 40))
+        self.thumbnails.setFixedWidth(STATEMENT_THUMB_WIDTH + 50)
+        self.thumbnails.setFont(theme.font(UI_FONT, 11))
+        self.thumbnails.currentRowChanged.connect(self.jump_to_page)
+        body.addWidget(self.thumbnails)
+
+        self.document = QPdfDocument(self)
+        self.buffer = None
+        self.view = QPdfView()
+        self.view.setDocument(self.document)
+        self.view.setPageMode(QPdfView.PageMode.MultiPage)
+        self.view.setZoomMode(QPdfView.ZoomMode.FitToWidth)
+        self.view.setLayoutDirection(Qt.LeftToRight)
+        body.addWidget(self.view, 1)
+        layout.addLayout(body, 1)
+
+        buttons = QHBoxLayout()
+        self.btn_save = QPushButton("حفظ PDF 💾")
+        self.btn_save.setObjectName("saveBtn")
+        self.btn_save.setEnabled(False)
+        self.btn_save.clicked.connect(self.save)
+        btn_close = QPushButton("إغلاق")
+        btn_close.setObjectName("cancelBtn")
+        btn_close.clicked.connect(self.reject)
+        buttons.addWidget(self.btn_save)
+        buttons.addWidget(btn_close)
+        layout.addLayout(buttons)
+
+        if statement.pdf is not None:
+            self.show_pdf()
+            for page, image in enumerate(statement.thumbnails):
+                self.set_thumbnail(page, image)
+
+    def show_pdf(self):
+        self.buffer = QBuffer(self)
+        self.buffer.setData(QByteArray(self.statement.pdf))
+        self.buffer.open(QIODevice.ReadOnly)
+        self.document.load(self.buffer)
+        for page in range(self.statement.page_count):
+            self.thumbnails.addItem(QListWidgetItem(f"صفحة {page + 1}"))
+        self.btn_save.setEnabled(True)
+        self.update_status()
+
+    def set_thumbnail(self, page, image):
+        item = self.thumbnails.item(page)
+        if item is not None:
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+        self.update_status()
+
+    def update_status(self):
+        count, done = self.statement.page_count, len(self.statement.thumbnails)
+        self.status_label.setText(f"{count} صفحة" if done >= count else f"جاري تجهيز الصفحات {done}/{count}")
+
+    def show_error(self, message):
+        self.status_label.setText("فشل في إنشاء كشف الحساب")
+        styled_message_box(self, "خطأ", f"فشل في إنشاء الملف:\n{message}", QMessageBox.Critical)
+
+    def jump_to_page(self, page):
+        if page >= 0:
+            self.view.pageNavigator().jump(page, QPointF(), self.view.zoomFactor())
+
+    def save(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "حفظ كشف الحساب", f"كشف حساب - {self.customer_name}.pdf", "ملفات PDF (*.pdf)"
+        )
+        if not file_path:
+            return
+        try:
+            with open(file_path, "wb") as f:
+                f.write(self.statement.pdf)
+            styled_message_box(self, "تم بنجاح", f"تم حفظ كشف الحساب بنجاح!\n{file_path}", QMessageBox.Information)
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل في حفظ الملف:\n{str(e)}", QMessageBox.Critical)
+
+
+# Width of the page thumbnails in the statement preview
+STATEMENT_THUMB_WIDTH = 150
+
+# Extra entries of the ledger selector
+LEDGER_NEW = "new"
+LEDGER_OPEN = "open"
+
+# Idle time before background maintenance starts, and how often that is checked
+MAINTENANCE_IDLE_SECONDS = 120
+MAINTENANCE_CHECK_MS = 10_000
+
+
 class MainWindow(QMainWindow):
-    def __init__(self, conn):
+    def __init__(self, conn, low_memory=False):
         super().__init__()
         self.conn = conn
+        # Low-memory mode (old counters with 2-4 GB RAM): small page cache, no prefetching,
+        # and the analytics arrays are dropped once a report is closed
+        self.low_memory = low_memory
+        # Writes are announced on the change bus and applied to the open views once per event-loop pass
+        self.changes = ChangeBus(lambda flush: QTimer.singleShot(0, flush))
+        self.changes.subscribe(self.on_changes)
+        self.journal = UndoJournal(conn, changes=self.changes)
+        self.page_cache = PageCache(LOW_MEMORY_MAX_BYTES) if low_memory else PageCache()
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(1)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(150)
+        self.prefetch_timer.timeout.connect(self.prefetch_selected_customer)
+        self.analytics = None
         self.current_customer_id = None
+        self.statement_cache = statement_pdf.StatementCache(
+            statement_pdf.LOW_MEMORY_MAX_STATEMENTS if low_memory else statement_pdf.DEFAULT_MAX_STATEMENTS)
+        self.statement_pool = QThreadPool(self)
+        self.statement_pool.setMaxThreadCount(1)
+        self.statement_cancel = threading.Event()
+        self.statement_dialog = None
+
+        # Maintenance runs in the background once the user has been idle for a while
+        maintenance.ensure_log(conn)
+        self.idle_watcher = IdleWatcher(self)
+        QApplication.instance().installEventFilter(self.idle_watcher)
+        self.maintenance_pool = QThreadPool(self)
+        self.maintenance_pool.setMaxThreadCount(1)
+        self.maintenance_running = False
+        self.maintenance_input = None
+        self.maintenance_timer = QTimer(self)
+        self.maintenance_timer.setInterval(MAINTENANCE_CHECK_MS)
+        self.maintenance_timer.timeout.connect(self.start_idle_maintenance)
+        self.maintenance_timer.start()
+
+        # Ledgers of the workspace; only the active one has an open connection
+        self.workspaces = workspaces.load_workspaces()
+        db_path = database_path(conn)
+        if db_path:
+            self.workspaces["active"] = workspaces.add_ledger(self.workspaces, Path(db_path).stem, db_path)
 
-        self.setWindowTitle("Daftar Accounts")
         self.resize(1100, 720)
 
         self.load_window_geometry()
@@ -335,14 +1071,18 @@ class MainWindow(QMainWindow):
         self.stacked.addWidget(self.page_customer)
 
         self.stacked.setCurrentWidget(self.page_list)
+        self.update_window_title()
 
         # Shortcuts
         QShortcut(QKeySequence("Ctrl+N"), self, activated=self.add_customer)
         QShortcut(QKeySequence("Delete"), self, activated=self.global_delete_shortcut)
+        QShortcut(QKeySequence("Ctrl+Z"), self, activated=self.undo)
+        QShortcut(QKeySequence("Ctrl+Y"), self, activated=self.redo)
 
     def save_window_geometry(self):
-        cfg = {}
         try:
+            # Keep the other settings (low_memory) stored in the same file
+            cfg = load_config()
             geom = self.geometry()
             cfg["x"] = geom.x()
             cfg["y"] = geom.y()
@@ -369,6 +1109,10 @@ class MainWindow(QMainWindow):
                                     buttons=QMessageBox.Yes | QMessageBox.No,
                                     default_button=QMessageBox.No)
         if res == QMessageBox.Yes:
+            self.idle_watcher.pause.set()
+            self.statement_cancel.set()
+            self.maintenance_pool.waitForDone(2000)
+            self.statement_pool.waitForDone(2000)
             try:
                 self.conn.close()
             except Exception:
@@ -382,7 +1126,7 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout(self.page_list)
 
         top_bar = QWidget()
-        top_bar.setStyleSheet("background-color:#1a252f;")
+        top_bar.setObjectName("listTopBar")
         top_layout = QHBoxLayout(top_bar)
         top_layout.setContentsMargins(12, 8, 12, 8)
 
@@ -399,13 +1143,20 @@ class MainWindow(QMainWindow):
         self.btn_delete_customer.clicked.connect(self.delete_customer)
 
         title_label = QLabel("حسابات الزبائن")
-        title_label.setFont(QFont("Sans", 18, QFont.Bold))
-        title_label.setStyleSheet("color:#ecf0f1;")
+        title_label.setFont(theme.font(UI_FONT, 18))
+
+        self.ledger_combo = QComboBox()
+        self.ledger_combo.setObjectName("ledgerCombo")
+        self.ledger_combo.setFont(theme.font(UI_FONT, 14))
+        self.ledger_combo.setMinimumWidth(220)
+        self.refresh_ledger_combo()
+        self.ledger_combo.activated.connect(self.on_ledger_chosen)
 
         top_layout.addWidget(self.btn_add_customer)
         top_layout.addWidget(self.btn_rename_customer)
         top_layout.addWidget(self.btn_delete_customer)
         top_layout.addSpacerItem(QSpacerItem(20, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
+        top_layout.addWidget(self.ledger_combo)
         top_layout.addWidget(title_label)
 
         layout.addWidget(top_bar)
@@ -425,26 +1176,35 @@ class MainWindow(QMainWindow):
         layout.addWidget(search_bar)
 
         list_label = QLabel("قائمة الزبائن وحساباتهم")
-        list_label.setFont(QFont("Sans", 14, QFont.Bold))
+        list_label.setObjectName("listTitle")
+        list_label.setFont(theme.font(UI_FONT, 14))
         list_label.setAlignment(Qt.AlignRight)
-        list_label.setStyleSheet("color:#2c3e50; margin:6px 12px 0 12px;")
         layout.addWidget(list_label)
 
-        self.table_customers = QTableWidget()
-        self.table_customers.setColumnCount(2)
-        self.table_customers.setHorizontalHeaderLabels(["الاسم", "الإجمالي (جنيه)"])
+        self.table_customers = QTableView()
+        self.customers_model = CustomerListModel(self)
+        self.table_customers.setModel(self.customers_model)
         self.table_customers.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.table_customers.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
-        self.table_customers.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table_customers.setEditTriggers(QTableWidget.NoEditTriggers)
+        # Size the totals column from the rows in view, not from every row of a fresh batch
+        self.table_customers.horizontalHeader().setResizeContentsPrecision(RESIZE_PRECISION)
+        self.table_customers.setSelectionBehavior(QTableView.SelectRows)
+        self.table_customers.setSelectionMode(QTableView.SingleSelection)
+        self.table_customers.setEditTriggers(QTableView.NoEditTriggers)
         self.table_customers.setAlternatingRowColors(True)
-        self.table_customers.setFont(QFont("Sans", 13, QFont.Bold))
+        self.table_customers.setFont(theme.font(UI_FONT, 13))
         self.table_customers.verticalHeader().setVisible(False)
+        theme.set_column_delegates(self.table_customers, {
+            0: (theme.font(ARABIC_FONT, 22), Qt.AlignCenter),
+            1: (theme.font(UI_FONT, 18), Qt.AlignCenter),
+        })
         self.table_customers.doubleClicked.connect(self.open_customer)
+        if not self.low_memory:
+            self.table_customers.selectionModel().currentRowChanged.connect(lambda *_: self.prefetch_timer.start())
         layout.addWidget(self.table_customers)
 
         bottom_bar = QWidget()
-        bottom_bar.setStyleSheet("background-color:#2c3e50;")
+        bottom_bar.setObjectName("bottomBar")
         bottom_layout = QHBoxLayout(bottom_bar)
         bottom_layout.setContentsMargins(12, 8, 12, 8)
 
@@ -452,6 +1212,31 @@ class MainWindow(QMainWindow):
         self.btn_open.setObjectName("openBtn")
         self.btn_open.setFixedWidth(220)
         self.btn_open.clicked.connect(self.open_customer)
+        self.btn_report = QPushButton("تقرير الديون 📊")
+        self.btn_report.setObjectName("renameBtn")
+        self.btn_report.clicked.connect(self.show_ledger_report)
+
+        self.btn_snapshot = QPushButton("تصدير الدفتر 💾")
+        self.btn_snapshot.setObjectName("renameBtn")
+        self.btn_snapshot.clicked.connect(self.export_ledger_snapshot)
+
+        self.btn_bulk = QPushButton("ترحيل جماعي 🧾")
+        self.btn_bulk.setObjectName("renameBtn")
+        self.btn_bulk.clicked.connect(self.bulk_post)
+
+        self.btn_health = QPushButton("صحة البيانات 🩺")
+        self.btn_health.setObjectName("renameBtn")
+        self.btn_health.clicked.connect(self.show_diagnostics)
+
+        self.btn_branches = QPushButton("تقرير الفروع 🏢")
+        self.btn_branches.setObjectName("renameBtn")
+        self.btn_branches.clicked.connect(self.show_consolidated_report)
+
+        bottom_layout.addWidget(self.btn_report)
+        bottom_layout.addWidget(self.btn_branches)
+        bottom_layout.addWidget(self.btn_bulk)
+        bottom_layout.addWidget(self.btn_snapshot)
+        bottom_layout.addWidget(self.btn_health)
         bottom_layout.addSpacerItem(QSpacerItem(20, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
         bottom_layout.addWidget(self.btn_open)
         layout.addWidget(bottom_bar)
@@ -462,7 +1247,7 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout(self.page_customer)
 
         top_bar = QWidget()
-        top_bar.setStyleSheet("background-color:#16a085;")
+        top_bar.setObjectName("customerTopBar")
         top_layout = QHBoxLayout(top_bar)
         top_layout.setContentsMargins(12, 8, 12, 8)
 
@@ -473,8 +1258,7 @@ class MainWindow(QMainWindow):
 
         self.name_label = QLabel("حساب الزبون")
         self.name_label.setObjectName("name_label")
-        self.name_label.setFont(QFont("Sans", 18, QFont.Bold))
-        self.name_label.setStyleSheet("color:white;")
+        self.name_label.setFont(theme.font(UI_FONT, 18))
 
         btn_add = QPushButton("إضافة عملية ➕")
         btn_add.setObjectName("addBtn")
@@ -487,14 +1271,11 @@ class MainWindow(QMainWindow):
         btn_del.clicked.connect(self.delete_transaction)
 
         btn_print = QPushButton("طباعة كشف الحساب")
-        btn_print.setStyleSheet("""
-            background-color:#e67e22; color:white; padding:8px 12px;
-            border-radius:8px; font-weight:bold; font-size:12pt;
-        """)
+        btn_print.setObjectName("printBtn")
         btn_print.clicked.connect(self.print_account_statement)
 
         btn_export_csv = QPushButton("تصدير CSV")
-        btn_export_csv.setStyleSheet("background-color:#2d98da; color:white; padding:8px 12px; border-radius:8px;")
+        btn_export_csv.setObjectName("csvBtn")
         btn_export_csv.clicked.connect(self.export_transactions_csv)
 
         top_layout.addWidget(btn_back)
@@ -506,149 +1287,128 @@ class MainWindow(QMainWindow):
         top_layout.addWidget(self.name_label)
         layout.addWidget(top_bar)
 
-        self.table_transactions = QTableWidget()
-        self.table_transactions.setColumnCount(4)
-        self.table_transactions.setHorizontalHeaderLabels(["التاريخ", "البيان", "المبلغ (جنيه)", "النوع"])
+        self.table_transactions = QTableView()
+        self.transactions_model = TransactionsModel(self)
+        self.table_transactions.setModel(self.transactions_model)
         self.table_transactions.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
         self.table_transactions.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.table_transactions.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
         self.table_transactions.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents)
-        self.table_transactions.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table_transactions.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table_transactions.horizontalHeader().setResizeContentsPrecision(RESIZE_PRECISION)
+        self.table_transactions.setSelectionBehavior(QTableView.SelectRows)
+        self.table_transactions.setSelectionMode(QTableView.SingleSelection)
+        self.table_transactions.setEditTriggers(QTableView.NoEditTriggers)
         self.table_transactions.setAlternatingRowColors(True)
-        self.table_transactions.setFont(QFont("Sans", 12, QFont.Bold))
+        self.table_transactions.setFont(theme.font(UI_FONT, 12))
         self.table_transactions.verticalHeader().setVisible(False)
+        cell_font = theme.font(ARABIC_FONT, 18)
+        theme.set_column_delegates(self.table_transactions, {
+            0: (cell_font, Qt.AlignCenter),
+            1: (theme.font(ARABIC_FONT, 20), Qt.AlignCenter),
+            2: (cell_font, Qt.AlignCenter),
+            3: (cell_font, Qt.AlignCenter),
+        })
         layout.addWidget(self.table_transactions)
 
         bottom_bar = QWidget()
-        bottom_bar.setStyleSheet("background-color:#2c3e50;")
+        bottom_bar.setObjectName("bottomBar")
         bottom_layout = QHBoxLayout(bottom_bar)
         bottom_layout.setContentsMargins(12, 8, 12, 8)
 
         self.total_label = QLabel("الإجمالي الحالي: 0.00 جنيه")
-        self.total_label.setFont(QFont("Sans", 16, QFont.Bold))
-        self.total_label.setStyleSheet("color:white;")
+        self.total_label.setObjectName("totalLabel")
+        self.total_label.setFont(theme.font(UI_FONT, 16))
 
         bottom_layout.addSpacerItem(QSpacerItem(20, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
         bottom_layout.addWidget(self.total_label)
         layout.addWidget(bottom_bar)
 
     def back_to_list(self):
+        # The list is already up to date with this window's own writes
         self.stacked.setCurrentWidget(self.page_list)
-        self.load_customers()
+        self.check_external_writes()
+
+    def selected_customer_id(self):
+        index = self.table_customers.currentIndex()
+        return index.data(Qt.UserRole) if index.isValid() else None
 
     def open_customer(self):
-        row = self.table_customers.currentRow()
-        if row < 0:
+        cid = self.selected_customer_id()
+        if cid is None:
             styled_message_box(self, "تنبيه", "الرجاء اختيار زبون أولاً",
                                icon=QMessageBox.Warning, buttons=QMessageBox.Ok)
             return
 
-        item = self.table_customers.item(row, 0)
-        self.current_customer_id = item.data(Qt.UserRole)
-
-        c = self.conn.cursor()
-        c.execute("SELECT name FROM customers WHERE id = ?", (self.current_customer_id,))
-        r = c.fetchone()
-        if not r:
+        page = self.get_customer_page(cid)
+        if page is None:
             styled_message_box(self, "خطأ", "الزبون غير موجود", icon=QMessageBox.Critical, buttons=QMessageBox.Ok)
             return
-        name = r[0]
-        self.name_label.setText(f"حساب الزبون: {name}")
-        self.load_transactions()
+        self.current_customer_id = cid
+        self.name_label.setText(f"حساب الزبون: {page.name}")
+        self.render_transactions(page)
         self.stacked.setCurrentWidget(self.page_customer)
 
+    def check_external_writes(self):
+        # Commits by other programs (API server, sync) are not journaled here
+        if self.page_cache.check_external_writes(self.conn):
+            self.changes.publish(Change(LEDGER_CHANGED))
+
+    def get_customer_page(self, cid):
+        self.check_external_writes()
+        page = self.page_cache.get(cid)
+        if page is None:
+            page = fetch_customer_page(self.conn, cid)
+            if page is not None:
+                self.page_cache.put(page)
+        return page
+
+    def prefetch_selected_customer(self):
+        cid = self.selected_customer_id()
+        if cid is None or self.stacked.currentWidget() != self.page_list:
+            return
+        if cid in self.page_cache:
+            return
+        db_path = database_path(self.conn)
+        if not db_path:
+            return
+        task = PagePrefetcher(db_path, cid, self.page_cache.epoch)
+        task.signals.done.connect(self.on_page_prefetched)
+        self.prefetch_pool.start(task)
+
+    def on_page_prefetched(self, page, epoch):
+        self.check_external_writes()
+        self.page_cache.put(page, epoch)
+
     def load_customers(self):
         search = self.search_edit.text().strip() if hasattr(self, "search_edit") else ""
-        c = self.conn.cursor()
-        if search:
-            # Simple protection against SQL injection via parameters
-            q = """
-                SELECT customers.id, customers.name,
-                IFNULL(SUM(transactions.amount), 0) as total
-                FROM customers
-                LEFT JOIN transactions ON customers.id = transactions.customer_id
-                WHERE customers.name LIKE ?
-                GROUP BY customers.id, customers.name
-                ORDER BY customers.id DESC
-            """
-            rows = c.execute(q, (f"%{search}%",)).fetchall()
-        else:
-            q = """
-                SELECT customers.id, customers.name,
-                IFNULL(SUM(transactions.amount), 0) as total
-                FROM customers
-                LEFT JOIN transactions ON customers.id = transactions.customer_id
-                GROUP BY customers.id, customers.name
-                ORDER BY customers.id DESC
-            """
-            rows = c.execute(q).fetchall()
-
-        self.table_customers.setRowCount(len(rows))
-        for row_idx, (cid, name, total) in enumerate(rows):
-            item_name = QTableWidgetItem(name)
-            item_name.setData(Qt.UserRole, cid)
-            item_name.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            item_name.setFont(QFont("Noto Naskh Arabic", 22, QFont.Bold))
-
-            item_total = QTableWidgetItem(format_amount(total))
-            item_total.setTextAlignment(Qt.AlignCenter)
-            item_total.setFont(QFont("Sans", 18, QFont.Bold))
-
-            self.table_customers.setItem(row_idx, 0, item_name)
-            self.table_customers.setItem(row_idx, 1, item_total)
+        # Only the first batch is read here; the model fetches the rest as the list scrolls
+        row = self.table_customers.currentIndex().row()
+        self.customers_model.reset(self.conn, search)
+        while row >= self.customers_model.rowCount() and self.customers_model.canFetchMore():
+            self.customers_model.fetchMore()
+        if 0 <= row < self.customers_model.rowCount():
+            self.table_customers.setCurrentIndex(self.customers_model.index(row, 0))
 
     def load_transactions(self):
         if not self.current_customer_id:
             return
+        page = self.get_customer_page(self.current_customer_id)
+        if page is not None:
+            self.render_transactions(page)
 
-        c = self.conn.cursor()
-        c.execute("""
-            SELECT id, date, description, amount, kind
-            FROM transactions
-            WHERE customer_id = ?
-            ORDER BY date DESC, id DESC
-        """, (self.current_customer_id,))
-        rows = c.fetchall()
-
-        self.table_transactions.setRowCount(len(rows))
-        total = 0.0
-
-        for row_idx, (tid, date, desc, amount, kind) in enumerate(rows):
-            total += amount
-
-            item_date = QTableWidgetItem(date)
-            item_desc = QTableWidgetItem(desc)
-            amount_str = f"+ {format_amount(amount)}" if amount > 0 else f"- {format_amount(abs(amount))}"
-            item_amount = QTableWidgetItem(amount_str)
-            item_kind = QTableWidgetItem(kind)
-
-            item_date.setData(Qt.UserRole, tid)
-
-            for it in (item_date, item_amount, item_kind):
-                it.setTextAlignment(Qt.AlignCenter)
-                it.setFont(QFont("Noto Naskh Arabic", 18, QFont.Bold))
-
-            item_desc.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            item_desc.setFont(QFont("Noto Naskh Arabic", 20, QFont.Bold))
-
-            self.table_transactions.setItem(row_idx, 0, item_date)
-            self.table_transactions.setItem(row_idx, 1, item_desc)
-            self.table_transactions.setItem(row_idx, 2, item_amount)
-            self.table_transactions.setItem(row_idx, 3, item_kind)
+    def render_transactions(self, page):
+        total = page.total
+        self.transactions_model.set_page(page)
 
         if total > 0:
             text = f"المبلغ المستحق: {format_amount(total)} جنيه"
-            color = "#e74c3c"
         elif total < 0:
             text = f"رصيد زائد للزبون: {format_amount(abs(total))} جنيه"
-            color = "#27ae60"
         else:
             text = "الحساب متساوي"
-            color = "#95a5a6"
 
         self.total_label.setText(text)
-        self.total_label.setStyleSheet(f"color:{color};")
+        theme.set_balance_state(self.total_label, total)
 
     def add_transaction(self):
         if not self.current_customer_id:
@@ -665,11 +1425,11 @@ class MainWindow(QMainWindow):
             "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)",
             (self.current_customer_id, date_str, desc, amount, kind)
         )
-        self.conn.commit()
-        self.load_transactions()
+        self.journal.record_add_transaction(c.lastrowid)
+        self.journal.commit()
 
     def delete_transaction(self):
-        row = self.table_transactions.currentRow()
+        row = self.table_transactions.currentIndex().row()
         if row < 0:
             styled_message_box(self, "تنبيه", "اختر عملية لحذفها",
                                icon=QMessageBox.Warning, buttons=QMessageBox.Ok)
@@ -684,11 +1444,11 @@ class MainWindow(QMainWindow):
         if res != QMessageBox.Yes:
             return
 
-        tid = self.table_transactions.item(row, 0).data(Qt.UserRole)
+        tid = self.transactions_model.transaction_id(row)
+        self.journal.record_delete_transaction(tid)
         c = self.conn.cursor()
         c.execute("DELETE FROM transactions WHERE id = ?", (tid,))
-        self.conn.commit()
-        self.load_transactions()
+        self.journal.commit()
 
     def add_customer(self):
         dlg = TextInputDialog("إضافة زبون", "اسم الزبون الجديد:")
@@ -701,17 +1461,15 @@ class MainWindow(QMainWindow):
                 styled_message_box(self, "تنبيه", "اسم الزبون موجود بالفعل", QMessageBox.Warning)
                 return
             c.execute("INSERT INTO customers (name) VALUES (?)", (name,))
-            self.conn.commit()
-            self.load_customers()
+            self.journal.record_add_customer(c.lastrowid, name)
+            self.journal.commit()
 
     def rename_customer(self):
-        row = self.table_customers.currentRow()
-        if row < 0:
+        cid = self.selected_customer_id()
+        if cid is None:
             styled_message_box(self, "تنبيه", "الرجاء اختيار زبون أولاً", QMessageBox.Warning)
             return
 
-        cid = self.table_customers.item(row, 0).data(Qt.UserRole)
-
         c = self.conn.cursor()
         c.execute("SELECT name FROM customers WHERE id = ?", (cid,))
         r = c.fetchone()
@@ -730,17 +1488,15 @@ class MainWindow(QMainWindow):
                 styled_message_box(self, "تنبيه", "اسم آخر بنفس الاسم موجود بالفعل", QMessageBox.Warning)
                 return
             c.execute("UPDATE customers SET name = ? WHERE id = ?", (new_name, cid))
-            self.conn.commit()
-            self.load_customers()
+            self.journal.record_rename_customer(cid, old_name, new_name)
+            self.journal.commit()
 
     def delete_customer(self):
-        row = self.table_customers.currentRow()
-        if row < 0:
+        cid = self.selected_customer_id()
+        if cid is None:
             styled_message_box(self, "تنبيه", "الرجاء اختيار زبون أولاً", QMessageBox.Warning)
             return
 
-        cid = self.table_customers.item(row, 0).data(Qt.UserRole)
-
         res, _ = styled_message_box(
             self, "تأكيد الحذف", "حذف الزبون وكل عملياته؟",
             icon=QMessageBox.Question,
@@ -750,125 +1506,68 @@ class MainWindow(QMainWindow):
         if res != QMessageBox.Yes:
             return
 
+        self.journal.record_delete_customer(cid)
         c = self.conn.cursor()
         c.execute("DELETE FROM transactions WHERE customer_id = ?", (cid,))
         c.execute("DELETE FROM customers WHERE id = ?", (cid,))
-        self.conn.commit()
-        self.load_customers()
+        self.journal.commit()
 
     def print_account_statement(self):
-        # Same as before — same PDF logic (better to keep as is)
         if not self.current_customer_id:
             styled_message_box(self, "تنبيه", "افتح حساب زبون أولاً", QMessageBox.Warning)
             return
 
-        c = self.conn.cursor()
-        c.execute("SELECT name FROM customers WHERE id = ?", (self.current_customer_id,))
-        customer_name = c.fetchone()[0]
-
-        c.execute("SELECT date, description, amount, kind FROM transactions WHERE customer_id = ? ORDER BY date ASC, id ASC",
-                  (self.current_customer_id,))
-        transactions = c.fetchall()
-
-        if not transactions:
+        key = statement_pdf.statement_key(self.conn, self.current_customer_id)
+        if key is None:
             styled_message_box(self, "تنبيه", "لا توجد عمليات لطباعتها", QMessageBox.Warning)
             return
 
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "حفظ كشف الحساب", f"كشف حساب - {customer_name}.pdf", "ملفات PDF (*.pdf)"
-        )
-        if not file_path:
-            return
-
-        try:
-            import arabic_reshaper
-            from bidi.algorithm import get_display
-        except Exception:
-            styled_message_box(self, "خطأ", "مكتبات arabic_reshaper و python-bidi مطلوبة للطباعة بشكل صحيح",
-                               QMessageBox.Critical)
-            return
-
-        def ar(text):
-            reshaped = arabic_reshaper.reshape(text)
-            return get_display(reshaped)
-
-        # For Arabic font support
-        noto_paths = [
-            "fonts/NotoNaskhArabic-Regular.ttf",
-            "fonts/NotoSansArabic-Regular.ttf",
-            "fonts/DejaVuSans.ttf",
-        ]
-        font_path = next((p for p in noto_paths if Path(p).exists()), None)
-        if not font_path:
-            styled_message_box(self, "خطأ", "مش لاقي خط عربي! ركّب fonts-noto-arabic", QMessageBox.Critical)
-            return
-
-        pdfmetrics.registerFont(TTFont("Arabic", font_path))
-
-        doc = SimpleDocTemplate(file_path, pagesize=A4,
-                                rightMargin=18*mm, leftMargin=18*mm,
-                                topMargin=20*mm, bottomMargin=20*mm)
-        elements = []
-
-        title_style = ParagraphStyle(
-            name='Title',
-            fontName='Arabic',
-            fontSize=30,
-            alignment=TA_CENTER,
-            spaceAfter=20,
-            textColor=colors.HexColor("#2c3e50"),
-            leading=36
-        )
-        elements.append(Paragraph(ar(f"كشف حساب {customer_name}"), title_style))
-        elements.append(Spacer(1, 8*mm))  # Small space before the table
-
-        # Table data
-        data = [[ar("التاريخ"), ar("البيان"), ar("المبلغ"), ar("النوع")]]
-        total = 0.0
-        for date, desc, amount, kind in transactions:
-            total += amount
-            amount_str = f"{amount:.2f}" if amount >= 0 else f"({abs(amount):.2f})"
-
-            y, m, d = date.split("-")
-            raw_date = f"{int(y):02d} / {int(m):02d} / {d}"
-            nice_date = f"\u202A{raw_date}\u202C"
-
-            data.append([
-                ar(nice_date),
-                ar(desc),
-                ar(amount_str),
-                ar(kind)
-            ])
-
-        total_str = f"{total:.2f} جنيه" if total >= 0 else f"({abs(total):.2f}) جنيه"
-        data.append(["", ar(total_str), ar("إجمالي الحساب"), ""])
-
-        table = Table(data, colWidths=[48*mm, 82*mm, 38*mm, 32*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2c3e50")),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Arabic'),
-            ('FONTSIZE', (0, 0), (-1, 0), 16),
-            ('FONTSIZE', (0, 1), (-1, -2), 15),
-            ('FONTSIZE', (0, -1), (-1, -1), 18),
-            ('GRID', (0, 0), (-1, -1), 1.4, colors.black),
-            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor("#f8f9fa")),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor("#2c3e50")),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ]))
-        elements.append(table)
+        # Nothing changed since the last preview: the cached PDF and thumbnails are shown as they are
+        statement = self.statement_cache.get(key)
+        self.render_statement(statement)
+        self.statement_dialog = StatementPreviewDialog(statement, self)
+        self.statement_dialog.exec()
+        self.statement_dialog = None
 
-        try:
-            doc.build(elements)
-            styled_message_box(self, "تم بنجاح", f"تم حفظ كشف الحساب بنجاح!\n{file_path}", QMessageBox.Information)
-        except Exception as e:
-            styled_message_box(self, "خطأ", f"فشل في إنشاء الملف:\n{str(e)}", QMessageBox.Critical)
+    def render_statement(self, statement):
+        if statement.complete or statement.rendering:
+            return
+        db_path = database_path(self.conn)
+        if not db_path:
+            return
+        statement.rendering = True
+        task = StatementRenderer(db_path, statement, self.statement_cancel)
+        task.signals.built.connect(self.on_statement_built)
+        task.signals.page.connect(self.on_statement_page)
+        task.signals.failed.connect(self.on_statement_failed)
+        task.signals.finished.connect(self.on_statement_finished)
+        self.statement_pool.start(task)
+
+    def previewing(self, statement):
+        return self.statement_dialog is not None and self.statement_dialog.statement is statement
+
+    def on_statement_built(self, statement, key, pdf, page_count):
+        # The key read with the printed rows; it differs when the ledger changed in between
+        if key != statement.key:
+            self.statement_cache.rekey(statement, key)
+        statement.pdf = pdf
+        statement.page_count = page_count
+        if self.previewing(statement):
+            self.statement_dialog.show_pdf()
+
+    def on_statement_page(self, statement, page, image):
+        if page == len(statement.thumbnails):
+            statement.thumbnails.append(image)
+        if self.previewing(statement):
+            self.statement_dialog.set_thumbnail(page, image)
+
+    def on_statement_failed(self, statement, message):
+        self.statement_cache.discard(statement.key)
+        if self.previewing(statement):
+            self.statement_dialog.show_error(message)
+
+    def on_statement_finished(self, statement):
+        statement.rendering = False
 
     def export_transactions_csv(self):
         if not self.current_customer_id:
@@ -876,13 +1575,10 @@ class MainWindow(QMainWindow):
             return
 
         c = self.conn.cursor()
-        c.execute("SELECT name FROM customers WHERE id = ?", (self.current_customer_id,))
+        c.execute(CUSTOMER_NAME_QUERY, (self.current_customer_id,))
         customer_name = c.fetchone()[0]
 
-        c.execute("SELECT date, description, amount, kind FROM transactions WHERE customer_id = ? ORDER BY date ASC, id ASC",
-                  (self.current_customer_id,))
-        transactions = c.fetchall()
-        if not transactions:
+        if c.execute(HAS_TRANSACTIONS_QUERY, (self.current_customer_id,)).fetchone() is None:
             styled_message_box(self, "تنبيه", "لا توجد عمليات للتصدير", QMessageBox.Warning)
             return
 
@@ -891,15 +1587,224 @@ class MainWindow(QMainWindow):
             return
 
         try:
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(["التاريخ", "البيان", "المبلغ", "النوع"])
-                for date, desc, amount, kind in transactions:
-                    writer.writerow([date, desc, f"{amount:.2f}", kind])
+            write_statement_csv(self.conn, self.current_customer_id, file_path)
             styled_message_box(self, "تم", f"تم تصدير العمليات إلى:\n{file_path}", QMessageBox.Information)
         except Exception as e:
             styled_message_box(self, "خطأ", f"فشل في حفظ الملف:\n{str(e)}", QMessageBox.Critical)
 
+    def show_ledger_report(self):
+        # NumPy and pyarrow are imported on first use, not at startup
+        import analytics
+        if not analytics.available():
+            styled_message_box(self, "خطأ", "مكتبة numpy مطلوبة لعرض التقارير", QMessageBox.Critical)
+            return
+        try:
+            if self.analytics is None:
+                self.analytics = analytics.LedgerAnalytics(self.conn)
+            self.analytics.refresh()
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل في تحميل البيانات:\n{str(e)}", QMessageBox.Critical)
+            return
+        LedgerReportDialog(self.conn, self.analytics).exec()
+        if self.low_memory:
+            self.analytics = None
+
+    def start_idle_maintenance(self):
+        # One run per idle period: after it, wait for new input before trying again
+        if self.maintenance_running or self.idle_watcher.idle_seconds() < MAINTENANCE_IDLE_SECONDS:
+            return
+        if self.maintenance_input == self.idle_watcher.last_input:
+            return
+        db_path = database_path(self.conn)
+        if not db_path:
+            return
+        self.maintenance_running = True
+        self.maintenance_input = self.idle_watcher.last_input
+        self.idle_watcher.pause.clear()
+        task = MaintenanceRunner(db_path, self.idle_watcher.pause)
+        task.signals.done.connect(self.on_maintenance_done)
+        self.maintenance_pool.start(task)
+
+    def on_maintenance_done(self, results):
+        self.maintenance_running = False
+        # Takes in the run's own commits, so they cause no reload later
+        self.check_external_writes()
+        # An interrupted run is retried in the next idle period
+        if any(status == maintenance.STATUS_INTERRUPTED for _, status in results):
+            self.maintenance_input = None
+
+    def show_diagnostics(self):
+        try:
+            DiagnosticsDialog(self.conn, self.maintenance_pool).exec()
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل في قراءة حالة قاعدة البيانات:\n{str(e)}", QMessageBox.Critical)
+
+    def bulk_post(self):
+        dlg = BulkPostDialog(self.conn, self.journal, self.search_edit.text().strip())
+        if dlg.exec() != QDialog.Accepted:
+            return
+        styled_message_box(self, "تم", f"تم ترحيل {dlg.posted} عملية (Ctrl+Z للتراجع)", QMessageBox.Information)
+
+    def undo(self):
+        try:
+            result = self.journal.undo()
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل التراجع:\n{str(e)}", QMessageBox.Critical)
+            return
+        if result is None:
+            styled_message_box(self, "تنبيه", "لا توجد عمليات للتراجع عنها", QMessageBox.Warning)
+
+    def redo(self):
+        try:
+            result = self.journal.redo()
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل الإعادة:\n{str(e)}", QMessageBox.Critical)
+            return
+        if result is None:
+            styled_message_box(self, "تنبيه", "لا توجد عمليات لإعادتها", QMessageBox.Warning)
+
+    def on_changes(self, changes):
+        # Only the affected customers are re-read: their cached pages, list rows and the open page.
+        # The analytics engine is not subscribed: refresh() compares its change marker each time a
+        # report opens, which also covers writes by other programs.
+        self.page_cache.note_own_writes(self.conn)
+        if changes[0].kind == LEDGER_CHANGED:
+            self.page_cache.clear()
+            self.statement_cache.clear()
+            self.load_customers()
+            affected = {self.current_customer_id}
+        else:
+            affected = {ch.cid for ch in changes}
+            for cid in affected:
+                self.page_cache.invalidate(cid)
+            self.statement_cache.discard_customers(affected)
+            self.customers_model.refresh_customers(affected)
+        if self.current_customer_id not in affected or self.stacked.currentWidget() != self.page_customer:
+            return
+        page = self.get_customer_page(self.current_customer_id)
+        if page is None:
+            # The open customer was removed (deleted, or an undo of its creation)
+            self.current_customer_id = None
+            self.stacked.setCurrentWidget(self.page_list)
+            return
+        self.name_label.setText(f"حساب الزبون: {page.name}")
+        self.render_transactions(page)
+
+    def export_ledger_snapshot(self):
+        import snapshot_export
+        formats = snapshot_export.available_formats()
+        if not formats:
+            styled_message_box(self, "خطأ", "مكتبة pyarrow أو numpy مطلوبة للتصدير", QMessageBox.Critical)
+            return
+        filters = ";;".join(f"{ext[1:].upper()} (*{ext})" for ext in formats)
+        stamp = datetime.now().strftime("%Y-%m-%d")
+        file_path, chosen = QFileDialog.getSaveFileName(self, "تصدير الدفتر", f"دفتر الحسابات {stamp}{formats[0]}", filters)
+        if not file_path:
+            return
+        if Path(file_path).suffix.lower() not in formats:
+            # The format follows the extension: take the chosen filter's when the name has none
+            file_path += next((ext for ext in formats if chosen.endswith(f"(*{ext})")), formats[0])
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            batch_rows = snapshot_export.LOW_MEMORY_BATCH_ROWS if self.low_memory else snapshot_export.BATCH_ROWS
+            rows = snapshot_export.export_snapshot(self.conn, file_path, batch_rows)
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            styled_message_box(self, "خطأ", f"فشل في حفظ الملف:\n{str(e)}", QMessageBox.Critical)
+            return
+        QApplication.restoreOverrideCursor()
+        styled_message_box(self, "تم", f"تم تصدير {rows} عملية إلى:\n{file_path}", QMessageBox.Information)
+
+    def update_window_title(self):
+        self.setWindowTitle(f"Daftar Accounts — {workspaces.ledger_name(self.workspaces, self.workspaces['active'])}")
+
+    def refresh_ledger_combo(self):
+        self.ledger_combo.blockSignals(True)
+        self.ledger_combo.clear()
+        for ledger in self.workspaces["ledgers"]:
+            self.ledger_combo.addItem(ledger["name"], ledger["path"])
+        self.ledger_combo.insertSeparator(self.ledger_combo.count())
+        self.ledger_combo.addItem("دفتر جديد ➕", LEDGER_NEW)
+        self.ledger_combo.addItem("فتح دفتر 📂", LEDGER_OPEN)
+        self.ledger_combo.setCurrentIndex(self.ledger_combo.findData(self.workspaces["active"]))
+        self.ledger_combo.blockSignals(False)
+
+    def on_ledger_chosen(self, index):
+        choice = self.ledger_combo.itemData(index)
+        if choice == LEDGER_NEW:
+            self.create_ledger()
+        elif choice == LEDGER_OPEN:
+            self.open_ledger_file()
+        elif choice:
+            self.switch_ledger(choice)
+        self.refresh_ledger_combo()
+
+    def create_ledger(self):
+        dlg = TextInputDialog("دفتر جديد", "اسم الدفتر (الفرع):")
+        name = dlg.get_text()
+        if name is None:
+            return
+        try:
+            path = workspaces.create_ledger(self.workspaces, name)
+        except ValidationError as e:
+            styled_message_box(self, "تنبيه", str(e), QMessageBox.Warning)
+            return
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل في إنشاء الدفتر:\n{str(e)}", QMessageBox.Critical)
+            return
+        self.switch_ledger(path)
+
+    def open_ledger_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "فتح دفتر", str(Path.home()), "قواعد البيانات (*.db)")
+        if not file_path:
+            return
+        self.switch_ledger(workspaces.add_ledger(self.workspaces, Path(file_path).stem, file_path))
+
+    def switch_ledger(self, path):
+        # Open the new ledger first, so a failure leaves the current one in place
+        if path == self.workspaces["active"]:
+            return
+        if not Path(path).exists():
+            styled_message_box(self, "خطأ", f"لم يُعثر على الدفتر:\n{path}", QMessageBox.Critical)
+            return
+        try:
+            conn = init_db(path)
+        except Exception as e:
+            styled_message_box(self, "خطأ", f"فشل في فتح الدفتر:\n{str(e)}", QMessageBox.Critical)
+            return
+        old_conn, self.conn = self.conn, conn
+        self.journal = UndoJournal(conn, changes=self.changes)
+        maintenance.ensure_log(conn)
+        # Everything cached belongs to the previous ledger; in-flight prefetches are dropped by the epoch
+        self.page_cache.clear()
+        self.page_cache.check_external_writes(conn)
+        self.statement_cache.clear()
+        self.analytics = None
+        self.current_customer_id = None
+        self.workspaces["active"] = path
+        try:
+            workspaces.save_workspaces(self.workspaces)
+        except OSError:
+            pass
+        self.stacked.setCurrentWidget(self.page_list)
+        self.table_customers.setCurrentIndex(QModelIndex())
+        self.load_customers()
+        self.update_window_title()
+        # Idle ledgers keep no connection open
+        old_conn.close()
+
+    def show_consolidated_report(self):
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            report = workspaces.consolidated_report(self.workspaces["ledgers"])
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            styled_message_box(self, "خطأ", f"فشل في قراءة الدفاتر:\n{str(e)}", QMessageBox.Critical)
+            return
+        QApplication.restoreOverrideCursor()
+        ConsolidatedReportDialog(report).exec()
+
     def global_delete_shortcut(self):
         # If the customer list page is visible → delete customer; if the customer account page is visible → delete transaction
         if self.stacked.currentWidget() == self.page_list:
@@ -908,79 +1813,40 @@ class MainWindow(QMainWindow):
             self.delete_transaction()
 
 
+def load_config():
+    try:
+        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 def main():
-    conn = init_db()
     app = QApplication(sys.argv)
-    app.setLayoutDirection(Qt.RightToLeft)
-    app.setFont(QFont("Noto Naskh Arabic", 20, QFont.Bold))
-
-    app.setStyleSheet("""
-        QWidget {
-            background-color: #f8f9fa;
-            color: #1e272e;
-            font-family: 'Noto Naskh Arabic', 'Amiri', 'Tahoma', sans-serif;
-        }
-        QLabel {
-            color: #1e272e;
-            font-weight: bold;
-        }
-        QTableWidget {
-            background-color: white;
-            gridline-color: #dee2e6;
-            alternate-background-color: #f1f3f5;
-            selection-background-color: #3498db;
-            selection-color: white;
-        }
-        QTableWidget::item {
-            padding: 12px 8px;
-            color: #1e272e;
-        }
-        QHeaderView::section {
-            background-color: #2c3e50;
-            color: white;
-            padding: 14px;
-            font-weight: bold;
-            font-size: 18pt;
-            border: none;
-        }
-        QPushButton {
-            color: white;
-            padding: 16px 28px;
-            border-radius: 8px;
-            border: none;
-            font-weight: bold;
-            font-size: 18pt;
-            min-height: 50px;
-        }
-        QPushButton#addBtn      { background-color: #27ae60; }
-        QPushButton#renameBtn   { background-color: #3498db; }
-        QPushButton#deleteBtn   { background-color: #e74c3c; }
-        QPushButton#openBtn     { background-color: #9b59b6; }
-        QPushButton#saveBtn     { background-color: #27ae60; }
-        QPushButton#cancelBtn   { background-color: #95a5a6; }
-        QLineEdit, QDateEdit {
-            padding: 14px;
-            border: 2px solid #bdc3c7;
-            border-radius: 8px;
-            background: white;
-            font-size: 18pt;
-            color: #1e272e;
-            font-weight: bold;
-        }
-        QLineEdit:focus, QDateEdit:focus {
-            border: 2px solid #3498db;
-        }
-        QTableWidget::item, QLabel, QRadioButton, QDialog {
-            color: #1e272e !important;
-        }
-        #name_label {
-            color: white !important;
-            font-size: 24pt !important;
-        }
-    """)
-
-    window = MainWindow(conn)
+    theme.apply(app)
+
+    # SQLite would silently create an empty ledger in place of one that was moved or
+    # deleted (or sits on a drive that is not mounted); the default ledger opens instead
+    ws = workspaces.load_workspaces()
+    missing = ws["active"] if ws["active"] != str(DB_PATH) and not Path(ws["active"]).exists() else None
+    if missing:
+        ws["active"] = str(DB_PATH)
+        try:
+            workspaces.save_workspaces(ws)
+        except OSError:
+            pass
+    try:
+        conn = init_db(ws["active"])
+    except sqlite3.Error:
+        conn = init_db()
+
+    # "--low-memory" or "low_memory": true in config.json
+    low_memory = "--low-memory" in sys.argv or bool(load_config().get("low_memory"))
+    window = MainWindow(conn, low_memory=low_memory)
     window.show()
+    if missing:
+        styled_message_box(window, "تنبيه", f"لم يُعثر على الدفتر:\n{missing}\nتم فتح الدفتر الرئيسي بدلاً منه.",
+                           QMessageBox.Warning)
     sys.exit(app.exec())
 
 
@@ -0,0 +1,376 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from ledger import database_path
+from ledger_sync import OP_INSERT, TBL_TRANSACTIONS
+
+try:
+    import numpy as np
+except ImportError:  # analytics is optional, the app runs without NumPy
+    np = None
+
+# Kind codes stored in the columnar cache
+KIND_CODES = {"شراء": 1, "دفع": 2}
+
+# Amounts are kept as integer piastres (1/100 of a pound)
+UNITS = 100
+
+AGING_BUCKETS = (30, 60, 90)
+
+_COLUMNS = (
+    ("id", "<i8"),
+    ("customer_id", "<i8"),
+    ("day", "<i4"),
+    ("amount", "<i8"),
+    ("kind", "<i1"),
+)
+_CHUNK = 200_000
+
+CACHED_COUNT_QUERY = "SELECT COUNT(*) FROM transactions WHERE id <= ?"
+# The sync change log: the last seq handed out (kept when the log is pruned) and the oldest one left
+LOG_POSITION_QUERY = """
+    SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'sync_log'), 0),
+           (SELECT MIN(seq) FROM sync_log)
+"""
+CHECKSUM_QUERY = "SELECT TOTAL(amount * (id % 1000 + 1)) FROM transactions WHERE id <= ?"
+# Any edit or delete of a transaction logged after a seq (the unary + keeps SQLite on the seq range)
+EDITS_SINCE_QUERY = f"SELECT 1 FROM sync_log WHERE seq > ? AND +tbl = {TBL_TRANSACTIONS} AND op != {OP_INSERT} LIMIT 1"
+NEW_ROWS_QUERY = """
+    SELECT id, customer_id, date, amount, kind
+    FROM transactions WHERE id > ? ORDER BY id
+"""
+
+
+def available():
+    return np is not None
+
+
+def to_money(units):
+    return units / UNITS
+
+
+class LedgerAnalytics:
+    """Columnar, NumPy-backed view of the transactions table.
+
+    Columns are cached as raw memory-mapped files in ``<db>.analytics/``
+    next to the database and refreshed incrementally by transaction id.
+    The cache is rebuilt when rows it already holds may have changed: an
+    edit or delete in the sync change log since the last refresh, or a
+    change in the row count below the cached id (rows restored by undo).
+    """
+
+    def __init__(self, conn, cache_dir=None):
+        if np is None:
+            raise RuntimeError("NumPy is required for ledger analytics")
+        self.conn = conn
+        if cache_dir is None:
+            cache_dir = _default_cache_dir(conn)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.meta = {"rows": 0, "last_id": 0, "marker": 0}
+        self.columns = {}
+        self._order = None
+
+    # -- cache maintenance -------------------------------------------------
+
+    def refresh(self):
+        """Bring the arrays up to date. Returns the number of rows appended."""
+        meta = self._read_meta()
+        c = self.conn.cursor()
+        count = c.execute(CACHED_COUNT_QUERY, (meta["last_id"],)).fetchone()[0]
+        marker, oldest = self._marker(meta["last_id"])
+        edited = self._edited_since(meta["marker"], marker, oldest)
+        if edited or count != meta["rows"] or not self._files_intact(meta["rows"]):
+            self._reset()
+            meta = {"rows": 0, "last_id": 0, "marker": 0}
+
+        appended = 0
+        c.execute(NEW_ROWS_QUERY, (meta["last_id"],))
+        while True:
+            chunk = c.fetchmany(_CHUNK)
+            if not chunk:
+                break
+            self._append(_chunk_to_columns(chunk))
+            meta["rows"] += len(chunk)
+            meta["last_id"] = chunk[-1][0]
+            appended += len(chunk)
+        meta["marker"] = self._marker(meta["last_id"])[0] if oldest is False and appended else marker
+
+        changed = appended or meta["marker"] != self.meta["marker"]
+        self.meta = meta
+        if changed or not self.columns:
+            self._write_meta(meta)
+            self._map_columns(meta["rows"])
+        return appended
+
+    def _read_meta(self):
+        if self.cache_dir is None:
+            return dict(self.meta)
+        try:
+            with open(self.cache_dir / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return {"rows": int(meta["rows"]), "last_id": int(meta["last_id"]), "marker": int(meta["marker"])}
+        except (OSError, ValueError, KeyError):
+            return {"rows": 0, "last_id": 0, "marker": 0}
+
+    def _marker(self, last_id):
+        """(marker, oldest seq in the log) for telling edits of cached rows apart.
+
+        The marker is the last seq of the sync change log; on a bare
+        transactions table it is a checksum of the cached rows instead, and
+        the oldest seq is False.
+        """
+        c = self.conn.cursor()
+        try:
+            return c.execute(LOG_POSITION_QUERY).fetchone()
+        except sqlite3.OperationalError:
+            return int(round(c.execute(CHECKSUM_QUERY, (last_id,)).fetchone()[0] * UNITS)), False
+
+    def _edited_since(self, marker, current, oldest):
+        # Whether rows already cached may have changed between two markers. A
+        # cache older than the pruned part of the log counts as edited.
+        if marker == current:
+            return False
+        if oldest is False:
+            return True
+        pruned = current if oldest is None else oldest - 1
+        return pruned > marker or self.conn.execute(EDITS_SINCE_QUERY, (marker,)).fetchone() is not None
+
+    def _write_meta(self, meta):
+        if self.cache_dir is None:
+            return
+        tmp = self.cache_dir / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.cache_dir / "meta.json")
+
+    def _files_intact(self, rows):
+        if self.cache_dir is None:
+            return len(self.columns.get("id", ())) == rows
+        for name, dtype in _COLUMNS:
+            path = self.cache_dir / f"{name}.bin"
+            size = path.stat().st_size if path.exists() else 0
+            if size != rows * np.dtype(dtype).itemsize:
+                return False
+        return True
+
+    def _reset(self):
+        self.columns = {}
+        self._order = None
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, _ in _COLUMNS:
+            open(self.cache_dir / f"{name}.bin", "wb").close()
+        open(self.cache_dir / "order.bin", "wb").close()
+
+    def _append(self, cols):
+        self._order = None
+        if self.cache_dir is None:
+            for name, _ in _COLUMNS:
+                old = self.columns.get(name)
+                self.columns[name] = cols[name] if old is None else np.concatenate((old, cols[name]))
+            return
+        # Drop the maps before growing the files underneath them
+        self.columns = {}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, _ in _COLUMNS:
+            with open(self.cache_dir / f"{name}.bin", "ab") as f:
+                cols[name].tofile(f)
+
+    def _map_columns(self, rows):
+        if self.cache_dir is None:
+            if not self.columns:
+                self.columns = {name: np.empty(0, dtype) for name, dtype in _COLUMNS}
+            return
+        self.columns = {}
+        for name, dtype in _COLUMNS:
+            if rows:
+                self.columns[name] = np.memmap(self.cache_dir / f"{name}.bin", dtype=dtype,
+                                               mode="r", shape=(rows,))
+            else:
+                self.columns[name] = np.empty(0, dtype)
+
+    # -- computations ------------------------------------------------------
+
+    def _sort_keys(self, rows=slice(None)):
+        return (self.columns["customer_id"][rows].astype(np.int64) << 32) | \
+            (self.columns["day"][rows].astype(np.int64) & 0xFFFFFFFF)
+
+    def _ledger_order(self):
+        # Row indices sorted by (customer, date); the id order of the cache breaks
+        # ties. Persisted next to the columns and merged incrementally on refresh.
+        if self._order is not None:
+            return self._order
+        rows = self.meta["rows"]
+        path = self.cache_dir / "order.bin" if self.cache_dir else None
+        done = path.stat().st_size // 8 if path and path.exists() else 0
+        if done == rows:
+            self._order = np.memmap(path, dtype="<i8", mode="r", shape=(rows,)) if rows else \
+                np.empty(0, np.int64)
+            return self._order
+
+        if 0 < done < rows:
+            old = np.fromfile(path, dtype="<i8")
+            new_keys = self._sort_keys(slice(done, rows))
+            new_order = np.argsort(new_keys, kind="stable")
+            # Equal keys go after existing rows, which keeps ties in id order
+            positions = np.searchsorted(self._sort_keys()[old], new_keys[new_order], side="right")
+            order = np.insert(old, positions, new_order + done)
+        else:
+            order = np.argsort(self._sort_keys(), kind="stable")
+        order = order.astype("<i8")
+        if path:
+            order.tofile(path)
+        self._order = order
+        return order
+
+    def balances(self):
+        """Per-customer balances: (customer_ids, balances in units)."""
+        cust = self.columns["customer_id"]
+        # Customer ids are dense row ids, so a bincount beats sorting
+        counts = np.bincount(cust)
+        totals = np.bincount(cust, weights=self.columns["amount"], minlength=len(counts))
+        ids = np.flatnonzero(counts)
+        return ids, np.rint(totals[ids]).astype(np.int64)
+
+    def running_balances(self, customer_id=None):
+        """Running balance per row in ledger order: (row_index, running units)."""
+        order = self._ledger_order()
+        cust = self.columns["customer_id"][order]
+        if customer_id is not None:
+            mask = cust == customer_id
+            order, cust = order[mask], cust[mask]
+        return order, _grouped_cumsum(self.columns["amount"][order], cust)
+
+    def period_totals(self, period="M", customer_id=None):
+        """Purchases and payments per period ('D', 'M' or 'Y').
+
+        Returns (period_starts as datetime64, purchases, payments) in units,
+        payments as positive numbers.
+        """
+        day = self.columns["day"]
+        amount = self.columns["amount"]
+        if customer_id is not None:
+            mask = self.columns["customer_id"] == customer_id
+            day, amount = day[mask], amount[mask]
+        if not len(day):
+            empty = np.empty(0, np.int64)
+            return np.empty(0, f"datetime64[{period}]"), empty, empty
+        # Aggregate per day first (a few thousand bins), then fold days into periods
+        first = int(day.min())
+        offset = day - first
+        counts = np.bincount(offset)
+        purchases = np.bincount(offset, weights=np.where(amount > 0, amount, 0), minlength=len(counts))
+        payments = np.bincount(offset, weights=np.where(amount < 0, -amount, 0), minlength=len(counts))
+        used = np.flatnonzero(counts)
+        keys = (used + first).astype("datetime64[D]").astype(f"datetime64[{period}]")
+        periods, inv = np.unique(keys, return_inverse=True)
+        purchases = np.bincount(inv, weights=purchases[used], minlength=len(periods))
+        payments = np.bincount(inv, weights=payments[used], minlength=len(periods))
+        return periods, np.rint(purchases).astype(np.int64), np.rint(payments).astype(np.int64)
+
+    def aging(self, as_of=None, buckets=AGING_BUCKETS):
+        """Outstanding balance per customer split by age of the purchases.
+
+        Payments settle the oldest purchases first, so what is still owed
+        comes from the newest ones. Returns (customer_ids, matrix) where the
+        matrix has one column per bucket plus one for anything older.
+        """
+        if as_of is None:
+            as_of = np.datetime64("today", "D")
+        as_of = np.datetime64(as_of, "D").astype(np.int64)
+        nb = len(buckets) + 1
+
+        ids, balances = self.balances()
+        if not len(ids):
+            return ids, np.zeros((0, nb), np.int64)
+        owed_by_id = np.zeros(ids[-1] + 1, np.int64)
+        owed_by_id[ids] = np.maximum(balances, 0)
+
+        # Only purchases of customers who still owe something can be outstanding
+        order = self._ledger_order()
+        cust = self.columns["customer_id"][order]
+        amount = self.columns["amount"][order]
+        keep = (amount > 0) & (owed_by_id[cust] > 0)
+        order, cust, amount = order[keep], cust[keep], amount[keep]
+
+        # Purchases made after each row, within the same customer
+        totals = np.bincount(cust, weights=amount, minlength=len(owed_by_id))
+        newer = totals[cust] - _grouped_cumsum(amount, cust)
+        outstanding = np.clip(owed_by_id[cust] - newer, 0, amount)
+
+        age = as_of - self.columns["day"][order].astype(np.int64)
+        bucket = np.searchsorted(np.asarray(buckets), age, side="left")
+        matrix = np.bincount(cust * nb + bucket, weights=outstanding, minlength=len(owed_by_id) * nb)
+        return ids, np.rint(matrix).astype(np.int64).reshape(-1, nb)[ids]
+
+
+def _grouped_cumsum(values, groups):
+    # Inclusive cumulative sum restarting at every change of `groups` (sorted)
+    running = np.cumsum(values)
+    if not len(values):
+        return running
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    base = running[starts] - values[starts]
+    return running - np.repeat(base, np.diff(np.r_[starts, len(values)]))
+
+
+def _chunk_to_columns(chunk):
+    ids, cust, dates, amounts, kinds = zip(*chunk)
+    return {
+        "id": np.fromiter(ids, np.int64, len(ids)),
+        "customer_id": np.fromiter(cust, np.int64, len(cust)),
+        "day": np.array(dates, dtype="datetime64[D]").astype(np.int32),
+        "amount": np.rint(np.fromiter(amounts, np.float64, len(amounts)) * UNITS).astype(np.int64),
+        "kind": np.fromiter((KIND_CODES.get(k, 0) for k in kinds), np.int8, len(kinds)),
+    }
+
+
+def _default_cache_dir(conn):
+    path = database_path(conn)
+    return Path(path + ".analytics") if path else None
+
+
+def _bench(n_rows, n_customers=50_000):
+    import tempfile
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(Path(tmp) / "bench.db")
+        conn.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY, customer_id INTEGER, "
+                     "date TEXT, description TEXT, amount REAL, kind TEXT)")
+        days = np.datetime64("2020-01-01") + rng.integers(0, 1800, n_rows)
+        amounts = np.round(rng.uniform(-500, 1000, n_rows), 2)
+        conn.executemany(
+            "INSERT INTO transactions VALUES (NULL, ?, ?, '', ?, ?)",
+            ((int(c), str(d), float(a), "شراء" if a > 0 else "دفع")
+             for c, d, a in zip(rng.integers(1, n_customers, n_rows), days, amounts))
+        )
+        conn.commit()
+
+        engine = LedgerAnalytics(conn)
+        t = time.perf_counter()
+        engine.refresh()
+        engine.running_balances()
+        print(f"initial load:     {time.perf_counter() - t:8.3f} s  ({n_rows:,} rows)")
+        engine = LedgerAnalytics(conn)
+        t = time.perf_counter()
+        engine.refresh()
+        print(f"reopen (mmap):    {time.perf_counter() - t:8.3f} s")
+        for label, fn in (("balances", engine.balances),
+                          ("running balances", engine.running_balances),
+                          ("monthly totals", engine.period_totals),
+                          ("aging", engine.aging)):
+            t = time.perf_counter()
+            fn()
+            print(f"{label + ':':<18}{time.perf_counter() - t:8.3f} s")
+        conn.close()
+
+
+if __name__ == "__main__":
+    if np is None:
+        sys.exit("NumPy is required: pip install numpy")
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from api_server import TOKEN_ENV, ApiServer, LedgerApi
+from ledger import init_db
+
+
+async def _request(reader, writer, method, path, token, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    auth = f"Authorization: Bearer {token}\r\n" if token else ""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{auth}"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, token, customers, deadline, write_ratio, latencies, errors):
+    # One keep-alive connection per simulated terminal
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            cid = random.choice(customers)
+            start = time.perf_counter()
+            if random.random() < write_ratio:
+                status = await _request(reader, writer, "POST", f"/customers/{cid}/transactions", token, {
+                    "description": "بيع نقطة بيع", "amount": round(random.uniform(1, 500), 2), "kind": "purchase"
+                })
+            else:
+                status = await _request(reader, writer, "GET", f"/customers/{cid}", token)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def _seed(db_path, n_customers):
+    conn = init_db(db_path)
+    conn.executemany("INSERT INTO customers (name) VALUES (?)",
+                     ((f"زبون {i}",) for i in range(n_customers)))
+    conn.commit()
+    conn.close()
+
+
+async def run(args):
+    server = None
+    tmp = None
+    host, port, token = args.host, args.port, args.token
+    if args.spawn:
+        # Start a private server on a throwaway ledger
+        tmp = tempfile.TemporaryDirectory()
+        db_path = Path(tmp.name) / "loadtest.db"
+        _seed(db_path, args.customers)
+        # Every request then goes through the token check, as on a shared network
+        token = secrets.token_urlsafe(16)
+        server = ApiServer(LedgerApi(db_path), "127.0.0.1", 0, token)
+        srv = await server.start()
+        host, port = srv.sockets[0].getsockname()[:2]
+        customers = list(range(1, args.customers + 1))
+    else:
+        conn = sqlite3.connect(args.db)
+        customers = [r[0] for r in conn.execute("SELECT id FROM customers")]
+        conn.close()
+        if not customers:
+            raise SystemExit("the ledger has no customers to post to")
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    try:
+        await asyncio.gather(*(
+            _client(host, port, token, customers, deadline, args.write_ratio, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+    finally:
+        elapsed = time.perf_counter() - started
+        if server:
+            await server.close()
+        if tmp:
+            tmp.cleanup()
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    print(f"requests:     {len(latencies):,} in {elapsed:.2f} s ({args.concurrency} connections, "
+          f"{args.write_ratio:.0%} writes)")
+    print(f"throughput:   {len(latencies) / elapsed:,.0f} req/s")
+    print(f"errors:       {len(errors)}")
+    if ms:
+        print(f"latency (ms): mean {statistics.fmean(ms):.2f}  p50 {_percentile(ms, 50):.2f}  "
+              f"p90 {_percentile(ms, 90):.2f}  p99 {_percentile(ms, 99):.2f}  max {ms[-1]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the local ledger API server")
+    parser.add_argument("--spawn", action="store_true", help="start a server on a temporary ledger")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", help="ledger used to pick customer ids when testing a running server")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV), help="bearer token of the running server")
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    args = parser.parse_args()
+    if not args.spawn and not args.db:
+        parser.error("pass --spawn, or --db with the ledger the running server uses")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+from ledger import (
+    CUSTOMERS_SEARCH_QUERY, CUSTOMER_NAME_QUERY, DB_PATH, KIND_PURCHASE, KIND_PAYMENT,
+    ValidationError, init_db, validate_transaction
+)
+
+# Largest number of queued posts committed together
+MAX_BATCH = 1000
+MAX_BODY = 8 * 1024 * 1024
+
+# Bearer token of the terminals when --token is not given. Without one the server
+# only listens on a loopback address.
+TOKEN_ENV = "DAFTAR_API_TOKEN"
+
+KIND_ALIASES = {
+    "purchase": KIND_PURCHASE, KIND_PURCHASE: KIND_PURCHASE,
+    "payment": KIND_PAYMENT, KIND_PAYMENT: KIND_PAYMENT,
+}
+
+FIND_CUSTOMERS_QUERY = CUSTOMERS_SEARCH_QUERY + " LIMIT ?"
+BALANCE_QUERY = "SELECT IFNULL(SUM(amount), 0), COUNT(*) FROM transactions WHERE customer_id = ?"
+
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_post(item, customer_id=None):
+    # Applies the same rules as TransactionDialog.get_data to a JSON object
+    if not isinstance(item, dict):
+        raise ApiError(400, "transaction must be a JSON object")
+    if customer_id is None:
+        customer_id = item.get("customer_id")
+    if not isinstance(customer_id, int) or isinstance(customer_id, bool):
+        raise ApiError(400, "customer_id must be an integer")
+    kind = KIND_ALIASES.get(item.get("kind", "purchase"))
+    if kind is None:
+        raise ApiError(400, "kind must be 'purchase' or 'payment'")
+    amount = item.get("amount", "")
+    if isinstance(amount, bool):
+        raise ApiError(400, "amount must be a number")
+    try:
+        date_str, desc, signed_amount, kind = validate_transaction(
+            str(item.get("description", "")), str(amount),
+            str(item.get("date") or date.today().isoformat()), kind)
+    except ValidationError as e:
+        raise ApiError(400, str(e))
+    return customer_id, date_str, desc, signed_amount, kind
+
+
+class LedgerApi:
+    """Database side of the API server.
+
+    All work runs on one worker thread that owns a single reused
+    connection. Single posts are queued and committed together with
+    whatever else arrived while the previous commit was running.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-db")
+        self.conn = None
+        self.queue = None
+        self.writer = None
+
+    async def start(self):
+        self.conn = await self.run(self._connect)
+        self.queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self.writer:
+            self.writer.cancel()
+        if self.conn:
+            await self.run(self.conn.close)
+        self.executor.shutdown()
+
+    def _connect(self):
+        conn = init_db(self.db_path)
+        conn.close()
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # -- reads -------------------------------------------------------------
+
+    def find_customers(self, search, limit):
+        rows = self.conn.execute(FIND_CUSTOMERS_QUERY, (f"%{search}%", limit)).fetchall()
+        return [{"id": cid, "name": name, "balance": round(total, 2)} for cid, name, total in rows]
+
+    def customer_balance(self, cid):
+        r = self.conn.execute(CUSTOMER_NAME_QUERY, (cid,)).fetchone()
+        if not r:
+            raise ApiError(404, "customer not found")
+        total, count = self.conn.execute(BALANCE_QUERY, (cid,)).fetchone()
+        return {"id": cid, "name": r[0], "balance": round(total, 2), "transactions": count}
+
+    # -- writes ------------------------------------------------------------
+
+    async def post(self, txn):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((txn, fut))
+        return await fut
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < MAX_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                results = await self.run(self._commit_posts, [txn for txn, _ in batch])
+            except Exception as e:
+                results = [ApiError(500, str(e))] * len(batch)
+            for (_, fut), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+    def _commit_posts(self, txns):
+        # Independent posts: one bad customer id must not fail the others
+        c = self.conn.cursor()
+        results = []
+        try:
+            for cid, date_str, desc, amount, kind in txns:
+                if not c.execute("SELECT 1 FROM customers WHERE id = ?", (cid,)).fetchone():
+                    results.append(ApiError(404, f"customer {cid} not found"))
+                    continue
+                c.execute(
+                    "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)",
+                    (cid, date_str, desc, amount, kind)
+                )
+                results.append({"id": c.lastrowid, "customer_id": cid, "date": date_str,
+                                "description": desc, "amount": amount, "kind": kind})
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return results
+
+    def commit_batch(self, txns):
+        # Explicit batch: all or nothing in a single commit
+        c = self.conn.cursor()
+        try:
+            cids = {t[0] for t in txns}
+            known = set()
+            for cid in cids:
+                if c.execute("SELECT 1 FROM customers WHERE id = ?", (cid,)).fetchone():
+                    known.add(cid)
+            missing = cids - known
+            if missing:
+                raise ApiError(404, f"customers not found: {sorted(missing)}")
+            ids = []
+            for t in txns:
+                c.execute(
+                    "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)", t
+                )
+                ids.append(c.lastrowid)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return {"count": len(ids), "ids": ids}
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ApiServer:
+    """HTTP front of LedgerApi.
+
+    With a token, every request must carry "Authorization: Bearer <token>".
+    Without one, only programs on the same machine can reach the server, so
+    a host other than a loopback address is refused.
+    """
+
+    def __init__(self, api, host="127.0.0.1", port=8765, token=None):
+        if not token and not is_loopback(host):
+            raise ValueError(f"listening on {host} needs a token (--token or ${TOKEN_ENV})")
+        self.api = api
+        self.host = host
+        self.port = port
+        self.token = token
+        self.server = None
+
+    async def start(self):
+        await self.api.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self.server
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.api.close()
+
+    async def _handle(self, reader, writer):
+        # One task per client connection; keep-alive requests are served in a loop
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    if not self._authorized(headers):
+                        raise ApiError(401, "missing or wrong token")
+                    status, payload = await self._dispatch(method, target, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorized(self, headers):
+        if not self.token:
+            return True
+        scheme, _, given = headers.get("authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(given.strip().encode(), self.token.encode())
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [p for p in url.path.split("/") if p]
+        query = parse_qs(url.query)
+
+        # GET /customers?q=...&limit=...
+        if parts == ["customers"]:
+            if method != "GET":
+                raise ApiError(405, "method not allowed")
+            search = query.get("q", [""])[0].strip()
+            try:
+                limit = max(1, min(int(query.get("limit", ["50"])[0]), 1000))
+            except ValueError:
+                raise ApiError(400, "limit must be an integer")
+            return 200, await self.api.run(self.api.find_customers, search, limit)
+
+        # GET /customers/<id>
+        if len(parts) == 2 and parts[0] == "customers":
+            if method != "GET":
+                raise ApiError(405, "method not allowed")
+            return 200, await self.api.run(self.api.customer_balance, _int_id(parts[1]))
+
+        # POST /customers/<id>/transactions
+        if len(parts) == 3 and parts[0] == "customers" and parts[2] == "transactions":
+            if method != "POST":
+                raise ApiError(405, "method not allowed")
+            txn = parse_post(_json_body(body), _int_id(parts[1]))
+            return 201, await self.api.post(txn)
+
+        # POST /transactions  {"transactions": [...]}
+        if parts == ["transactions"]:
+            if method != "POST":
+                raise ApiError(405, "method not allowed")
+            data = _json_body(body)
+            items = data.get("transactions") if isinstance(data, dict) else data
+            if not isinstance(items, list) or not items:
+                raise ApiError(400, "expected a non-empty list of transactions")
+            txns = [parse_post(item) for item in items]
+            return 201, await self.api.run(self.api.commit_batch, txns)
+
+        raise ApiError(404, "not found")
+
+
+def _int_id(text):
+    try:
+        return int(text)
+    except ValueError:
+        raise ApiError(404, "not found")
+
+
+def _json_body(body):
+    try:
+        return json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        raise ApiError(400, "body must be JSON")
+
+
+async def serve(db_path, host, port, token=None):
+    server = ApiServer(LedgerApi(db_path), host, port, token)
+    srv = await server.start()
+    print(f"Daftar API listening on http://{host}:{port} ({db_path})")
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON API for point-of-sale terminals")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept other machines (needs a token)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"bearer token the terminals must send (default: ${TOKEN_ENV})")
+    args = parser.parse_args()
+    if not args.token and not is_loopback(args.host):
+        parser.error(f"listening on {args.host} needs a token: --token or ${TOKEN_ENV}")
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.token))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
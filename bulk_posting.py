@@ -0,0 +1,134 @@
+import sys
+import time
+
+from ledger import KIND_PURCHASE, KIND_PAYMENT, ValidationError, init_db, validate_transaction
+
+# Amount rules: the same amount for everyone, or a percentage of each balance
+RULE_FIXED = "fixed"
+RULE_PERCENT = "percent"
+
+_SELECTION = """
+    SELECT id, total FROM (
+        SELECT customers.id,
+        (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+         WHERE transactions.customer_id = customers.id) AS total
+        FROM customers
+        {where}
+    )
+    {having}
+"""
+
+
+def customer_selection(search=None, min_balance=None, max_balance=None):
+    """SQL and parameters for the (id, total) rows of the targeted customers."""
+    where, having, params = "", [], []
+    if search:
+        where = "WHERE customers.name LIKE ?"
+        params.append(f"%{search}%")
+    if min_balance is not None:
+        having.append("total >= ?")
+        params.append(min_balance)
+    if max_balance is not None:
+        having.append("total <= ?")
+        params.append(max_balance)
+    having = "WHERE " + " AND ".join(having) if having else ""
+    return _SELECTION.format(where=where, having=having), params
+
+
+def _postings(selection, rule, value):
+    # (customer_id, value) of every posting; a percentage of a zero or credit balance posts nothing
+    sql, params = selection
+    expr = "?" if rule == RULE_FIXED else "ROUND(total * ? / 100.0, 2)"
+    return (f"SELECT customer_id, value FROM (SELECT id AS customer_id, {expr} AS value FROM ({sql})) "
+            f"WHERE value > 0", [value] + params)
+
+
+def insert_postings(selection, rule, value, date_str, desc, kind):
+    """SQL and parameters of the single INSERT ... SELECT that posts a batch."""
+    sql, params = _postings(selection, rule, value)
+    sign = 1 if kind == KIND_PURCHASE else -1
+    return (f"INSERT INTO transactions (customer_id, date, description, amount, kind) "
+            f"SELECT customer_id, ?, ?, value * ?, ? FROM ({sql}) ORDER BY customer_id",
+            [date_str, desc, sign, kind] + params)
+
+
+def parse_balance(text):
+    # Optional balance bound typed by the user; blank means no bound
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        raise ValidationError("حد الرصيد يجب أن يكون رقماً", critical=True)
+
+
+def validate_bulk(desc, value_str, date_str, kind, rule):
+    # Same rules as a single transaction; returns (date, description, value, kind)
+    date_str, desc, signed, kind = validate_transaction(desc, value_str, date_str, kind)
+    if rule not in (RULE_FIXED, RULE_PERCENT):
+        raise ValidationError("قاعدة المبلغ غير معروفة", critical=True)
+    return date_str, desc, abs(signed), kind
+
+
+def preview(conn, selection, rule, value, limit=20):
+    """Returns (count, total, sample) where sample is [(name, amount), ...]."""
+    sql, params = _postings(selection, rule, value)
+    count, total = conn.execute(f"SELECT COUNT(*), IFNULL(SUM(value), 0) FROM ({sql})", params).fetchone()
+    sample = conn.execute(
+        f"SELECT customers.name, p.value FROM ({sql}) AS p JOIN customers ON customers.id = p.customer_id "
+        f"ORDER BY p.customer_id DESC LIMIT ?",
+        params + [limit]
+    ).fetchall()
+    return count, total, sample
+
+
+def post(conn, journal, selection, rule, value, date_str, desc, kind):
+    """Post one transaction per selected customer in a single INSERT ... SELECT.
+
+    The whole batch is one journal entry, so a single undo removes it.
+    Commits; returns the number of transactions posted.
+    """
+    c = conn.cursor()
+    try:
+        c.execute(*insert_postings(selection, rule, value, date_str, desc, kind))
+        count = c.rowcount
+        if count > 0:
+            # One statement under the write lock: the new ids are contiguous
+            journal.record_add_transactions(c.lastrowid - count + 1, c.lastrowid)
+        journal.commit()
+    except Exception:
+        journal.rollback()
+        raise
+    return count
+
+
+def _bench(customers=20_000):
+    import tempfile
+    from pathlib import Path
+    from undo_journal import UndoJournal
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = init_db(Path(tmp) / "bulk.db")
+        conn.executemany("INSERT INTO customers (name) VALUES (?)", ((f"زبون {i}",) for i in range(customers)))
+        conn.commit()
+        journal = UndoJournal(conn)
+        selection = customer_selection()
+        start = time.perf_counter()
+        count, total, _ = preview(conn, selection, RULE_FIXED, 50)
+        print(f"preview   {count:,} postings, {total:,.2f}  {(time.perf_counter() - start) * 1000:8.1f} ms")
+        start = time.perf_counter()
+        post(conn, journal, selection, RULE_FIXED, 50, "2024-01-01", "اشتراك شهري", KIND_PURCHASE)
+        print(f"post      {(time.perf_counter() - start) * 1000:8.1f} ms")
+        start = time.perf_counter()
+        post(conn, journal, customer_selection(min_balance=1), RULE_PERCENT, 10, "2024-01-02", "خصم", KIND_PAYMENT)
+        print(f"post 10%  {(time.perf_counter() - start) * 1000:8.1f} ms")
+        for name, step in (("undo", journal.undo), ("undo", journal.undo), ("redo", journal.redo)):
+            start = time.perf_counter()
+            step()
+            print(f"{name:<9} {(time.perf_counter() - start) * 1000:8.1f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,66 @@
+# Kinds of change published after a write to the ledger
+CUSTOMER_ADDED = 1
+CUSTOMER_RENAMED = 2
+CUSTOMER_DELETED = 3
+TRANSACTION_ADDED = 4
+TRANSACTION_DELETED = 5
+# Too many rows to name one by one (bulk posting, writes by other programs): everything may be stale
+LEDGER_CHANGED = 6
+
+
+class Change:
+    # One change; cid is the customer it touched, None for LEDGER_CHANGED
+    __slots__ = ("kind", "cid")
+
+    def __init__(self, kind, cid=None):
+        self.kind = kind
+        self.cid = cid
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and (self.kind, self.cid) == (other.kind, other.cid)
+
+    def __hash__(self):
+        return hash((self.kind, self.cid))
+
+    def __repr__(self):
+        return f"Change({self.kind}, {self.cid})"
+
+
+def coalesce(changes):
+    # A ledger-wide change supersedes the rest; otherwise repeats collapse, first occurrence kept
+    if any(ch.kind == LEDGER_CHANGED for ch in changes):
+        return [Change(LEDGER_CHANGED)]
+    return list(dict.fromkeys(changes))
+
+
+class ChangeBus:
+    """Delivers the changes written to the ledger to its subscribers.
+
+    Changes published during one pass of the event loop are coalesced and
+    delivered together on the next one: schedule(callback) must call
+    callback later on the same thread (QTimer.singleShot(0, ...) in the
+    GUI). Without a scheduler every change is delivered at once.
+    """
+
+    def __init__(self, schedule=None):
+        self.schedule = schedule
+        self._subscribers = []
+        self._pending = []
+
+    def subscribe(self, callback):
+        # callback(changes) receives a coalesced list of Change
+        self._subscribers.append(callback)
+
+    def publish(self, change):
+        self._pending.append(change)
+        if self.schedule is None:
+            self.flush()
+        elif len(self._pending) == 1:
+            self.schedule(self.flush)
+
+    def flush(self):
+        if not self._pending:
+            return
+        changes, self._pending = coalesce(self._pending), []
+        for callback in self._subscribers:
+            callback(changes)
@@ -0,0 +1,175 @@
+import csv
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from ledger_sync import TBL_TRANSACTIONS, enable_sync
+
+# Application data paths
+APP_DIR = Path.home() / ".daftar_accounts"
+DB_PATH = APP_DIR / "accounts.db"
+CONFIG_PATH = APP_DIR / "config.json"
+APP_DIR.mkdir(exist_ok=True)
+
+# Queries shared by the GUI, the API server and perf_check.py
+CUSTOMERS_QUERY = """
+    SELECT customers.id, customers.name,
+    (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+     WHERE transactions.customer_id = customers.id) AS total
+    FROM customers
+    ORDER BY customers.id DESC
+"""
+CUSTOMERS_SEARCH_QUERY = """
+    SELECT customers.id, customers.name,
+    (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+     WHERE transactions.customer_id = customers.id) AS total
+    FROM customers
+    WHERE customers.name LIKE ?
+    ORDER BY customers.id DESC
+"""
+# The customer list one batch at a time, continuing below the last id already shown
+CUSTOMERS_BATCH_QUERY = """
+    SELECT customers.id, customers.name,
+    (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+     WHERE transactions.customer_id = customers.id) AS total
+    FROM customers
+    WHERE customers.id < ?
+    ORDER BY customers.id DESC
+    LIMIT ?
+"""
+CUSTOMERS_SEARCH_BATCH_QUERY = """
+    SELECT customers.id, customers.name,
+    (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+     WHERE transactions.customer_id = customers.id) AS total
+    FROM customers
+    WHERE customers.name LIKE ? AND customers.id < ?
+    ORDER BY customers.id DESC
+    LIMIT ?
+"""
+# One row of the customer list, if the customer still exists and matches the search
+CUSTOMER_ROW_QUERY = """
+    SELECT customers.id, customers.name,
+    (SELECT IFNULL(SUM(transactions.amount), 0) FROM transactions
+     WHERE transactions.customer_id = customers.id) AS total
+    FROM customers
+    WHERE customers.id = ? AND customers.name LIKE ?
+"""
+CUSTOMER_NAME_QUERY = "SELECT name FROM customers WHERE id = ?"
+CUSTOMER_TRANSACTIONS_QUERY = """
+    SELECT id, date, description, amount, kind
+    FROM transactions
+    WHERE customer_id = ?
+    ORDER BY date DESC, id DESC
+"""
+HAS_TRANSACTIONS_QUERY = "SELECT 1 FROM transactions WHERE customer_id = ? LIMIT 1"
+STATEMENT_QUERY = """
+    SELECT date, description, amount, kind
+    FROM transactions
+    WHERE customer_id = ?
+    ORDER BY date ASC, id ASC
+"""
+# Changes whenever a transaction of the customer is added, removed or edited: the
+# last column is the newest sync_log entry of the customer's rows, which every
+# edit (local or synced) appends and log pruning keeps
+STATEMENT_KEY_QUERY = f"""
+    SELECT MAX(id), COUNT(*), TOTAL(amount),
+           (SELECT MAX(seq) FROM sync_log
+            WHERE tbl = {TBL_TRANSACTIONS} AND gid IN (SELECT gid FROM transactions WHERE customer_id = ?1))
+    FROM transactions
+    WHERE customer_id = ?1
+"""
+
+KIND_PURCHASE = "شراء"
+KIND_PAYMENT = "دفع"
+KINDS = (KIND_PURCHASE, KIND_PAYMENT)
+
+
+class ValidationError(ValueError):
+    # `critical` separates invalid values from merely missing ones
+    def __init__(self, message, critical=False):
+        super().__init__(message)
+        self.critical = critical
+
+
+def init_db(path=DB_PATH):
+    conn = sqlite3.connect(path)
+    # WAL lets the GUI and the local API server use the same file concurrently
+    conn.execute("PRAGMA journal_mode=WAL")
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            kind TEXT NOT NULL,
+            FOREIGN KEY(customer_id) REFERENCES customers(id)
+        )
+    """)
+    # Serves the date-ordered account pages, and covers the per-customer totals
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_customer ON transactions(customer_id, date, amount)")
+    conn.commit()
+    enable_sync(conn)
+    return conn
+
+
+def database_path(conn):
+    # File backing the "main" schema of an open connection
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return None
+
+
+def format_amount(amount):
+    # format with thousands separator and two decimals, keep parentheses for negative
+    if amount >= 0:
+        return f"{amount:,.2f}"
+    else:
+        return f"({abs(amount):,.2f})"
+
+
+def write_statement_csv(conn, cid, path):
+    # Streams one customer's statement to CSV; returns the number of rows written
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["التاريخ", "البيان", "المبلغ", "النوع"])
+        for date, desc, amount, kind in conn.execute(STATEMENT_QUERY, (cid,)):
+            writer.writerow([date, desc, f"{amount:.2f}", kind])
+            count += 1
+    return count
+
+
+def validate_transaction(desc, amount_str, date_str, kind):
+    # Shared by the transaction dialog and the API server.
+    # Returns (date, description, signed_amount, kind) or raises ValidationError.
+    desc = desc.strip()
+    amount_str = amount_str.strip()
+    if not desc or not amount_str:
+        raise ValidationError("الرجاء ملء البيان والمبلغ")
+
+    try:
+        amount = float(amount_str.replace(",", "."))
+        if not amount > 0 or amount == float("inf"):
+            raise ValueError
+    except ValueError:
+        raise ValidationError("المبلغ يجب أن يكون رقماً أكبر من صفر", critical=True)
+
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValidationError("التاريخ يجب أن يكون بالصيغة YYYY-MM-DD", critical=True)
+
+    if kind not in KINDS:
+        raise ValidationError("نوع العملية غير معروف", critical=True)
+
+    signed_amount = amount if kind == KIND_PURCHASE else -amount
+    return date_str, desc, signed_amount, kind
@@ -0,0 +1,503 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import uuid
+import zlib
+from pathlib import Path
+
+# Shared secret of serve/pull when --secret is not given
+SECRET_ENV = "DAFTAR_SYNC_SECRET"
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Table and operation codes used in sync_log
+TBL_CUSTOMERS = 1
+TBL_TRANSACTIONS = 2
+OP_INSERT = 1
+OP_UPDATE = 2
+OP_DELETE = 3
+
+_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+_SITE = "(SELECT value FROM sync_meta WHERE key = 'site')"
+_LOCAL = "(SELECT value FROM sync_meta WHERE key = 'applying') IS NULL"
+
+_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS sync_customers_insert AFTER INSERT ON customers WHEN {_LOCAL}
+BEGIN
+    UPDATE customers SET gid = {_SITE} || '-' || NEW.id WHERE id = NEW.id AND gid IS NULL;
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_CUSTOMERS}, (SELECT gid FROM customers WHERE id = NEW.id), {OP_INSERT}, {_NOW}, {_SITE});
+END;
+CREATE TRIGGER IF NOT EXISTS sync_customers_update AFTER UPDATE OF name ON customers
+WHEN {_LOCAL} AND OLD.name IS NOT NEW.name
+BEGIN
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_CUSTOMERS}, NEW.gid, {OP_UPDATE}, {_NOW}, {_SITE});
+END;
+CREATE TRIGGER IF NOT EXISTS sync_customers_delete AFTER DELETE ON customers WHEN {_LOCAL}
+BEGIN
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_CUSTOMERS}, OLD.gid, {OP_DELETE}, {_NOW}, {_SITE});
+END;
+CREATE TRIGGER IF NOT EXISTS sync_transactions_insert AFTER INSERT ON transactions WHEN {_LOCAL}
+BEGIN
+    UPDATE transactions SET gid = {_SITE} || '-' || NEW.id WHERE id = NEW.id AND gid IS NULL;
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_TRANSACTIONS}, (SELECT gid FROM transactions WHERE id = NEW.id), {OP_INSERT}, {_NOW}, {_SITE});
+END;
+CREATE TRIGGER IF NOT EXISTS sync_transactions_update
+AFTER UPDATE OF customer_id, date, description, amount, kind ON transactions WHEN {_LOCAL}
+BEGIN
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_TRANSACTIONS}, NEW.gid, {OP_UPDATE}, {_NOW}, {_SITE});
+END;
+CREATE TRIGGER IF NOT EXISTS sync_transactions_delete AFTER DELETE ON transactions WHEN {_LOCAL}
+BEGIN
+    INSERT INTO sync_log (tbl, gid, op, ts, origin)
+    VALUES ({TBL_TRANSACTIONS}, OLD.gid, {OP_DELETE}, {_NOW}, {_SITE});
+END;
+"""
+
+
+# Newest log entry per row in a seq range. The unary + keeps SQLite on the
+# seq (rowid) range instead of the much wider tbl prefix of idx_sync_log_row.
+LATEST_CHANGES_QUERY = """
+    SELECT gid, op, ts, origin, MAX(seq) AS seq FROM sync_log
+    WHERE +tbl = ? AND seq > ? AND seq <= ? AND origin IS NOT ?
+    GROUP BY gid
+"""
+LAST_EVENT_QUERY = "SELECT op, ts, origin FROM sync_log WHERE tbl = ? AND gid = ? ORDER BY seq DESC LIMIT 1"
+# Log entries up to a limit that a newer entry of the same row supersedes. Only newer
+# entries past the previous limit are looked at: anything they did not supersede was
+# already pruned then.
+PRUNE_QUERY = """
+    DELETE FROM sync_log WHERE seq IN (
+        SELECT old.seq FROM sync_log AS newer
+        JOIN sync_log AS old ON old.tbl = newer.tbl AND old.gid = newer.gid AND old.seq < newer.seq
+        WHERE newer.seq > ? AND old.seq <= ?
+    )
+"""
+
+
+def enable_sync(conn):
+    """Install the change log on a ledger (idempotent).
+
+    Every customer and transaction gets a global id ("<site>-<local id>")
+    and triggers append one sync_log row per insert, update and delete.
+    Rows that existed before sync was enabled are logged once so the first
+    exchange with a peer carries them.
+    """
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value TEXT)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sync_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl INTEGER NOT NULL,
+            gid TEXT NOT NULL,
+            op INTEGER NOT NULL,
+            ts REAL NOT NULL,
+            origin TEXT NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sync_log_row ON sync_log(tbl, gid, seq)")
+    # received_seq: how far we have read the peer's log; acked_seq: how far the
+    # peer has confirmed reading ours (NULL until it pulls from us directly)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            peer TEXT PRIMARY KEY,
+            received_seq INTEGER NOT NULL DEFAULT 0,
+            acked_seq INTEGER
+        )
+    """)
+    if "acked_seq" not in {r[1] for r in c.execute("PRAGMA table_info(sync_peers)")}:
+        c.execute("ALTER TABLE sync_peers ADD COLUMN acked_seq INTEGER")
+    if c.execute("SELECT 1 FROM sync_meta WHERE key = 'site'").fetchone():
+        conn.commit()
+        return
+
+    site = uuid.uuid4().hex[:12]
+    c.execute("INSERT INTO sync_meta (key, value) VALUES ('site', ?)", (site,))
+    for table, code in (("customers", TBL_CUSTOMERS), ("transactions", TBL_TRANSACTIONS)):
+        columns = [r[1] for r in c.execute(f"PRAGMA table_info({table})")]
+        if "gid" not in columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN gid TEXT")
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_gid ON {table}(gid)")
+        c.execute(f"UPDATE {table} SET gid = ? || '-' || id WHERE gid IS NULL", (site,))
+        c.execute(f"""
+            INSERT INTO sync_log (tbl, gid, op, ts, origin)
+            SELECT ?, gid, {OP_INSERT}, {_NOW}, ? FROM {table} ORDER BY id
+        """, (code, site))
+    c.executescript(_TRIGGERS)
+    conn.commit()
+
+
+def site_id(conn):
+    return conn.execute("SELECT value FROM sync_meta WHERE key = 'site'").fetchone()[0]
+
+
+# -- changesets -------------------------------------------------------------
+
+def export_changes(conn, since=0, exclude_origin=None):
+    """Collapse the log after `since` into one change per row.
+
+    Returns {"site", "upto", "customers", "transactions"}; each change is
+    [gid, op, ts, origin, *values] where values are the current row.
+    """
+    c = conn.cursor()
+    upto = c.execute("SELECT IFNULL(MAX(seq), 0) FROM sync_log").fetchone()[0]
+    # SQLite takes the bare columns from the row holding MAX(seq)
+    latest = LATEST_CHANGES_QUERY
+    customers = [
+        [gid, op, ts, origin, name]
+        for gid, op, ts, origin, _, name in c.execute(f"""
+            SELECT l.gid, l.op, l.ts, l.origin, l.seq, customers.name
+            FROM ({latest}) l LEFT JOIN customers ON customers.gid = l.gid
+            ORDER BY l.seq
+        """, (TBL_CUSTOMERS, since, upto, exclude_origin))
+        if op == OP_DELETE or name is not None
+    ]
+    transactions = [
+        [gid, op, ts, origin, cgid, date, desc, amount, kind]
+        for gid, op, ts, origin, _, cgid, date, desc, amount, kind in c.execute(f"""
+            SELECT l.gid, l.op, l.ts, l.origin, l.seq,
+                   customers.gid, t.date, t.description, t.amount, t.kind
+            FROM ({latest}) l
+            LEFT JOIN transactions t ON t.gid = l.gid
+            LEFT JOIN customers ON customers.id = t.customer_id
+            ORDER BY l.seq
+        """, (TBL_TRANSACTIONS, since, upto, exclude_origin))
+        if op == OP_DELETE or cgid is not None
+    ]
+    return {"site": site_id(conn), "upto": upto, "customers": customers, "transactions": transactions}
+
+
+def encode_changes(changes):
+    return zlib.compress(json.dumps(changes, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_changes(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _newer(ts, origin, other_ts, other_origin):
+    # Last writer wins; the site id breaks exact ties deterministically
+    return (ts, origin) > (other_ts, other_origin)
+
+
+def apply_changes(conn, changes):
+    """Apply a peer's changeset in one transaction. Returns rows changed.
+
+    Conflict rules:
+    - renames: last writer wins (timestamp, then site id);
+    - a customer delete wins over renames and takes all of the customer's
+      local transactions with it;
+    - a delete is only ignored if the row was re-created (e.g. by undo)
+      locally after it;
+    - inserts never resurrect a row whose local delete is newer.
+    """
+    me = site_id(conn)
+    c = conn.cursor()
+    applied = 0
+
+    def last_event(tbl, gid):
+        return c.execute(LAST_EVENT_QUERY, (tbl, gid)).fetchone()
+
+    def log(tbl, gid, op, ts, origin):
+        c.execute("INSERT INTO sync_log (tbl, gid, op, ts, origin) VALUES (?, ?, ?, ?, ?)",
+                  (tbl, gid, op, ts, origin))
+
+    try:
+        c.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('applying', '1')")
+
+        customer_deletes = []
+        for gid, op, ts, origin, name in changes["customers"]:
+            if origin == me:
+                continue
+            if op == OP_DELETE:
+                customer_deletes.append((gid, ts, origin))
+                continue
+            local = last_event(TBL_CUSTOMERS, gid)
+            row = c.execute("SELECT id, name FROM customers WHERE gid = ?", (gid,)).fetchone()
+            if row is None:
+                if local and local[0] == OP_DELETE and not _newer(ts, origin, local[1], local[2]):
+                    continue
+                c.execute("INSERT INTO customers (name, gid) VALUES (?, ?)", (name, gid))
+                log(TBL_CUSTOMERS, gid, OP_INSERT, ts, origin)
+                applied += 1
+            elif row[1] != name and (local is None or _newer(ts, origin, local[1], local[2])):
+                c.execute("UPDATE customers SET name = ? WHERE id = ?", (name, row[0]))
+                log(TBL_CUSTOMERS, gid, OP_UPDATE, ts, origin)
+                applied += 1
+
+        for gid, op, ts, origin, cgid, date, desc, amount, kind in changes["transactions"]:
+            if origin == me:
+                continue
+            local = last_event(TBL_TRANSACTIONS, gid)
+            row = c.execute("SELECT id FROM transactions WHERE gid = ?", (gid,)).fetchone()
+            if op == OP_DELETE:
+                if row is None or (local and local[0] == OP_INSERT and not _newer(ts, origin, local[1], local[2])):
+                    continue
+                c.execute("DELETE FROM transactions WHERE id = ?", (row[0],))
+                log(TBL_TRANSACTIONS, gid, OP_DELETE, ts, origin)
+                applied += 1
+                continue
+            cust = c.execute("SELECT id FROM customers WHERE gid = ?", (cgid,)).fetchone()
+            if cust is None:
+                # The customer was deleted here: the delete wins
+                continue
+            if row is None:
+                if local and local[0] == OP_DELETE and not _newer(ts, origin, local[1], local[2]):
+                    continue
+                c.execute(
+                    "INSERT INTO transactions (customer_id, date, description, amount, kind, gid) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (cust[0], date, desc, amount, kind, gid))
+                log(TBL_TRANSACTIONS, gid, OP_INSERT, ts, origin)
+                applied += 1
+            elif local is None or _newer(ts, origin, local[1], local[2]):
+                c.execute(
+                    "UPDATE transactions SET customer_id = ?, date = ?, description = ?, amount = ?, kind = ? "
+                    "WHERE id = ?", (cust[0], date, desc, amount, kind, row[0]))
+                log(TBL_TRANSACTIONS, gid, OP_UPDATE, ts, origin)
+                applied += 1
+
+        for gid, ts, origin in customer_deletes:
+            row = c.execute("SELECT id FROM customers WHERE gid = ?", (gid,)).fetchone()
+            if row is None:
+                continue
+            local = last_event(TBL_CUSTOMERS, gid)
+            if local and local[0] == OP_INSERT and not _newer(ts, origin, local[1], local[2]):
+                continue
+            for (tgid,) in c.execute("SELECT gid FROM transactions WHERE customer_id = ?", (row[0],)).fetchall():
+                log(TBL_TRANSACTIONS, tgid, OP_DELETE, ts, origin)
+            c.execute("DELETE FROM transactions WHERE customer_id = ?", (row[0],))
+            c.execute("DELETE FROM customers WHERE id = ?", (row[0],))
+            log(TBL_CUSTOMERS, gid, OP_DELETE, ts, origin)
+            applied += 1
+
+        c.execute("DELETE FROM sync_meta WHERE key = 'applying'")
+        c.execute("""
+            INSERT INTO sync_peers (peer, received_seq) VALUES (?, ?)
+            ON CONFLICT(peer) DO UPDATE SET received_seq = MAX(received_seq, excluded.received_seq)
+        """, (changes["site"], changes["upto"]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+def received_seq(conn, peer):
+    r = conn.execute("SELECT received_seq FROM sync_peers WHERE peer = ?", (peer,)).fetchone()
+    return r[0] if r else 0
+
+
+def acknowledge(conn, peer, seq):
+    # `peer` has read our log up to `seq`; prunes what every peer has read
+    conn.execute("""
+        INSERT INTO sync_peers (peer, acked_seq) VALUES (?, ?)
+        ON CONFLICT(peer) DO UPDATE SET acked_seq = MAX(IFNULL(acked_seq, 0), excluded.acked_seq)
+    """, (peer, seq))
+    return prune_log(conn)
+
+
+def prune_log(conn):
+    """Drop the log entries every peer has read. Returns the number removed.
+
+    The limit is the lowest position acknowledged by the peers that pull
+    from this ledger directly, and what has been published to a shared
+    folder (the changeset files carry it from there); a ledger with no
+    peers yet is pruned up to its last entry. Below the limit only entries
+    superseded by a newer one of the same row go: the newest event per row
+    is what conflict resolution and export_changes read, so a peer that
+    has not synced yet still receives every current row.
+    """
+    limits = [r[0] for r in conn.execute("SELECT acked_seq FROM sync_peers WHERE acked_seq IS NOT NULL")]
+    published = conn.execute("SELECT value FROM sync_meta WHERE key = 'published'").fetchone()
+    if published:
+        limits.append(int(published[0]))
+    if not limits:
+        limits.append(conn.execute("SELECT IFNULL(MAX(seq), 0) FROM sync_log").fetchone()[0])
+    limit = min(limits)
+    done = int(conn.execute("SELECT IFNULL((SELECT value FROM sync_meta WHERE key = 'pruned'), 0)").fetchone()[0])
+    if limit <= done:
+        conn.commit()
+        return 0
+    removed = conn.execute(PRUNE_QUERY, (done, limit)).rowcount
+    conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('pruned', ?)", (str(limit),))
+    conn.commit()
+    return removed
+
+
+# -- transports -------------------------------------------------------------
+
+def pull(source, target):
+    # Move everything `target` has not seen yet from `source` (two open connections)
+    peer = site_id(source)
+    changes = export_changes(source, received_seq(target, peer), exclude_origin=site_id(target))
+    blob = encode_changes(changes)
+    applied = apply_changes(target, decode_changes(blob))
+    acknowledge(source, site_id(target), changes["upto"])
+    return applied, len(blob)
+
+
+def sync_databases(path_a, path_b):
+    """Two-way sync of two ledger files. Returns ((applied, bytes) a->b, b->a)."""
+    a = _open(path_a)
+    b = _open(path_b)
+    try:
+        return pull(a, b), pull(b, a)
+    finally:
+        a.close()
+        b.close()
+
+
+def publish(conn, folder):
+    # Shared folder: every site appends changeset files to its own subfolder
+    me = site_id(conn)
+    since = int(conn.execute("SELECT IFNULL((SELECT value FROM sync_meta WHERE key = 'published'), 0)").fetchone()[0])
+    changes = export_changes(conn, since)
+    if changes["upto"] <= since:
+        return None
+    out_dir = Path(folder) / me
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{changes['upto']:012d}.chg"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(encode_changes(changes))
+    os.replace(tmp, path)
+    conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('published', ?)", (str(changes["upto"]),))
+    conn.commit()
+    prune_log(conn)
+    return path
+
+
+def collect(conn, folder):
+    me = site_id(conn)
+    applied = 0
+    for site_dir in sorted(p for p in Path(folder).iterdir() if p.is_dir() and p.name != me):
+        seen = received_seq(conn, site_dir.name)
+        for path in sorted(site_dir.glob("*.chg")):
+            if int(path.stem) > seen:
+                applied += apply_changes(conn, decode_changes(path.read_bytes()))
+    return applied
+
+
+def _auth(secret, nonce, request):
+    return hmac.new(secret.encode("utf-8"), nonce + request, hashlib.sha256).hexdigest().encode("ascii")
+
+
+class _SyncHandler(socketserver.StreamRequestHandler):
+    # The server sends a nonce line; the client answers with one JSON line
+    # {"site": ..., "received": {peer: seq}} and a line holding the HMAC-SHA256
+    # of nonce + request under the shared secret. Reply: length-prefixed
+    # changeset, or a zero length when the secret does not match.
+    def handle(self):
+        nonce = os.urandom(16).hex().encode("ascii")
+        self.wfile.write(nonce + b"\n")
+        line = self.rfile.readline(MAX_REQUEST_BYTES).rstrip(b"\n")
+        auth = self.rfile.readline(128).strip()
+        if not hmac.compare_digest(auth, _auth(self.server.secret, nonce, line)):
+            self.wfile.write(struct.pack(">Q", 0))
+            return
+        request = json.loads(line.decode("utf-8"))
+        conn = _open(self.server.db_path)
+        try:
+            me = site_id(conn)
+            since = int(request["received"].get(me, 0))
+            blob = encode_changes(export_changes(conn, since, exclude_origin=request["site"]))
+            # Asking from `since` confirms everything before it arrived
+            acknowledge(conn, request["site"], since)
+        finally:
+            conn.close()
+        self.wfile.write(struct.pack(">Q", len(blob)) + blob)
+
+
+class SyncServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, db_path, address, secret):
+        if not secret:
+            raise ValueError("a shared secret is required to serve changes")
+        super().__init__(address, _SyncHandler)
+        self.db_path = db_path
+        self.secret = secret
+
+
+def pull_from_server(conn, host, port, secret):
+    # The server picks its own entry out of our received positions
+    received = dict(conn.execute("SELECT peer, received_seq FROM sync_peers"))
+    request = json.dumps({"site": site_id(conn), "received": received}).encode("utf-8")
+    with socket.create_connection((host, port)) as s:
+        f = s.makefile("rb")
+        nonce = f.readline().rstrip(b"\n")
+        s.sendall(request + b"\n" + _auth(secret, nonce, request) + b"\n")
+        size = struct.unpack(">Q", f.read(8))[0]
+        if not size:
+            raise PermissionError("the sync server refused the shared secret")
+        blob = f.read(size)
+    return apply_changes(conn, decode_changes(blob)), len(blob)
+
+
+def _open(path):
+    conn = sqlite3.connect(path)
+    enable_sync(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exchange ledger changesets between shop terminals")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("sync", help="two-way sync of two ledger files")
+    p.add_argument("a")
+    p.add_argument("b")
+    for name in ("publish", "collect"):
+        p = sub.add_parser(name, help=f"{name} changesets through a shared folder")
+        p.add_argument("folder")
+        p.add_argument("--db", required=True)
+    p = sub.add_parser("serve", help="serve this ledger's changes over TCP")
+    p.add_argument("--db", required=True)
+    p.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept other machines")
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--secret", default=os.environ.get(SECRET_ENV),
+                   help=f"shared secret of the terminals (default: ${SECRET_ENV})")
+    p = sub.add_parser("pull", help="pull changes from a serving peer")
+    p.add_argument("address", help="host:port")
+    p.add_argument("--db", required=True)
+    p.add_argument("--secret", default=os.environ.get(SECRET_ENV),
+                   help=f"shared secret of the terminals (default: ${SECRET_ENV})")
+    args = parser.parse_args()
+    if args.cmd in ("serve", "pull") and not args.secret:
+        parser.error(f"{args.cmd} needs a shared secret: --secret or ${SECRET_ENV}")
+
+    if args.cmd == "sync":
+        (ab, ab_bytes), (ba, ba_bytes) = sync_databases(args.a, args.b)
+        print(f"{args.a} -> {args.b}: {ab} rows ({ab_bytes:,} bytes)")
+        print(f"{args.b} -> {args.a}: {ba} rows ({ba_bytes:,} bytes)")
+    elif args.cmd == "serve":
+        _open(args.db).close()
+        with SyncServer(args.db, (args.host, args.port), args.secret) as server:
+            print(f"serving {args.db} on {args.host}:{args.port}")
+            server.serve_forever()
+    else:
+        conn = _open(args.db)
+        try:
+            if args.cmd == "publish":
+                print(publish(conn, args.folder) or "nothing to publish")
+            elif args.cmd == "collect":
+                print(f"{collect(conn, args.folder)} rows applied")
+            else:
+                host, port = args.address.rsplit(":", 1)
+                applied, size = pull_from_server(conn, host, int(port), args.secret)
+                print(f"{applied} rows applied ({size:,} bytes)")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import ledger_sync
+from ledger import DB_PATH, database_path, init_db
+
+DAY = 24 * 60 * 60
+
+# Minimum time between two successful runs of a task
+TASK_INTERVALS = {
+    "checkpoint": 0,
+    "optimize": DAY,
+    "analyze": 7 * DAY,
+    "reclaim": 0,
+    "vacuum": 7 * DAY,
+    "integrity_check": 7 * DAY,
+    "prune_sync_log": DAY,
+    "fragmentation": 7 * DAY,
+}
+# The fragmentation measurement comes first, as the vacuum decision reads it. The
+# checkpoint comes last so it also folds in what vacuum and reclaim wrote to the WAL.
+TASK_ORDER = ("fragmentation", "optimize", "prune_sync_log", "reclaim", "analyze", "integrity_check", "vacuum",
+              "checkpoint")
+
+# A checkpoint is worth it once the WAL has grown past this
+WAL_CHECKPOINT_BYTES = 1024 * 1024
+# A full VACUUM is only worth it on a file this large that is this wasteful
+VACUUM_MIN_BYTES = 1024 * 1024
+VACUUM_FREE_RATIO = 0.2
+VACUUM_FRAGMENTATION = 0.5
+# Free pages returned per incremental_vacuum slice
+RECLAIM_PAGES = 256
+# SQLite VM steps between two checks of the pause flag
+PROGRESS_STEPS = 1000
+
+MAX_LOG_ROWS = 500
+
+STATUS_OK = "ok"
+STATUS_INTERRUPTED = "interrupted"
+STATUS_FAILED = "failed"
+
+
+def ensure_log(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            started REAL NOT NULL,
+            duration_ms REAL NOT NULL,
+            status TEXT NOT NULL,
+            detail TEXT
+        )
+    """)
+    conn.commit()
+
+
+def health(conn, fragmentation=False):
+    """Size and waste figures of the database file.
+
+    Fragmentation (share of b-tree leaf pages not stored right after their
+    predecessor) walks every page, so it is normally the value last measured
+    by the "fragmentation" task, with the time of that run; fragmentation=True
+    walks the file now. It is None when never measured or when SQLite was
+    built without the dbstat table.
+    """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    path = database_path(conn)
+    wal_path = f"{path}-wal" if path else None
+    info = {
+        "file_bytes": page_size * page_count,
+        "wal_bytes": os.path.getsize(wal_path) if wal_path and os.path.exists(wal_path) else 0,
+        "page_size": page_size,
+        "page_count": page_count,
+        "free_pages": free_pages,
+        "free_ratio": free_pages / page_count if page_count else 0.0,
+        "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+        "fragmentation": None,
+        "fragmentation_measured": None,
+    }
+    if fragmentation:
+        info["fragmentation"], info["fragmentation_measured"] = _fragmentation(conn), time.time()
+    else:
+        info["fragmentation"], info["fragmentation_measured"] = last_fragmentation(conn)
+    return info
+
+
+def last_fragmentation(conn):
+    # (value, measured at) of the last "fragmentation" run, (None, None) before the first one
+    try:
+        r = conn.execute(
+            "SELECT detail, started FROM maintenance_log WHERE task = 'fragmentation' AND status = ? "
+            "ORDER BY id DESC LIMIT 1", (STATUS_OK,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None, None
+    if r is None:
+        return None, None
+    try:
+        return float(r[0]), r[1]
+    except (TypeError, ValueError):
+        return None, r[1]
+
+
+def _fragmentation(conn):
+    try:
+        rows = conn.execute("SELECT name, pageno FROM dbstat WHERE pagetype = 'leaf' ORDER BY name, path")
+    except sqlite3.OperationalError:
+        return None
+    leaves = jumps = 0
+    last_name = last_page = None
+    for name, pageno in rows:
+        if name == last_name and pageno != last_page + 1:
+            jumps += 1
+        leaves += 1
+        last_name, last_page = name, pageno
+    return jumps / leaves if leaves else 0.0
+
+
+def last_runs(conn):
+    # {task: started} of the last successful run of each task
+    return dict(conn.execute(
+        "SELECT task, MAX(started) FROM maintenance_log WHERE status = ? GROUP BY task", (STATUS_OK,)
+    ))
+
+
+def recent_log(conn, limit=50):
+    return conn.execute(
+        "SELECT task, started, duration_ms, status, detail FROM maintenance_log ORDER BY id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+
+def due_tasks(conn, now=None):
+    now = time.time() if now is None else now
+    ran = last_runs(conn)
+    info = health(conn)
+    due = []
+    for task in TASK_ORDER:
+        if now - ran.get(task, 0) < TASK_INTERVALS[task]:
+            continue
+        if task == "checkpoint" and info["wal_bytes"] < WAL_CHECKPOINT_BYTES and not (
+                {"reclaim", "vacuum"} & set(due)):
+            continue
+        # Once auto_vacuum is incremental, free pages are returned in small slices
+        if task == "reclaim" and not (info["auto_vacuum"] == 2 and info["free_pages"]):
+            continue
+        # Measuring only pays off where a vacuum could follow
+        if task == "fragmentation" and info["file_bytes"] < VACUUM_MIN_BYTES:
+            continue
+        if task == "vacuum" and not _needs_vacuum(info, ran):
+            continue
+        due.append(task)
+    return due
+
+
+def _needs_vacuum(info, ran):
+    if info["file_bytes"] < VACUUM_MIN_BYTES:
+        return False
+    if info["auto_vacuum"] != 2 and info["free_ratio"] >= VACUUM_FREE_RATIO:
+        return True
+    # A measurement taken before the last vacuum no longer describes the file
+    if info["fragmentation"] is None or info["fragmentation_measured"] < ran.get("vacuum", 0):
+        return False
+    return info["fragmentation"] >= VACUUM_FRAGMENTATION
+
+
+def _run(conn, task):
+    # Returns a short detail for the log; raises sqlite3.OperationalError when interrupted
+    if task == "checkpoint":
+        # TRUNCATE also resets the WAL file, unless a reader still needs it
+        busy, wal_pages, moved = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return f"{moved}/{wal_pages} pages" + (", readers active" if busy else "")
+    if task == "optimize":
+        conn.execute("PRAGMA optimize")
+        return None
+    if task == "analyze":
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        conn.commit()
+        return None
+    if task == "reclaim":
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({RECLAIM_PAGES})").fetchall()
+        conn.commit()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return f"{before - after} pages, {after} left"
+    if task == "vacuum":
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        # Switching to incremental auto-vacuum lets later deletes be reclaimed in slices
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+        return f"{before} -> {after} pages"
+    if task == "fragmentation":
+        fragmentation = _fragmentation(conn)
+        return "unavailable" if fragmentation is None else f"{fragmentation:.4f}"
+    if task == "prune_sync_log":
+        return f"{ledger_sync.prune_log(conn)} entries"
+    if task == "integrity_check":
+        problems = [r[0] for r in conn.execute("PRAGMA quick_check")]
+        if problems != ["ok"]:
+            raise sqlite3.DatabaseError("; ".join(problems[:5]))
+        return "ok"
+    raise ValueError(f"unknown maintenance task {task}")
+
+
+def run_task(conn, task, should_pause=None):
+    """Run one task, recording it in maintenance_log. Returns the status.
+
+    should_pause is polled from SQLite's progress handler; when it returns
+    True the statement is interrupted and the task is logged as interrupted,
+    to be retried in the next idle period.
+    """
+    if should_pause is not None:
+        conn.set_progress_handler(lambda: 1 if should_pause() else 0, PROGRESS_STEPS)
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        detail = _run(conn, task)
+        status = STATUS_OK
+    except sqlite3.OperationalError as e:
+        if conn.in_transaction:
+            conn.rollback()
+        status = STATUS_INTERRUPTED if "interrupted" in str(e) else STATUS_FAILED
+        detail = str(e)
+    except sqlite3.DatabaseError as e:
+        status, detail = STATUS_FAILED, str(e)
+    finally:
+        conn.set_progress_handler(None, 0)
+    duration = (time.perf_counter() - start) * 1000
+    conn.execute(
+        "INSERT INTO maintenance_log (task, started, duration_ms, status, detail) VALUES (?, ?, ?, ?, ?)",
+        (task, started, duration, status, detail)
+    )
+    conn.execute("""
+        DELETE FROM maintenance_log WHERE id <= (
+            SELECT id FROM maintenance_log ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+    """, (MAX_LOG_ROWS,))
+    conn.commit()
+    return status
+
+
+def run_due(conn, should_pause=None, now=None):
+    """Run every due task until one is interrupted. Returns [(task, status)]."""
+    results = []
+    due = due_tasks(conn, now)
+    if "fragmentation" in due:
+        status = run_task(conn, "fragmentation", should_pause)
+        results.append(("fragmentation", status))
+        if status == STATUS_INTERRUPTED:
+            return results
+        # Decide on the vacuum with the fresh measurement
+        due = [task for task in due_tasks(conn, now) if task != "fragmentation"]
+    for task in due:
+        if should_pause is not None and should_pause():
+            break
+        status = run_task(conn, task, should_pause)
+        results.append((task, status))
+        if status == STATUS_INTERRUPTED:
+            break
+        # Reclaiming continues slice by slice while free pages remain
+        while task == "reclaim" and status == STATUS_OK and health(conn)["free_pages"]:
+            if should_pause is not None and should_pause():
+                return results
+            status = run_task(conn, task, should_pause)
+            results.append((task, status))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ledger database maintenance")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--run", action="store_true", help="run the tasks that are due")
+    parser.add_argument("--force", nargs="+", choices=TASK_ORDER, metavar="TASK",
+                        help=f"run these tasks now ({', '.join(TASK_ORDER)})")
+    args = parser.parse_args()
+
+    conn = init_db(args.db)
+    ensure_log(conn)
+    if args.force:
+        for task in args.force:
+            print(f"{task:<16} {run_task(conn, task)}")
+    elif args.run:
+        for task, status in run_due(conn):
+            print(f"{task:<16} {status}")
+    info = health(conn, fragmentation=True)
+    print(f"file {info['file_bytes'] / 1024:,.0f} KB, WAL {info['wal_bytes'] / 1024:,.0f} KB, "
+          f"free pages {info['free_pages']:,}/{info['page_count']:,} ({info['free_ratio']:.1%})")
+    if info["fragmentation"] is not None:
+        print(f"fragmentation {info['fragmentation']:.1%}")
+    print(f"due: {', '.join(due_tasks(conn)) or 'nothing'}")
+    for task, started, ms, status, detail in recent_log(conn, 10):
+        print(f"  {time.strftime('%Y-%m-%d %H:%M', time.localtime(started))}  {task:<16}"
+              f"{ms:9.1f} ms  {status:<12} {detail or ''}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
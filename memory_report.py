@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, used where resource and /proc are missing
+    psutil = None
+
+MB = 1024 * 1024
+
+# Without resource or psutil only the Python heap can be measured (tracemalloc)
+PYTHON_HEAP_ONLY = resource is None and psutil is None
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing
+    if PYTHON_HEAP_ONLY:
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # Windows reports the peak working set; elsewhere the current RSS is the best left
+        return getattr(info, "peak_wset", info.rss)
+    return tracemalloc.get_traced_memory()[1]
+
+
+def copy_ledger(src, dst):
+    # The report opens the ledger through the application, which migrates and
+    # writes to it; it works on a copy taken through a read-only connection
+    source = sqlite3.connect(f"{Path(src).resolve().as_uri()}?mode=ro", uri=True)
+    target = sqlite3.connect(dst)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def seed(db_path, customers, transactions):
+    from ledger import init_db
+
+    rng = random.Random(7)
+    conn = init_db(db_path)
+    conn.executemany("INSERT INTO customers (name) VALUES (?)",
+                     ((f"زبون رقم {i}",) for i in range(customers)))
+    conn.executemany(
+        "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)",
+        ((rng.randint(1, customers), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+          rng.choice(("بضاعة", "خضار", "دفعة نقدية")), rng.randint(1, 50000) / 100,
+          rng.choice(("شراء", "دفع"))) for _ in range(transactions))
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(db_path, low_memory, pages):
+    """Runs in a child process so every mode starts from a clean heap."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    if PYTHON_HEAP_ONLY:
+        tracemalloc.start()
+    steps = [("start", rss_bytes())]
+
+    from PySide6.QtWidgets import QApplication
+    import theme
+    import QT_Application
+    from ledger import init_db, write_statement_csv
+
+    app = QApplication([])
+    theme.apply(app)
+    steps.append(("Qt + modules", rss_bytes()))
+
+    conn = init_db(db_path)
+    window = QT_Application.MainWindow(conn, low_memory=low_memory)
+    window.show()
+    app.processEvents()
+    steps.append(("customer list", rss_bytes()))
+
+    ids = [r[0] for r in conn.execute(
+        "SELECT customer_id FROM transactions GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT ?", (pages,))]
+    for cid in ids:
+        window.get_customer_page(cid)
+    window.current_customer_id = ids[0]
+    window.load_transactions()
+    app.processEvents()
+    steps.append((f"{len(ids)} account pages", rss_bytes()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_statement_csv(conn, ids[0], Path(tmp) / "statement.csv")
+        steps.append(("statement CSV", rss_bytes()))
+        import snapshot_export
+        formats = snapshot_export.available_formats()
+        if formats:
+            batch_rows = snapshot_export.LOW_MEMORY_BATCH_ROWS if low_memory else snapshot_export.BATCH_ROWS
+            snapshot_export.export_snapshot(conn, Path(tmp) / f"snapshot{formats[0]}", batch_rows)
+            steps.append((f"snapshot export ({formats[0]})", rss_bytes()))
+
+    return {
+        "steps": steps,
+        "peak": peak_rss_bytes(),
+        "cache_pages": len(window.page_cache),
+        "cache_bytes": window.page_cache.nbytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident memory of the application on a large ledger")
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=500, help="account pages opened")
+    parser.add_argument("--db", help="measure a copy of this ledger instead of seeding a temporary one")
+    parser.add_argument("--child", choices=("normal", "low"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.db, args.child == "low", args.pages)))
+        return 0
+
+    if PYTHON_HEAP_ONLY:
+        print("neither resource nor psutil is available: only the Python heap is measured")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "memory.db")
+        if args.db:
+            if not Path(args.db).exists():
+                print(f"{args.db} does not exist")
+                return 1
+            copy_ledger(args.db, db_path)
+        else:
+            print(f"seeding {args.customers:,} customers / {args.transactions:,} transactions ...")
+            start = time.perf_counter()
+            seed(db_path, args.customers, args.transactions)
+            print(f"  done in {time.perf_counter() - start:.1f} s")
+
+        for mode in ("normal", "low"):
+            # A fresh interpreter per mode; HOME is isolated so the real config is not touched
+            env = dict(os.environ, HOME=tmp)
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--db", db_path, "--pages", str(args.pages)],
+                capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            if out.returncode != 0:
+                print(out.stderr)
+                return 1
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"\n{'low-memory' if mode == 'low' else 'normal'} mode:")
+            last = 0
+            for name, rss in result["steps"]:
+                print(f"  {name:<28}{rss / MB:9.1f} MB  ({(rss - last) / MB:+.1f})")
+                last = rss
+            print(f"  {'peak':<28}{result['peak'] / MB:9.1f} MB")
+            print(f"  page cache: {result['cache_pages']} pages, {result['cache_bytes'] / MB:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import sys
+from array import array
+from collections import OrderedDict
+
+from ledger import CUSTOMER_NAME_QUERY, CUSTOMER_TRANSACTIONS_QUERY, format_amount
+
+# Default memory budget for cached customer pages, and the one of low-memory mode
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+LOW_MEMORY_MAX_BYTES = 2 * 1024 * 1024
+
+# The last sequence number handed out to sync_log (kept by SQLite even when entries are pruned)
+LOG_POSITION_QUERY = "SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'sync_log'), 0)"
+
+
+class CustomerPage:
+    # Everything the customer page needs to render without touching the database,
+    # as compact columns like the customer list: ids and amounts in typed arrays,
+    # dates and descriptions as UTF-8 buffers with offsets, kinds as small codes.
+    # Cells are decoded and formatted only when they are painted.
+    __slots__ = ("cid", "name", "total", "ids", "amounts", "kind_codes", "kinds",
+                 "dates", "date_offsets", "descs", "desc_offsets", "nbytes")
+
+    def __init__(self, cid, name):
+        self.cid = cid
+        self.name = name
+        self.total = 0.0
+        self.ids = array("q")
+        self.amounts = array("d")
+        self.kind_codes = array("b")
+        self.kinds = []
+        self.dates = bytearray()
+        self.date_offsets = array("q", [0])
+        self.descs = bytearray()
+        self.desc_offsets = array("q", [0])
+        self.nbytes = 0
+
+    def append(self, tid, date, desc, amount, kind):
+        if kind not in self.kinds:
+            self.kinds.append(kind)
+        self.ids.append(tid)
+        self.amounts.append(amount)
+        self.kind_codes.append(self.kinds.index(kind))
+        self.dates += date.encode("utf-8")
+        self.date_offsets.append(len(self.dates))
+        self.descs += desc.encode("utf-8")
+        self.desc_offsets.append(len(self.descs))
+        self.total += amount
+
+    def __len__(self):
+        return len(self.ids)
+
+    def date(self, row):
+        return self.dates[self.date_offsets[row]:self.date_offsets[row + 1]].decode("utf-8")
+
+    def description(self, row):
+        return self.descs[self.desc_offsets[row]:self.desc_offsets[row + 1]].decode("utf-8")
+
+    def amount_text(self, row):
+        amount = self.amounts[row]
+        return f"+ {format_amount(amount)}" if amount > 0 else f"- {format_amount(abs(amount))}"
+
+    def kind(self, row):
+        return self.kinds[self.kind_codes[row]]
+
+    def size(self):
+        columns = (self.ids, self.amounts, self.kind_codes, self.dates, self.date_offsets,
+                   self.descs, self.desc_offsets)
+        return sys.getsizeof(self.name) + sum(sys.getsizeof(c) for c in columns)
+
+
+def fetch_customer_page(conn, cid):
+    c = conn.cursor()
+    c.execute(CUSTOMER_NAME_QUERY, (cid,))
+    r = c.fetchone()
+    if not r:
+        return None
+    page = CustomerPage(cid, r[0])
+    c.execute(CUSTOMER_TRANSACTIONS_QUERY, (cid,))
+    for row in c:
+        page.append(*row)
+    page.nbytes = page.size()
+    return page
+
+
+class PageCache:
+    """LRU cache of customer pages bounded by an estimated memory size."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # Bumped on every invalidation so in-flight prefetches can be discarded
+        self.epoch = 0
+        self._pages = OrderedDict()
+        self._data_version = None
+        self._log_position = None
+
+    def __contains__(self, cid):
+        return cid in self._pages
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, cid):
+        page = self._pages.get(cid)
+        if page is not None:
+            self._pages.move_to_end(cid)
+        return page
+
+    def put(self, page, epoch=None):
+        # Pages fetched before the last invalidation may already be stale
+        if epoch is not None and epoch != self.epoch:
+            return False
+        if page.nbytes > self.max_bytes:
+            return False
+        old = self._pages.pop(page.cid, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self._pages[page.cid] = page
+        self.nbytes += page.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._pages.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return True
+
+    def invalidate(self, cid):
+        self.epoch += 1
+        page = self._pages.pop(cid, None)
+        if page is not None:
+            self.nbytes -= page.nbytes
+
+    def clear(self):
+        self.epoch += 1
+        self._pages.clear()
+        self.nbytes = 0
+
+    def check_external_writes(self, conn):
+        # data_version changes when another connection commits to the same file. Every
+        # change to ledger rows also appends to sync_log, so commits that leave its
+        # sequence alone (background maintenance: ANALYZE, VACUUM, its own log) are
+        # taken as they are. Returns True when the cache was dropped.
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return False
+        position = conn.execute(LOG_POSITION_QUERY).fetchone()[0]
+        changed = self._data_version is not None and position != self._log_position
+        if changed:
+            self.clear()
+        self._data_version, self._log_position = version, position
+        return changed
+
+    def note_own_writes(self, conn):
+        # Commits on `conn` itself leave its data_version alone but advance sync_log;
+        # while no other connection has committed since the last check, the whole
+        # advance is this connection's and must not count as an external write
+        if self._data_version is None:
+            return
+        if conn.execute("PRAGMA data_version").fetchone()[0] == self._data_version:
+            self._log_position = conn.execute(LOG_POSITION_QUERY).fetchone()[0]
+
+
+def _check():
+    # Writes on the window's connection followed by a maintenance commit on another
+    # one must not count as external; a data write by another connection must
+    import sqlite3
+    import tempfile
+    from pathlib import Path
+
+    import maintenance
+    from changes import ChangeBus
+    from ledger import init_db
+    from undo_journal import UndoJournal
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cache.db"
+        conn = init_db(path)
+        maintenance.ensure_log(conn)
+        cache = PageCache()
+        bus = ChangeBus()
+        bus.subscribe(lambda changes: cache.note_own_writes(conn))
+        journal = UndoJournal(conn, changes=bus)
+        cache.check_external_writes(conn)
+
+        c = conn.execute("INSERT INTO customers (name) VALUES ('زبون')")
+        journal.record_add_customer(c.lastrowid, "زبون")
+        journal.commit()
+        journal.undo()
+        journal.redo()
+        other = sqlite3.connect(path)
+        maintenance.run_task(other, "analyze")
+        results = [("local write, then maintenance", cache.check_external_writes(conn), False)]
+
+        other.execute("UPDATE customers SET name = 'آخر'")
+        other.commit()
+        other.close()
+        results.append(("write by another connection", cache.check_external_writes(conn), True))
+        conn.close()
+
+    failed = 0
+    for name, got, expected in results:
+        print(f"{'ok' if got == expected else 'FAIL':<5} {name}: external={got}")
+        failed += got != expected
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_check())
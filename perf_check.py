@@ -0,0 +1,258 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import analytics
+import api_server
+import bulk_posting
+import ledger_sync
+import snapshot_export
+import undo_journal
+import workspaces
+from ledger import (
+    CUSTOMERS_QUERY, CUSTOMERS_SEARCH_QUERY, CUSTOMERS_BATCH_QUERY, CUSTOMERS_SEARCH_BATCH_QUERY,
+    CUSTOMER_ROW_QUERY, CUSTOMER_NAME_QUERY, CUSTOMER_TRANSACTIONS_QUERY,
+    HAS_TRANSACTIONS_QUERY, STATEMENT_QUERY, STATEMENT_KEY_QUERY, KIND_PURCHASE, KIND_PAYMENT, init_db
+)
+from page_cache import fetch_customer_page
+
+BASELINES_PATH = Path(__file__).with_name("perf_baselines.json")
+
+# Budgets are the stored baselines times these factors, plus a small absolute slack.
+# Times are stored relative to a reference workload timed in the same run, so the
+# budgets follow the speed of the machine running the check.
+TIME_TOLERANCE = 2.0
+MEMORY_TOLERANCE = 1.5
+TIME_SLACK_MS = 2.0
+MEMORY_SLACK_KB = 64
+
+# A bulk posting as the dialog builds it: balance bounds make it read every selected
+# customer's transactions, a percentage rule reads them for the amount too
+_BULK_FIXED = bulk_posting.insert_postings(
+    bulk_posting.customer_selection("1", min_balance=1), bulk_posting.RULE_FIXED, 50,
+    "2024-01-01", "x", KIND_PURCHASE)
+_BULK_PERCENT = bulk_posting.insert_postings(
+    bulk_posting.customer_selection(), bulk_posting.RULE_PERCENT, 10, "2024-01-01", "x", KIND_PAYMENT)
+
+# Every production query: (name, sql, params, plan must mention, plan must not mention)
+QUERY_CHECKS = [
+    ("customer list", CUSTOMERS_QUERY, (),
+     ["idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("customer search", CUSTOMERS_SEARCH_QUERY, ("%1%",),
+     ["idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("customer list batch", CUSTOMERS_BATCH_QUERY, (1000, 500),
+     ["INTEGER PRIMARY KEY", "idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("customer search batch", CUSTOMERS_SEARCH_BATCH_QUERY, ("%1%", 1000, 500),
+     ["INTEGER PRIMARY KEY", "idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("customer row", CUSTOMER_ROW_QUERY, (1, "%%"),
+     ["INTEGER PRIMARY KEY", "idx_transactions_customer"], ["SCAN"]),
+    ("customer name", CUSTOMER_NAME_QUERY, (1,),
+     ["INTEGER PRIMARY KEY"], ["SCAN"]),
+    # Sorting the ids of one customer's same-day rows ("RIGHT PART OF ORDER BY") is fine
+    ("customer page", CUSTOMER_TRANSACTIONS_QUERY, (1,),
+     ["idx_transactions_customer"], ["SCAN", "TEMP B-TREE FOR ORDER BY"]),
+    ("statement / CSV export", STATEMENT_QUERY, (1,),
+     ["idx_transactions_customer"], ["SCAN", "TEMP B-TREE FOR ORDER BY"]),
+    ("has transactions", HAS_TRANSACTIONS_QUERY, (1,),
+     ["idx_transactions_customer"], ["SCAN"]),
+    ("statement cache key", STATEMENT_KEY_QUERY, (1,),
+     ["COVERING INDEX idx_transactions_customer", "COVERING INDEX idx_sync_log_row"], ["SCAN"]),
+    ("api customer search", api_server.FIND_CUSTOMERS_QUERY, ("%1%", 50),
+     ["idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("api balance", api_server.BALANCE_QUERY, (1,),
+     ["idx_transactions_customer"], ["SCAN"]),
+    # The whole-ledger export reads everything, but must do so in rowid order
+    ("snapshot export", snapshot_export.SNAPSHOT_QUERY, (),
+     ["SCAN transactions"], ["TEMP B-TREE", "USING INDEX"]),
+    ("analytics cached count", analytics.CACHED_COUNT_QUERY, (1,),
+     ["INTEGER PRIMARY KEY"], ["SCAN"]),
+    ("analytics new rows", analytics.NEW_ROWS_QUERY, (1,),
+     ["INTEGER PRIMARY KEY"], ["SCAN", "TEMP B-TREE"]),
+    ("analytics edits since", analytics.EDITS_SINCE_QUERY, (1,),
+     ["INTEGER PRIMARY KEY"], ["SCAN"]),
+    ("bulk posting (fixed)", *_BULK_FIXED,
+     ["idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("bulk posting (percent)", *_BULK_PERCENT,
+     ["idx_transactions_customer"], ["SCAN transactions", "TEMP B-TREE", "AUTOMATIC"]),
+    ("undo bulk posting", undo_journal.DELETE_RANGE_QUERY, (1, 500),
+     ["INTEGER PRIMARY KEY"], ["SCAN"]),
+    # Branch ledgers are attached as l0, l1, ...; main() attaches the seeded ledger as l0
+    ("consolidated report", "INSERT INTO temp.debtors " + workspaces.DEBTORS_QUERY.format(i=0), (),
+     ["idx_transactions_customer"], ["TEMP B-TREE", "AUTOMATIC"]),
+    ("sync changes", ledger_sync.LATEST_CHANGES_QUERY, (1, 0, 10, "x"),
+     ["INTEGER PRIMARY KEY"], ["SCAN"]),
+    ("sync last event", ledger_sync.LAST_EVENT_QUERY, (1, "x"),
+     ["idx_sync_log_row"], ["SCAN", "TEMP B-TREE"]),
+    ("sync log prune", ledger_sync.PRUNE_QUERY, (0, 10),
+     ["INTEGER PRIMARY KEY (rowid>?)", "idx_sync_log_row"], ["SCAN"]),
+]
+
+
+def seed(db_path, customers, transactions):
+    rng = random.Random(42)
+    conn = init_db(db_path)
+    conn.executemany("INSERT INTO customers (name) VALUES (?)",
+                     ((f"زبون {i}",) for i in range(customers)))
+    conn.executemany(
+        "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)",
+        ((rng.randint(1, customers), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+          "بضاعة", rng.choice((1, -1)) * rng.randint(1, 50000) / 100, rng.choice(("شراء", "دفع")))
+         for _ in range(transactions))
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn
+
+
+def check_plans(conn):
+    failures = []
+    for name, sql, params, required, forbidden in QUERY_CHECKS:
+        plan = " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        problems = [f"missing '{s}'" for s in required if s not in plan]
+        problems += [f"uses '{s}'" for s in forbidden if s in plan]
+        status = "FAIL" if problems else "ok"
+        print(f"  {status:<4} {name:<24} {plan}")
+        for p in problems:
+            print(f"         -> {p}")
+        if problems:
+            failures.append(name)
+    return failures
+
+
+def data_paths(conn, tmp):
+    busiest = conn.execute(
+        "SELECT customer_id FROM transactions GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    mid_seq = conn.execute("SELECT MAX(seq) - 1000 FROM sync_log").fetchone()[0]
+    paths = {
+        "load customers": lambda: conn.execute(CUSTOMERS_QUERY).fetchall(),
+        "search customers": lambda: conn.execute(CUSTOMERS_SEARCH_QUERY, ("%12%",)).fetchall(),
+        "first customer batch": lambda: conn.execute(CUSTOMERS_BATCH_QUERY, (sys.maxsize, 500)).fetchall(),
+        "open customer page": lambda: fetch_customer_page(conn, busiest),
+        "statement rows": lambda: conn.execute(STATEMENT_QUERY, (busiest,)).fetchall(),
+        "sync export (1k changes)": lambda: ledger_sync.export_changes(conn, mid_seq),
+    }
+    formats = snapshot_export.available_formats()
+    if formats:
+        target = Path(tmp) / f"snapshot{formats[0]}"
+        paths[f"snapshot export ({formats[0]})"] = lambda: snapshot_export.export_snapshot(conn, target)
+    return paths
+
+
+def reference_workload(conn):
+    # Fixed SQLite and Python work over the seeded ledger: a full row read and a loop over it
+    total = 0.0
+    for _, cid, amount in conn.execute("SELECT id, customer_id, amount FROM transactions ORDER BY id"):
+        total += amount * (cid & 7)
+    return total
+
+
+def measure(fn, repeat):
+    fn()  # warm the page cache
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024
+
+
+def check_budgets(results, baselines, reference_ms):
+    failures = []
+    print(f"  {'path':<30}{'ms':>10}{'budget':>10}{'peak KB':>12}{'budget':>10}")
+    for name, (ms, kb) in results.items():
+        base = baselines.get(name)
+        if base is None:
+            print(f"  {name:<30}{ms:>10.1f}{'-':>10}{kb:>12.0f}{'-':>10}  (no baseline)")
+            continue
+        base_ms = base["ratio"] * reference_ms
+        ms_budget = base_ms * TIME_TOLERANCE + TIME_SLACK_MS
+        kb_budget = base["peak_kb"] * MEMORY_TOLERANCE + MEMORY_SLACK_KB
+        over = []
+        if ms > ms_budget:
+            over.append(f"time {ms:.1f} ms vs baseline {base_ms:.1f} ms on this machine "
+                        f"(+{(ms / base_ms - 1) * 100:.0f}%)")
+        if kb > kb_budget:
+            over.append(f"memory {kb:.0f} KB vs baseline {base['peak_kb']:.0f} KB "
+                        f"(+{(kb / base['peak_kb'] - 1) * 100:.0f}%)")
+        flag = "  OVER BUDGET" if over else ""
+        print(f"  {name:<30}{ms:>10.1f}{ms_budget:>10.1f}{kb:>12.0f}{kb_budget:>10.0f}{flag}")
+        for o in over:
+            print(f"      -> {o}")
+        if over:
+            failures.append(name)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query-plan and performance regression checks")
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--update-baselines", action="store_true",
+                        help=f"store the measured numbers in {BASELINES_PATH.name}")
+    args = parser.parse_args()
+
+    baselines = {}
+    if BASELINES_PATH.exists():
+        with open(BASELINES_PATH, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("seed") == {"customers": args.customers, "transactions": args.transactions}:
+            baselines = stored["paths"]
+        elif not args.update_baselines:
+            print("baselines were recorded with a different seed size; budgets are not enforced")
+        if any("ratio" not in base for base in baselines.values()) and not args.update_baselines:
+            print("baselines hold absolute times; re-record them with --update-baselines")
+            baselines = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"seeding {args.customers:,} customers / {args.transactions:,} transactions ...")
+        conn = seed(Path(tmp) / "perf.db", args.customers, args.transactions)
+
+        print("\nquery plans:")
+        conn.execute("ATTACH DATABASE ? AS l0", (str(Path(tmp) / "perf.db"),))
+        conn.execute(workspaces.DEBTORS_TABLE)
+        plan_failures = check_plans(conn)
+        conn.execute("DETACH DATABASE l0")
+
+        print("\ndata paths:")
+        reference_ms = measure(lambda: reference_workload(conn), args.repeat)[0]
+        print(f"  reference workload {reference_ms:.1f} ms")
+        results = {name: measure(fn, args.repeat) for name, fn in data_paths(conn, tmp).items()}
+        budget_failures = [] if args.update_baselines else check_budgets(results, baselines, reference_ms)
+        conn.close()
+
+    if args.update_baselines:
+        for name, (ms, kb) in results.items():
+            print(f"  {name:<30}{ms:>10.1f} ms{kb:>10.0f} KB")
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "seed": {"customers": args.customers, "transactions": args.transactions},
+                # Only for reading the file: the check scales by the reference time of its own run
+                "reference_ms": round(reference_ms, 2),
+                "paths": {name: {"ratio": round(ms / reference_ms, 5), "peak_kb": round(kb, 1)}
+                          for name, (ms, kb) in results.items()},
+            }, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nbaselines written to {BASELINES_PATH.name}")
+
+    failures = plan_failures + budget_failures
+    if failures:
+        print(f"\nFAILED: {', '.join(failures)}")
+        return 1
+    print("\nall checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
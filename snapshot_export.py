@@ -0,0 +1,234 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow is optional, the NumPy fallback is used instead
+    pa = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Rows per record batch / row group (smaller batches keep the peak low in low-memory mode)
+BATCH_ROWS = 65_536
+LOW_MEMORY_BATCH_ROWS = 8_192
+
+# Snapshot formats by extension, and the library each one needs
+FORMATS = {".arrow": "pyarrow", ".feather": "pyarrow", ".parquet": "pyarrow", ".npz": "numpy"}
+
+SNAPSHOT_QUERY = """
+    SELECT transactions.id, transactions.customer_id, transactions.date,
+           transactions.description, transactions.amount, transactions.kind
+    FROM transactions
+    ORDER BY transactions.id
+"""
+
+
+def available_formats():
+    formats = []
+    if pa is not None:
+        formats += [".arrow", ".feather"]
+    if pq is not None:
+        formats.append(".parquet")
+    if np is not None:
+        formats.append(".npz")
+    return formats
+
+
+def export_snapshot(conn, path, batch_rows=BATCH_ROWS):
+    """Write the whole ledger to a columnar file and return the row count.
+
+    The format follows the extension: .arrow/.feather (Arrow IPC file,
+    uncompressed so it can be memory-mapped), .parquet, or .npz.
+    Rows are streamed from the database in id order one batch at a time;
+    customer names and kinds are dictionary-encoded. Everything is read in
+    one read transaction, so writes by other programs during the export
+    (API server, sync) do not mix into the snapshot.
+    """
+    path = Path(path)
+    ext = path.suffix.lower()
+    if ext not in FORMATS:
+        raise ValueError(f"{path.name}: unrecognised snapshot extension, use one of {', '.join(FORMATS)}")
+    if ext not in available_formats():
+        raise ValueError(f"{ext} snapshots need {FORMATS[ext]}")
+
+    tmp = path.with_name(path.name + ".tmp")
+    # A write transaction already open on this connection is a consistent view as it is
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        names, name_codes = _customer_dictionary(conn)
+        kinds = [r[0] for r in conn.execute("SELECT DISTINCT kind FROM transactions ORDER BY kind")]
+        kind_codes = {k: i for i, k in enumerate(kinds)}
+        if ext == ".npz":
+            rows = _write_npz(conn, tmp, names, name_codes, kinds, kind_codes, batch_rows)
+        else:
+            rows = _write_arrow(conn, tmp, ext, names, name_codes, kinds, kind_codes, batch_rows)
+        os.replace(tmp, path)
+    finally:
+        if own:
+            conn.commit()
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+def open_snapshot(path):
+    """Open an Arrow snapshot without copying: the table reads from the mapped file."""
+    source = pa.memory_map(str(path), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def _customer_dictionary(conn):
+    names = []
+    codes = {}
+    for cid, name in conn.execute("SELECT id, name FROM customers ORDER BY id"):
+        codes[cid] = len(names)
+        names.append(name)
+    return names, codes
+
+
+def _batches(conn, batch_rows):
+    c = conn.cursor()
+    c.execute(SNAPSHOT_QUERY)
+    while True:
+        rows = c.fetchmany(batch_rows)
+        if not rows:
+            return
+        yield tuple(zip(*rows))
+
+
+def _write_arrow(conn, path, ext, names, name_codes, kinds, kind_codes, batch_rows):
+    name_dict = pa.array(names, pa.string())
+    kind_dict = pa.array(kinds, pa.string())
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("customer_id", pa.int64()),
+        ("customer", pa.dictionary(pa.int32(), pa.string())),
+        ("date", pa.date32()),
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("kind", pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+    if ext == ".parquet":
+        writer = pq.ParquetWriter(str(path), schema)
+        write = writer.write_table
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+        write = writer.write_table
+
+    rows = 0
+    try:
+        for ids, cust, dates, descs, amounts, kind in _batches(conn, batch_rows):
+            customer = pa.DictionaryArray.from_arrays(
+                pa.array([name_codes.get(c) for c in cust], pa.int32()), name_dict)
+            kind_arr = pa.DictionaryArray.from_arrays(
+                pa.array([kind_codes[k] for k in kind], pa.int8()), kind_dict)
+            date_arr = pa.array(dates, pa.string()).cast(pa.date32())
+            batch = pa.record_batch([
+                pa.array(ids, pa.int64()),
+                pa.array(cust, pa.int64()),
+                customer,
+                date_arr,
+                pa.array(descs, pa.string()),
+                pa.array(amounts, pa.float64()),
+                kind_arr,
+            ], schema=schema)
+            write(pa.Table.from_batches([batch]))
+            rows += len(ids)
+    finally:
+        writer.close()
+    return rows
+
+
+def _write_npz(conn, path, names, name_codes, kinds, kind_codes, batch_rows):
+    # Each column is streamed into a raw temp file and then copied into an
+    # uncompressed zip member behind its .npy header, so memory stays bounded
+    with tempfile.TemporaryDirectory(dir=path.parent) as tmp:
+        tmp = Path(tmp)
+        fixed = {
+            "id": np.dtype("<i8"),
+            "customer_id": np.dtype("<i8"),
+            "customer_code": np.dtype("<i4"),
+            "date": np.dtype("<i4"),
+            "amount": np.dtype("<f8"),
+            "kind_code": np.dtype("<i1"),
+        }
+        files = {name: open(tmp / name, "wb") for name in list(fixed) + ["description_bytes"]}
+        offsets = [0]
+        rows = 0
+        try:
+            for ids, cust, dates, descs, amounts, kind in _batches(conn, batch_rows):
+                cols = {
+                    "id": np.array(ids, fixed["id"]),
+                    "customer_id": np.array(cust, fixed["customer_id"]),
+                    "customer_code": np.array([name_codes.get(c, -1) for c in cust], fixed["customer_code"]),
+                    "date": np.array(dates, "datetime64[D]").astype(fixed["date"]),
+                    "amount": np.array(amounts, fixed["amount"]),
+                    "kind_code": np.array([kind_codes[k] for k in kind], fixed["kind_code"]),
+                }
+                for name, arr in cols.items():
+                    arr.tofile(files[name])
+                encoded = [d.encode("utf-8") for d in descs]
+                files["description_bytes"].write(b"".join(encoded))
+                end = offsets[-1]
+                for e in encoded:
+                    end += len(e)
+                    offsets.append(end)
+                rows += len(ids)
+        finally:
+            for f in files.values():
+                f.close()
+
+        name_bytes = [n.encode("utf-8") for n in names]
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for name, dtype in fixed.items():
+                _copy_npy(zf, name, dtype, rows, tmp / name)
+            _copy_npy(zf, "description_bytes", np.dtype("u1"), offsets[-1], tmp / "description_bytes")
+            _write_npy(zf, "description_offsets", np.array(offsets, "<i8"))
+            _write_npy(zf, "customer_names_bytes", np.frombuffer(b"".join(name_bytes), "u1"))
+            _write_npy(zf, "customer_names_offsets",
+                       np.cumsum([0] + [len(b) for b in name_bytes]).astype("<i8"))
+            _write_npy(zf, "kind_names", np.array(kinds, dtype=str))
+    return rows
+
+
+def _copy_npy(zf, name, dtype, length, src):
+    with zf.open(name + ".npy", "w", force_zip64=True) as out:
+        np.lib.format.write_array_header_2_0(
+            out, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (length,)})
+        with open(src, "rb") as f:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+
+
+def _write_npy(zf, name, arr):
+    with zf.open(name + ".npy", "w", force_zip64=True) as out:
+        np.lib.format.write_array(out, arr, allow_pickle=False)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python snapshot_export.py OUTPUT.{arrow,feather,parquet,npz} [accounts.db]")
+    db = sys.argv[2] if len(sys.argv) > 2 else Path.home() / ".daftar_accounts" / "accounts.db"
+    conn = sqlite3.connect(db)
+    try:
+        print(f"{export_snapshot(conn, sys.argv[1]):,} rows written to {sys.argv[1]}")
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
@@ -0,0 +1,242 @@
+import io
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from ledger import CUSTOMER_NAME_QUERY, STATEMENT_QUERY, STATEMENT_KEY_QUERY, ValidationError, init_db
+
+# Arabic fonts tried in order for the PDF
+FONT_PATHS = (
+    "fonts/NotoNaskhArabic-Regular.ttf",
+    "fonts/NotoSansArabic-Regular.ttf",
+    "fonts/DejaVuSans.ttf",
+)
+
+# Finished statements kept for re-opening the preview or saving it, and the one of low-memory mode
+DEFAULT_MAX_STATEMENTS = 4
+LOW_MEMORY_MAX_STATEMENTS = 1
+
+
+def statement_key(conn, cid):
+    """Identifies the content of a statement; None when there is nothing to print.
+
+    The name and the last id, count, sum and newest change of the customer's
+    transactions together change whenever the printed statement would. They
+    are read in one transaction, so they describe a single state of the ledger.
+    """
+    with _read_transaction(conn):
+        return _statement_key(conn, cid)
+
+
+def _statement_key(conn, cid):
+    row = conn.execute(CUSTOMER_NAME_QUERY, (cid,)).fetchone()
+    if row is None:
+        return None
+    last_id, count, total, last_change = conn.execute(STATEMENT_KEY_QUERY, (cid,)).fetchone()
+    if not count:
+        return None
+    return cid, row[0], last_id, count, total, last_change
+
+
+@contextmanager
+def _read_transaction(conn):
+    # A write transaction already open on this connection is a consistent view as it is
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        yield
+    finally:
+        if own:
+            conn.commit()
+
+
+def build_statement(conn, cid):
+    """Render one customer's account statement; returns (statement_key, PDF bytes).
+
+    The key is read in the same transaction as the printed rows, so it is
+    exactly the state the PDF shows, even if the ledger changed since the
+    caller last read it.
+    """
+    # PDF generation imports (loaded on first use: reportlab alone costs ~18 MB of RAM)
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    try:
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+    except Exception:
+        raise ValidationError("مكتبات arabic_reshaper و python-bidi مطلوبة للطباعة بشكل صحيح", critical=True)
+
+    def ar(text):
+        reshaped = arabic_reshaper.reshape(text)
+        return get_display(reshaped)
+
+    font_path = next((p for p in FONT_PATHS if Path(p).exists()), None)
+    if not font_path:
+        raise ValidationError("مش لاقي خط عربي! ركّب fonts-noto-arabic", critical=True)
+
+    if "Arabic" not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont("Arabic", font_path))
+
+    out = io.BytesIO()
+    doc = SimpleDocTemplate(out, pagesize=A4,
+                            rightMargin=18*mm, leftMargin=18*mm,
+                            topMargin=20*mm, bottomMargin=20*mm)
+    elements = []
+
+    title_style = ParagraphStyle(
+        name='Title',
+        fontName='Arabic',
+        fontSize=30,
+        alignment=TA_CENTER,
+        spaceAfter=20,
+        textColor=colors.HexColor("#2c3e50"),
+        leading=36
+    )
+
+    # Table data
+    data = [[ar("التاريخ"), ar("البيان"), ar("المبلغ"), ar("النوع")]]
+    total = 0.0
+    with _read_transaction(conn):
+        key = _statement_key(conn, cid)
+        if key is None:
+            raise ValidationError("لا توجد عمليات لطباعتها")
+        # reportlab needs the whole table, but the rows go straight from the cursor into it
+        for date, desc, amount, kind in conn.execute(STATEMENT_QUERY, (cid,)):
+            total += amount
+            amount_str = f"{amount:.2f}" if amount >= 0 else f"({abs(amount):.2f})"
+
+            y, m, d = date.split("-")
+            raw_date = f"{int(y):02d} / {int(m):02d} / {d}"
+            nice_date = f"\u202A{raw_date}\u202C"
+
+            data.append([
+                ar(nice_date),
+                ar(desc),
+                ar(amount_str),
+                ar(kind)
+            ])
+
+    elements.append(Paragraph(ar(f"كشف حساب {key[1]}"), title_style))
+    elements.append(Spacer(1, 8*mm))  # Small space before the table
+
+    total_str = f"{total:.2f} جنيه" if total >= 0 else f"({abs(total):.2f}) جنيه"
+    data.append(["", ar(total_str), ar("إجمالي الحساب"), ""])
+
+    table = Table(data, colWidths=[48*mm, 82*mm, 38*mm, 32*mm])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2c3e50")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Arabic'),
+        ('FONTSIZE', (0, 0), (-1, 0), 16),
+        ('FONTSIZE', (0, 1), (-1, -2), 15),
+        ('FONTSIZE', (0, -1), (-1, -1), 18),
+        ('GRID', (0, 0), (-1, -1), 1.4, colors.black),
+        ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor("#f8f9fa")),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor("#2c3e50")),
+        ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ]))
+    elements.append(table)
+
+    doc.build(elements)
+    return key, out.getvalue()
+
+
+class Statement:
+    # A statement as far as it has been rendered: the PDF, then its page thumbnails in order
+    __slots__ = ("key", "pdf", "page_count", "thumbnails", "rendering")
+
+    def __init__(self, key):
+        self.key = key
+        self.pdf = None
+        self.page_count = None
+        self.thumbnails = []
+        self.rendering = False
+
+    @property
+    def complete(self):
+        return self.pdf is not None and len(self.thumbnails) == self.page_count
+
+
+class StatementCache:
+    """LRU cache of rendered statements, keyed by statement_key()."""
+
+    def __init__(self, max_statements=DEFAULT_MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self._statements = OrderedDict()
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get(self, key):
+        # The cached statement of this key, or a new empty one to be rendered
+        statement = self._statements.get(key)
+        if statement is not None:
+            self._statements.move_to_end(key)
+            return statement
+        statement = self._statements[key] = Statement(key)
+        # Older versions of the same customer's statement can never be shown again
+        for old in [k for k in self._statements if k[0] == key[0] and k != key]:
+            del self._statements[old]
+        while len(self._statements) > self.max_statements:
+            self._statements.popitem(last=False)
+        return statement
+
+    def rekey(self, statement, key):
+        # The statement was built from a newer state of the ledger than it was requested for
+        self._statements.pop(statement.key, None)
+        statement.key = key
+        for old in [k for k in self._statements if k[0] == key[0]]:
+            del self._statements[old]
+        self._statements[key] = statement
+
+    def discard_customers(self, cids):
+        # Statements of changed customers can never be shown again
+        for key in [k for k in self._statements if k[0] in cids]:
+            del self._statements[key]
+
+    def discard(self, key):
+        self._statements.pop(key, None)
+
+    def clear(self):
+        self._statements.clear()
+
+
+def _bench(transactions=2_000):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = init_db(Path(tmp) / "statement.db")
+        conn.execute("INSERT INTO customers (name) VALUES ('زبون')")
+        conn.executemany(
+            "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (1, ?, 'بضاعة', ?, 'شراء')",
+            ((f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", i % 500 + 0.5) for i in range(transactions))
+        )
+        conn.commit()
+        cache = StatementCache()
+        for attempt in ("first", "again"):
+            start = time.perf_counter()
+            key = statement_key(conn, 1)
+            statement = cache.get(key)
+            if statement.pdf is None:
+                _, statement.pdf = build_statement(conn, 1)
+            print(f"{attempt:<6} {len(statement.pdf) / 1024:8.0f} KB  {(time.perf_counter() - start) * 1000:8.1f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000)
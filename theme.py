@@ -0,0 +1,212 @@
+from functools import lru_cache
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import QStyledItemDelegate
+
+ARABIC_FONT = "Noto Naskh Arabic"
+UI_FONT = "Sans"
+
+# Colors of the balance label, selected through its "balance" property
+BALANCE_DUE = "due"
+BALANCE_CREDIT = "credit"
+BALANCE_EVEN = "even"
+
+# The whole look of the application lives in this one sheet: Qt parses it once at
+# startup instead of re-resolving per-widget sheets on every dialog and repaint.
+# Widgets opt in to a rule through their objectName.
+APP_STYLESHEET = """
+    QWidget {
+        background-color: #f8f9fa;
+        color: #1e272e;
+        font-family: 'Noto Naskh Arabic', 'Amiri', 'Tahoma', sans-serif;
+    }
+    QLabel, QRadioButton, QDialog {
+        color: #1e272e;
+    }
+    QLabel {
+        font-weight: bold;
+    }
+    QTableView {
+        background-color: white;
+        gridline-color: #dee2e6;
+        alternate-background-color: #f1f3f5;
+        selection-background-color: #3498db;
+        selection-color: white;
+    }
+    QTableView::item {
+        padding: 12px 8px;
+        color: #1e272e;
+    }
+    QHeaderView::section {
+        background-color: #2c3e50;
+        color: white;
+        padding: 14px;
+        font-weight: bold;
+        font-size: 18pt;
+        border: none;
+    }
+    QPushButton {
+        color: white;
+        padding: 16px 28px;
+        border-radius: 8px;
+        border: none;
+        font-weight: bold;
+        font-size: 18pt;
+        min-height: 50px;
+    }
+    QPushButton#addBtn      { background-color: #27ae60; }
+    QPushButton#renameBtn   { background-color: #3498db; }
+    QPushButton#deleteBtn   { background-color: #e74c3c; }
+    QPushButton#openBtn     { background-color: #9b59b6; }
+    QPushButton#saveBtn     { background-color: #27ae60; }
+    QPushButton#cancelBtn   { background-color: #95a5a6; }
+    QLineEdit, QDateEdit {
+        padding: 14px;
+        border: 2px solid #bdc3c7;
+        border-radius: 8px;
+        background: white;
+        font-size: 18pt;
+        color: #1e272e;
+        font-weight: bold;
+    }
+    QLineEdit:focus, QDateEdit:focus {
+        border: 2px solid #3498db;
+    }
+
+    /* Page bars: the bar color also covers the widgets placed on them */
+    QWidget#listTopBar, QWidget#listTopBar QWidget { background-color: #1a252f; }
+    QWidget#customerTopBar, QWidget#customerTopBar QWidget { background-color: #16a085; }
+    QWidget#bottomBar, QWidget#bottomBar QWidget { background-color: #2c3e50; }
+    QWidget#listTopBar QLabel { color: #ecf0f1; }
+    QWidget#listTopBar QComboBox#ledgerCombo {
+        background-color: #ecf0f1; color: #1e272e; padding: 8px 12px;
+        border-radius: 8px; font-weight: bold;
+    }
+    QWidget#listTopBar QComboBox#ledgerCombo::drop-down { border: none; width: 28px; }
+    QWidget#listTopBar QComboBox#ledgerCombo QAbstractItemView {
+        background-color: white; color: #1e272e;
+        selection-background-color: #3498db; selection-color: white;
+    }
+    QWidget#customerTopBar QPushButton#printBtn {
+        background-color: #e67e22; color: white; padding: 8px 12px;
+        border-radius: 8px; font-weight: bold; font-size: 12pt;
+    }
+    QWidget#customerTopBar QPushButton#csvBtn {
+        background-color: #2d98da; color: white; padding: 8px 12px; border-radius: 8px;
+    }
+    QLabel#name_label {
+        color: white;
+        font-size: 24pt;
+    }
+    QLabel#listTitle {
+        color: #2c3e50;
+        margin: 6px 12px 0 12px;
+    }
+    QWidget#bottomBar QLabel#totalLabel { color: white; }
+    QWidget#bottomBar QLabel#totalLabel[balance="due"] { color: #e74c3c; }
+    QWidget#bottomBar QLabel#totalLabel[balance="credit"] { color: #27ae60; }
+    QWidget#bottomBar QLabel#totalLabel[balance="even"] { color: #95a5a6; }
+
+    /* Dialogs */
+    QLabel#dialogHeader {
+        background-color: #3498db;
+        color: white;
+        padding: 8px;
+    }
+    QDialog#reportDialog QLabel#dialogHeader { padding: 12px; }
+    QDialog#textInputDialog QLineEdit { padding: 6px; }
+    QDialog#transactionDialog QLabel#dialogHeader {
+        padding: 20px;
+        border-radius: 12px;
+        font-size: 28pt;
+        font-weight: bold;
+    }
+    QDialog#transactionDialog QLabel#kindLabel, QDialog#transactionDialog QRadioButton {
+        font-size: 22pt;
+        font-weight: bold;
+        color: #2c3e50;
+    }
+    QDialog#transactionDialog QLineEdit, QDialog#transactionDialog QDateEdit {
+        padding: 18px;
+        font-size: 22pt;
+        font-weight: bold;
+        border: 3px solid #bdc3c7;
+        border-radius: 12px;
+    }
+    QDialog#transactionDialog QPushButton {
+        font-size: 24pt;
+        padding: 20px 60px;
+        min-width: 220px;
+    }
+
+    /* Message boxes (styled_message_box) */
+    QMessageBox {
+        background-color: #ffffff;
+        color: #1e272e;
+        font-family: 'Noto Naskh Arabic', 'Amiri', 'Sans';
+        font-size: 14pt;
+    }
+    QMessageBox QLabel {
+        color: #1e272e;
+        font-size: 14pt;
+        font-weight: bold;
+    }
+    QMessageBox QPushButton {
+        min-width: 110px;
+        min-height: 36px;
+        padding: 8px 14px;
+        border-radius: 8px;
+        font-size: 13pt;
+        font-weight: bold;
+    }
+    QMessageBox QPushButton#yesBtn    { background-color: #27ae60; color: white; }
+    QMessageBox QPushButton#noBtn     { background-color: #e74c3c; color: white; }
+    QMessageBox QPushButton#okBtn     { background-color: #3498db; color: white; }
+    QMessageBox QPushButton#cancelBtn { background-color: #95a5a6; color: white; }
+"""
+
+
+@lru_cache(maxsize=None)
+def font(family, size, bold=True):
+    # Shared font objects; Qt copies them on assignment, so callers never mutate these
+    return QFont(family, size, QFont.Bold if bold else QFont.Normal)
+
+
+def apply(app):
+    app.setLayoutDirection(Qt.RightToLeft)
+    app.setFont(font(ARABIC_FONT, 20))
+    app.setStyleSheet(APP_STYLESHEET)
+
+
+def set_balance_state(label, total):
+    # Switches the label color through the stylesheet instead of a new per-widget sheet
+    state = BALANCE_DUE if total > 0 else BALANCE_CREDIT if total < 0 else BALANCE_EVEN
+    if label.property("balance") != state:
+        label.setProperty("balance", state)
+        label.style().unpolish(label)
+        label.style().polish(label)
+
+
+class CellDelegate(QStyledItemDelegate):
+    """Paints a table column with one shared font and alignment.
+
+    Replaces per-item setFont/setTextAlignment calls, so filling a table
+    allocates no font per cell.
+    """
+
+    def __init__(self, cell_font, alignment=Qt.AlignCenter, parent=None):
+        super().__init__(parent)
+        self.cell_font = cell_font
+        self.alignment = alignment
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        option.font = self.cell_font
+        option.displayAlignment = self.alignment
+
+
+def set_column_delegates(table, columns):
+    # columns: {column: (font, alignment)}; the table keeps the delegates alive
+    for column, (cell_font, alignment) in columns.items():
+        table.setItemDelegateForColumn(column, CellDelegate(cell_font, alignment, table))
@@ -0,0 +1,104 @@
+import argparse
+import statistics
+import sys
+import time
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import QApplication, QHeaderView, QTableWidget, QTableWidgetItem
+
+import theme
+from theme import ARABIC_FONT, UI_FONT
+
+
+def make_table():
+    table = QTableWidget()
+    table.setColumnCount(4)
+    table.setHorizontalHeaderLabels(["التاريخ", "البيان", "المبلغ (جنيه)", "النوع"])
+    # Same layout as the account page table
+    for col in (0, 2, 3):
+        table.horizontalHeader().setSectionResizeMode(col, QHeaderView.ResizeToContents)
+    table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+    table.setSelectionBehavior(QTableWidget.SelectRows)
+    table.setFont(theme.font(UI_FONT, 12))
+    table.setAlternatingRowColors(True)
+    table.verticalHeader().setVisible(False)
+    table.resize(1200, 800)
+    return table
+
+
+def fill_legacy(table, rows):
+    # The previous approach: a new font and an alignment stored on every item
+    table.setRowCount(len(rows))
+    for row_idx, values in enumerate(rows):
+        for col, value in enumerate(values):
+            it = QTableWidgetItem(value)
+            it.setTextAlignment(Qt.AlignCenter)
+            it.setFont(QFont("Noto Naskh Arabic", 20 if col == 1 else 18, QFont.Bold))
+            table.setItem(row_idx, col, it)
+
+
+def fill_themed(table, rows):
+    if table.itemDelegateForColumn(0) is None:
+        cell_font = theme.font(ARABIC_FONT, 18)
+        theme.set_column_delegates(table, {
+            0: (cell_font, Qt.AlignCenter),
+            1: (theme.font(ARABIC_FONT, 20), Qt.AlignCenter),
+            2: (cell_font, Qt.AlignCenter),
+            3: (cell_font, Qt.AlignCenter),
+        })
+    table.setRowCount(len(rows))
+    for row_idx, values in enumerate(rows):
+        for col, value in enumerate(values):
+            table.setItem(row_idx, col, QTableWidgetItem(value))
+
+
+def frame_times(table, frames, scroll):
+    bar = table.verticalScrollBar()
+    bar.setValue(0)
+    times = []
+    for i in range(frames):
+        if scroll:
+            bar.setValue((i * bar.pageStep() // 4) % max(bar.maximum(), 1))
+        start = time.perf_counter()
+        table.viewport().repaint()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def summary(times):
+    times = sorted(times)
+    return f"median {statistics.median(times):6.2f} ms   p95 {times[int(len(times) * 0.95)]:6.2f} ms"
+
+
+def run(mode, rows, frames):
+    fill = fill_legacy if mode == "legacy" else fill_themed
+    table = make_table()
+    table.show()
+    start = time.perf_counter()
+    fill(table, rows)
+    QApplication.processEvents()
+    populate = (time.perf_counter() - start) * 1000
+    print(f"{mode}:")
+    print(f"  populate {len(rows):,} rows   {populate:8.1f} ms")
+    print(f"  repaint               {summary(frame_times(table, frames, scroll=False))}")
+    print(f"  scroll                {summary(frame_times(table, frames, scroll=True))}")
+    table.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Table repaint and scroll frame times")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    theme.apply(app)
+    rows = [(f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"بضاعة رقم {i}", f"+ {i * 1.5:,.2f}", "شراء")
+            for i in range(args.rows)]
+    for mode in ("legacy", "themed"):
+        run(mode, rows, args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import json
+import zlib
+
+from changes import (
+    CUSTOMER_ADDED, CUSTOMER_RENAMED, CUSTOMER_DELETED, TRANSACTION_ADDED, TRANSACTION_DELETED, LEDGER_CHANGED,
+    Change
+)
+
+# Operation codes stored in the journal (one small integer per entry)
+OP_ADD_CUSTOMER = 1
+OP_RENAME_CUSTOMER = 2
+OP_DELETE_CUSTOMER = 3
+OP_ADD_TRANSACTION = 4
+OP_DELETE_TRANSACTION = 5
+OP_ADD_TRANSACTIONS = 6
+
+# Bounds for the journal: oldest entries are pruned past either limit
+MAX_ENTRIES = 200
+MAX_BYTES = 8 * 1024 * 1024
+
+# Payloads larger than this are zlib-compressed (bulk deletes mostly)
+COMPRESS_THRESHOLD = 256
+
+# Undoing a bulk posting: its rows are one contiguous id range
+DELETE_RANGE_QUERY = "DELETE FROM transactions WHERE id BETWEEN ? AND ?"
+
+
+def _pack(payload):
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def _unpack(blob):
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(raw.decode("utf-8"))
+
+
+class UndoJournal:
+    """Append-only journal of ledger mutations used for undo/redo.
+
+    Every entry keeps just enough to replay the operation in both
+    directions, so undo and redo are single targeted statements.
+    Recording does not commit: the caller commits together with the
+    mutation itself so both land in the same transaction, through
+    commit() (or rollback()) here.
+
+    Every recorded, undone or redone operation is also published to
+    `changes` (a ChangeBus) once it is committed, and delivered once the
+    caller's handler has returned.
+    """
+
+    def __init__(self, conn, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, changes=None):
+        self.conn = conn
+        self.changes = changes
+        # Operations recorded in the caller's open transaction, published by commit()
+        self._uncommitted = []
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS undo_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op INTEGER NOT NULL,
+                undone INTEGER NOT NULL DEFAULT 0,
+                payload BLOB NOT NULL
+            )
+        """)
+        conn.commit()
+        # Ledgers with sync enabled carry a global id per row, which an undo must restore
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(transactions)")}
+        self.gid = ", gid" if "gid" in columns else ""
+
+    # -- recording ---------------------------------------------------------
+
+    def record_add_customer(self, cid, name):
+        self._record(OP_ADD_CUSTOMER, [cid, name])
+
+    def record_rename_customer(self, cid, old_name, new_name):
+        self._record(OP_RENAME_CUSTOMER, [cid, old_name, new_name])
+
+    def record_delete_customer(self, cid):
+        # Must be called before the rows are deleted
+        c = self.conn.cursor()
+        r = c.execute(f"SELECT id, name{self.gid} FROM customers WHERE id = ?", (cid,)).fetchone()
+        if not r:
+            return
+        rows = c.execute(
+            f"SELECT id, date, description, amount, kind{self.gid} FROM transactions WHERE customer_id = ?",
+            (cid,)
+        ).fetchall()
+        self._record(OP_DELETE_CUSTOMER, [list(r), [list(row) for row in rows]])
+
+    def record_add_transaction(self, tid):
+        row = self._transaction_row(tid)
+        if row:
+            self._record(OP_ADD_TRANSACTION, row)
+
+    def record_delete_transaction(self, tid):
+        # Must be called before the row is deleted
+        row = self._transaction_row(tid)
+        if row:
+            self._record(OP_DELETE_TRANSACTION, row)
+
+    def record_add_transactions(self, first_id, last_id):
+        # A bulk posting: the contiguous id range inserted by one statement
+        rows = self.conn.execute(
+            f"SELECT id, customer_id, date, description, amount, kind{self.gid} FROM transactions "
+            f"WHERE id BETWEEN ? AND ? ORDER BY id",
+            (first_id, last_id)
+        ).fetchall()
+        if rows:
+            self._record(OP_ADD_TRANSACTIONS, [list(row) for row in rows])
+
+    def _transaction_row(self, tid):
+        r = self.conn.execute(
+            f"SELECT id, customer_id, date, description, amount, kind{self.gid} FROM transactions WHERE id = ?",
+            (tid,)
+        ).fetchone()
+        return list(r) if r else None
+
+    def _record(self, op, payload):
+        c = self.conn.cursor()
+        # A new operation invalidates whatever could have been redone
+        c.execute("DELETE FROM undo_journal WHERE undone = 1")
+        c.execute("INSERT INTO undo_journal (op, payload) VALUES (?, ?)", (op, _pack(payload)))
+        self._prune(c)
+        self._uncommitted.append((op, payload))
+
+    def commit(self):
+        """Commit the caller's transaction, then publish what was recorded in it."""
+        self.conn.commit()
+        recorded, self._uncommitted = self._uncommitted, []
+        for op, payload in recorded:
+            self._publish(op, payload, inverse=False)
+
+    def rollback(self):
+        self.conn.rollback()
+        self._uncommitted = []
+
+    def _publish(self, op, payload, inverse):
+        if self.changes is None:
+            return
+        for change in _changes(op, payload, inverse):
+            self.changes.publish(change)
+
+    def _prune(self, c):
+        c.execute("""
+            DELETE FROM undo_journal WHERE id <= (
+                SELECT id FROM undo_journal ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        total = c.execute("SELECT IFNULL(SUM(LENGTH(payload)), 0) FROM undo_journal").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop oldest entries until the journal fits again, always keeping the newest
+        for jid, size in c.execute(
+                "SELECT id, LENGTH(payload) FROM undo_journal ORDER BY id ASC").fetchall()[:-1]:
+            c.execute("DELETE FROM undo_journal WHERE id = ?", (jid,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # -- undo / redo -------------------------------------------------------
+
+    def can_undo(self):
+        return self.conn.execute(
+            "SELECT 1 FROM undo_journal WHERE undone = 0 LIMIT 1").fetchone() is not None
+
+    def can_redo(self):
+        return self.conn.execute(
+            "SELECT 1 FROM undo_journal WHERE undone = 1 LIMIT 1").fetchone() is not None
+
+    def undo(self):
+        """Revert the newest operation. Returns (op, customer_id) or None.
+
+        customer_id is None when the operation touched many customers.
+        """
+        r = self.conn.execute(
+            "SELECT id, op, payload FROM undo_journal WHERE undone = 0 ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if not r:
+            return None
+        jid, op, payload = r
+        payload = _unpack(payload)
+        c = self.conn.cursor()
+        try:
+            cid = self._apply(c, op, payload, inverse=True)
+            c.execute("UPDATE undo_journal SET undone = 1 WHERE id = ?", (jid,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._publish(op, payload, inverse=True)
+        return op, cid
+
+    def redo(self):
+        """Re-apply the oldest undone operation. Returns (op, customer_id) or None."""
+        r = self.conn.execute(
+            "SELECT id, op, payload FROM undo_journal WHERE undone = 1 ORDER BY id ASC LIMIT 1"
+        ).fetchone()
+        if not r:
+            return None
+        jid, op, payload = r
+        payload = _unpack(payload)
+        c = self.conn.cursor()
+        try:
+            cid = self._apply(c, op, payload, inverse=False)
+            c.execute("UPDATE undo_journal SET undone = 0 WHERE id = ?", (jid,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._publish(op, payload, inverse=False)
+        return op, cid
+
+    def _apply(self, c, op, payload, inverse):
+        if op == OP_ADD_CUSTOMER:
+            cid, name = payload
+            if inverse:
+                c.execute("DELETE FROM customers WHERE id = ?", (cid,))
+            else:
+                c.execute("INSERT INTO customers (id, name) VALUES (?, ?)", (cid, name))
+            return cid
+
+        if op == OP_RENAME_CUSTOMER:
+            cid, old_name, new_name = payload
+            c.execute("UPDATE customers SET name = ? WHERE id = ?",
+                      (old_name if inverse else new_name, cid))
+            return cid
+
+        if op == OP_DELETE_CUSTOMER:
+            customer, rows = _deleted_customer(payload)
+            cid = customer[0]
+            if inverse:
+                c.execute(self._insert_sql("customers", ["id", "name"], len(customer)), customer)
+                if rows:
+                    c.executemany(
+                        self._insert_sql("transactions", ["id", "customer_id", "date", "description",
+                                                          "amount", "kind"], len(rows[0]) + 1),
+                        ([row[0], cid] + row[1:] for row in rows)
+                    )
+            else:
+                c.execute("DELETE FROM transactions WHERE customer_id = ?", (cid,))
+                c.execute("DELETE FROM customers WHERE id = ?", (cid,))
+            return cid
+
+        if op in (OP_ADD_TRANSACTION, OP_DELETE_TRANSACTION):
+            tid, cid = payload[0], payload[1]
+            # Undoing an add and redoing a delete both remove the row
+            if inverse == (op == OP_ADD_TRANSACTION):
+                c.execute("DELETE FROM transactions WHERE id = ?", (tid,))
+            else:
+                c.execute(self._insert_sql("transactions", ["id", "customer_id", "date", "description",
+                                                            "amount", "kind"], len(payload)), payload)
+            return cid
+
+        if op == OP_ADD_TRANSACTIONS:
+            # Ids are never reused (AUTOINCREMENT), so the range holds only these rows
+            if inverse:
+                c.execute(DELETE_RANGE_QUERY, (payload[0][0], payload[-1][0]))
+            else:
+                c.executemany(self._insert_sql("transactions", ["id", "customer_id", "date", "description",
+                                                                "amount", "kind"], len(payload[0])), payload)
+            return None
+
+        raise ValueError(f"unknown journal op {op}")
+
+    @staticmethod
+    def _insert_sql(table, columns, width):
+        # A trailing extra value is the row's sync gid
+        if width > len(columns):
+            columns = columns + ["gid"]
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _deleted_customer(payload):
+    # ([id, name(, gid)], rows); journals written before sync stored [id, name, rows]
+    if len(payload) == 3:
+        cid, name, rows = payload
+        return [cid, name], rows
+    return payload
+
+
+def _changes(op, payload, inverse):
+    # What an operation changed, applied forward or reverted
+    if op == OP_ADD_CUSTOMER:
+        return [Change(CUSTOMER_DELETED if inverse else CUSTOMER_ADDED, payload[0])]
+    if op == OP_RENAME_CUSTOMER:
+        return [Change(CUSTOMER_RENAMED, payload[0])]
+    if op == OP_DELETE_CUSTOMER:
+        return [Change(CUSTOMER_ADDED if inverse else CUSTOMER_DELETED, _deleted_customer(payload)[0][0])]
+    if op in (OP_ADD_TRANSACTION, OP_DELETE_TRANSACTION):
+        removed = inverse == (op == OP_ADD_TRANSACTION)
+        return [Change(TRANSACTION_DELETED if removed else TRANSACTION_ADDED, payload[1])]
+    if op == OP_ADD_TRANSACTIONS:
+        return [Change(LEDGER_CHANGED)]
+    return []
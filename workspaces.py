@@ -0,0 +1,212 @@
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from ledger import APP_DIR, DB_PATH, ValidationError, init_db
+
+# The list of ledgers (one per branch) and the folder new ones are created in
+WORKSPACES_PATH = APP_DIR / "workspaces.json"
+LEDGERS_DIR = APP_DIR / "ledgers"
+DEFAULT_LEDGER_NAME = "الدفتر الرئيسي"
+
+# Per-ledger balances of the customers who owe something, rounded to cents to drop float noise,
+# collected in one temp table of the report connection
+DEBTORS_TABLE = "CREATE TEMP TABLE debtors (ledger INTEGER, customer_id INTEGER, total REAL)"
+DEBTORS_QUERY = """
+    SELECT {i}, customer_id, SUM(amount) FROM l{i}.transactions
+    GROUP BY customer_id HAVING ROUND(SUM(amount), 2) > 0
+"""
+# The largest debtors of one ledger, named from that ledger's customers
+_TOP_DEBTORS = """
+    SELECT d.ledger, c.name, d.total FROM (
+        SELECT ledger, customer_id, total FROM temp.debtors WHERE ledger = {i} ORDER BY total DESC LIMIT ?
+    ) AS d
+    JOIN l{i}.customers AS c ON c.id = d.customer_id
+"""
+_SUMMARY = "SELECT ledger, COUNT(*), TOTAL(total) FROM temp.debtors GROUP BY ledger"
+
+
+def load_workspaces(path=WORKSPACES_PATH):
+    """{"active": path, "ledgers": [{"name": ..., "path": ...}]}; the default ledger comes first."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            ws = json.load(f)
+    except (OSError, ValueError):
+        ws = {}
+    ledgers = [l for l in ws.get("ledgers", []) if l.get("name") and l.get("path")]
+    if not ledgers:
+        ledgers = [{"name": DEFAULT_LEDGER_NAME, "path": str(DB_PATH)}]
+    active = ws.get("active")
+    if active not in {l["path"] for l in ledgers}:
+        active = ledgers[0]["path"]
+    return {"active": active, "ledgers": ledgers}
+
+
+def save_workspaces(ws, path=WORKSPACES_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(ws, f, ensure_ascii=False, indent=2)
+
+
+def ledger_name(ws, db_path):
+    for ledger in ws["ledgers"]:
+        if ledger["path"] == str(db_path):
+            return ledger["name"]
+    return Path(db_path).stem
+
+
+def add_ledger(ws, name, db_path):
+    # Registers an existing ledger file; returns its path as stored
+    db_path = str(Path(db_path).resolve())
+    if not any(l["path"] == db_path for l in ws["ledgers"]):
+        ws["ledgers"].append({"name": _unique_name(ws, name), "path": db_path})
+    return db_path
+
+
+def create_ledger(ws, name, folder=LEDGERS_DIR):
+    """Create an empty ledger file for a new branch and register it."""
+    name = name.strip()
+    if not name:
+        raise ValidationError("اسم الدفتر لا يمكن أن يكون فارغاً")
+    if any(l["name"] == name for l in ws["ledgers"]):
+        raise ValidationError("يوجد دفتر بهذا الاسم بالفعل", critical=True)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    stem = re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("._") or "ledger"
+    db_path, n = folder / f"{stem}.db", 1
+    while db_path.exists():
+        n += 1
+        db_path = folder / f"{stem}_{n}.db"
+    init_db(db_path).close()
+    ws["ledgers"].append({"name": name, "path": str(db_path)})
+    return str(db_path)
+
+
+def _unique_name(ws, name):
+    names = {l["name"] for l in ws["ledgers"]}
+    candidate, n = name, 1
+    while candidate in names:
+        n += 1
+        candidate = f"{name} ({n})"
+    return candidate
+
+
+class ConsolidatedReport:
+    # Receivables across ledgers: per-ledger (name, debtors, receivables) rows,
+    # the overall figures and the largest debtors as (ledger name, customer name, balance)
+    __slots__ = ("ledgers", "debtors", "receivables", "top", "missing")
+
+    def __init__(self, ledgers, top, missing):
+        self.ledgers = ledgers
+        self.debtors = sum(r[1] for r in ledgers)
+        self.receivables = sum(r[2] for r in ledgers)
+        self.top = top
+        self.missing = missing
+
+
+def consolidated_report(ledgers, top=20):
+    """Total receivables and top debtors across ledger files.
+
+    The files are ATTACHed read-only to one in-memory connection, so each
+    figure is one aggregate query over all branches. SQLite caps the number
+    of attached files, so larger workspaces are read in groups of that size.
+    """
+    present = [l for l in ledgers if Path(l["path"]).exists()]
+    missing = [l["name"] for l in ledgers if not Path(l["path"]).exists()]
+    per_ledger = {i: (l["name"], 0, 0.0) for i, l in enumerate(present)}
+    top_rows = []
+    # Autocommit, so nothing holds the attached files once a query is done
+    conn = sqlite3.connect("file::memory:", uri=True, isolation_level=None)
+    try:
+        # Every transaction is aggregated once; the summary and the top debtors read the result
+        conn.execute(DEBTORS_TABLE)
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        for start in range(0, len(present), limit):
+            group = range(start, min(start + limit, len(present)))
+            for i in group:
+                conn.execute(f"ATTACH DATABASE ? AS l{i}", (Path(present[i]["path"]).resolve().as_uri() + "?mode=ro",))
+            try:
+                conn.execute("INSERT INTO temp.debtors " + " UNION ALL ".join(DEBTORS_QUERY.format(i=i) for i in group))
+                top_rows += conn.execute(
+                    "SELECT * FROM (" + " UNION ALL ".join(_TOP_DEBTORS.format(i=i) for i in group) + ") "
+                    "ORDER BY total DESC LIMIT ?",
+                    [top] * (len(group) + 1)
+                ).fetchall()
+            finally:
+                for i in group:
+                    conn.execute(f"DETACH DATABASE l{i}")
+        for i, count, total in conn.execute(_SUMMARY):
+            per_ledger[i] = (present[i]["name"], count, total)
+    finally:
+        conn.close()
+    top_rows.sort(key=lambda r: r[2], reverse=True)
+    return ConsolidatedReport(
+        [per_ledger[i] for i in range(len(present))],
+        [(present[i]["name"], name, total) for i, name, total in top_rows[:top]],
+        missing,
+    )
+
+
+def _bench(branches=4, customers=25_000, transactions=250_000):
+    import random
+    import tempfile
+    from ledger import CUSTOMERS_BATCH_QUERY
+
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        ws = {"active": None, "ledgers": []}
+        print(f"seeding {branches} ledgers of {customers:,} customers / {transactions:,} transactions ...")
+        for b in range(branches):
+            conn = init_db(create_ledger(ws, f"فرع {b + 1}", tmp))
+            conn.executemany("INSERT INTO customers (name) VALUES (?)", ((f"زبون {i}",) for i in range(customers)))
+            conn.executemany(
+                "INSERT INTO transactions (customer_id, date, description, amount, kind) VALUES (?, ?, ?, ?, ?)",
+                ((rng.randint(1, customers), "2024-01-01", "بضاعة", rng.choice((1, -1)) * rng.randint(1, 50000) / 100,
+                  "شراء") for _ in range(transactions))
+            )
+            conn.commit()
+            conn.close()
+
+        start = time.perf_counter()
+        report = consolidated_report(ws["ledgers"])
+        print(f"consolidated report  {(time.perf_counter() - start) * 1000:8.1f} ms  "
+              f"{report.debtors:,} debtors, {report.receivables:,.2f}")
+
+        # What a switch costs outside the GUI: open the file and read the first page of customers
+        conn = None
+        for ledger in ws["ledgers"] * 2:
+            start = time.perf_counter()
+            new = init_db(ledger["path"])
+            new.execute(CUSTOMERS_BATCH_QUERY, (sys.maxsize, 500)).fetchall()
+            if conn is not None:
+                conn.close()
+            conn = new
+            print(f"switch to {ledger['name']:<10} {(time.perf_counter() - start) * 1000:8.1f} ms")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ledger workspaces and consolidated receivables")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--bench", action="store_true", help="time the report and switching on seeded ledgers")
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench()
+        return
+    ws = load_workspaces()
+    report = consolidated_report(ws["ledgers"], args.top)
+    for name, debtors, receivables in report.ledgers:
+        print(f"{name:<24}{debtors:>8,} debtors {receivables:>16,.2f}")
+    print(f"{'total':<24}{report.debtors:>8,} debtors {report.receivables:>16,.2f}")
+    for name in report.missing:
+        print(f"missing: {name}")
+    for ledger, name, total in report.top:
+        print(f"  {total:>14,.2f}  {name} ({ledger})")
+
+
+if __name__ == "__main__":
+    main()